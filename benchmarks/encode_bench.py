@@ -0,0 +1,46 @@
+"""Throughput of encoding batches of recorded spans, and of re-assembling
+already encoded span frames (what a retried flush costs).
+"""
+from __future__ import absolute_import
+
+from zipkin_ot.thrift import (frames_in_list_bytes, span_frame,
+                              thrift_obj_in_bytes, to_thrift_spans)
+
+from . import harness
+
+SUITE = 'encode'
+
+
+def run(quick=False):
+    batch_sizes = [1, 10, 100, 1000] if quick else [1, 10, 100, 1000, 10000]
+    for batch_size in batch_sizes:
+        rec = harness.create_recorder()
+        for i in range(batch_size):
+            rec.record_span(harness.create_span(rec, i, tags=5, logs=2))
+        spans = to_thrift_spans(rec._span_records)
+        body = thrift_obj_in_bytes(spans)
+        iterations = max(1, (1000 if quick else 10000) // batch_size)
+
+        seconds = harness.measure(
+            lambda: thrift_obj_in_bytes(spans), iterations)
+        yield harness.result(
+            SUITE, 'thrift_obj_in_bytes', {'batch_size': batch_size},
+            iterations, seconds,
+            spans_per_sec=batch_size * iterations / seconds,
+            bytes_per_batch=len(body))
+
+        records = rec._span_records
+        seconds = harness.measure(
+            lambda: [span_frame(r) for r in records], iterations)
+        yield harness.result(
+            SUITE, 'span_frame', {'batch_size': batch_size},
+            iterations, seconds,
+            spans_per_sec=batch_size * iterations / seconds)
+
+        frames = [span_frame(r) for r in records]
+        seconds = harness.measure(
+            lambda: frames_in_list_bytes(frames), iterations)
+        yield harness.result(
+            SUITE, 'frames_in_list_bytes', {'batch_size': batch_size},
+            iterations, seconds,
+            spans_per_sec=batch_size * iterations / seconds)
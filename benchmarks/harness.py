@@ -0,0 +1,81 @@
+"""
+Timing helpers shared by the benchmark suites.
+
+Every measurement is reported as a dict so that runs can be dumped as JSON
+and compared between versions (see benchmarks/run.py).
+"""
+from __future__ import absolute_import
+
+import gc
+import time
+
+from basictracer.context import SpanContext
+from basictracer.span import BasicSpan
+
+from zipkin_ot import recorder, tracer
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def result(suite, name, params, iterations, seconds, **extra):
+    """Builds one machine-readable benchmark result."""
+    entry = {
+        'suite': suite,
+        'name': name,
+        'params': params,
+        'iterations': iterations,
+        'seconds': seconds,
+        'seconds_per_op': seconds / iterations,
+        'ops_per_sec': iterations / seconds if seconds else float('inf'),
+    }
+    entry.update(extra)
+    return entry
+
+
+def measure(fn, iterations, repeat=3, setup=None):
+    """Returns the best wall time, in seconds, of running fn() `iterations`
+    times, over `repeat` rounds. setup(), if given, runs untimed before each
+    round. The garbage collector is disabled while timing.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = clock()
+            for _ in range(iterations):
+                fn()
+            elapsed = clock() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def create_recorder(**kwargs):
+    args = {
+        'service_name': 'benchmarks',
+        'periodic_flush_seconds': 0,
+        'max_span_records': 1 << 30,
+    }
+    args.update(kwargs)
+    return recorder.Recorder(**args)
+
+
+def create_span(rec, i, tags=0, logs=0):
+    """Builds a finished BasicSpan with the given number of tags and logs."""
+    span = BasicSpan(
+        tracer._OpenZipkinTracer(rec),
+        operation_name='benchmark/%d' % i,
+        context=SpanContext(trace_id=1000 + i, span_id=2000 + i),
+        start_time=time.time())
+    for t in range(tags):
+        span.tags['tag.%d' % t] = 'value %d' % t
+    for l in range(logs):
+        span.log_event('event %d' % l, {'index': l})
+    span.duration = 0.001
+    return span
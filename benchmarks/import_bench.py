@@ -0,0 +1,58 @@
+"""Wall time of `import zipkin_ot` in a fresh interpreter.
+
+On interpreters supporting `-X importtime` (3.7+) the cumulative import time
+of zipkin_ot as reported there is included as well.
+"""
+from __future__ import absolute_import
+
+import re
+import subprocess
+import sys
+
+from . import harness
+
+SUITE = 'import'
+
+HEAVY_MODULES = ('thriftpy', 'requests')
+
+_probe = (
+    'import time\n'
+    'start = time.time()\n'
+    'import zipkin_ot\n'
+    'elapsed = time.time() - start\n'
+    'import sys\n'
+    'print(repr((elapsed, [m for m in %r if m in sys.modules])))\n'
+) % (HEAVY_MODULES,)
+
+
+def run(quick=False):
+    rounds = 5 if quick else 20
+    timings = []
+    heavy = []
+    for _ in range(rounds):
+        output = subprocess.check_output([sys.executable, '-c', _probe])
+        elapsed, heavy = eval(output.strip())
+        timings.append(elapsed)
+    timings.sort()
+    yield harness.result(
+        SUITE, 'import_zipkin_ot', {}, 1, timings[len(timings) // 2],
+        rounds=rounds, heavy_modules_loaded=heavy)
+
+    if sys.version_info >= (3, 7):
+        yield _importtime(rounds)
+
+
+def _importtime(rounds):
+    cumulative = []
+    for _ in range(rounds):
+        stderr = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', 'import zipkin_ot'],
+            stderr=subprocess.PIPE).communicate()[1].decode('utf-8')
+        match = re.search(
+            r'^import time:\s+\d+ \|\s+(\d+) \|\s*zipkin_ot$', stderr,
+            re.MULTILINE)
+        cumulative.append(int(match.group(1)) / 1e6)
+    cumulative.sort()
+    return harness.result(
+        SUITE, 'importtime_zipkin_ot', {}, 1,
+        cumulative[len(cumulative) // 2], rounds=rounds)
@@ -0,0 +1,34 @@
+"""Cost of injecting and extracting a SpanContext."""
+from __future__ import absolute_import
+
+from zipkin_ot.context import SpanContext
+from zipkin_ot.zipkin_propagator import ZipkinBinaryPropagator
+from zipkin_ot.zipkin_propagator import ZipkinPropagator
+
+from . import harness
+
+SUITE = 'propagator'
+
+
+def run(quick=False):
+    iterations = 2000 if quick else 50000
+    span_context = SpanContext(
+        trace_id=0xb6dbb1c2b362bf51, span_id=0x17133d482ba4f605,
+        sampled=True)
+    propagators = [
+        ('ZipkinPropagator', ZipkinPropagator(), dict),
+        ('ZipkinBinaryPropagator', ZipkinBinaryPropagator(), bytearray),
+    ]
+    for name, propagator, carrier_type in propagators:
+        params = {'propagator': name}
+
+        seconds = harness.measure(
+            lambda: propagator.inject(span_context, carrier_type()),
+            iterations)
+        yield harness.result(SUITE, 'inject', params, iterations, seconds)
+
+        carrier = carrier_type()
+        propagator.inject(span_context, carrier)
+        seconds = harness.measure(
+            lambda: propagator.extract(carrier), iterations)
+        yield harness.result(SUITE, 'extract', params, iterations, seconds)
@@ -0,0 +1,55 @@
+"""Cost of Recorder.record_span per span, across tag and log counts, and of
+Recorder.record_spans.
+"""
+from __future__ import absolute_import
+
+from . import harness
+
+SUITE = 'record_span'
+
+
+def run(quick=False):
+    iterations = 200 if quick else 2000
+    shapes = [(0, 0), (5, 0), (0, 5), (10, 10), (50, 50)]
+    for tags, logs in shapes:
+        yield _record_span(iterations, tags, logs)
+    # Per-stage profiling of every span, to budget the profiler itself.
+    yield _record_span(iterations, 5, 5, profile_sample_rate=1.0)
+    yield _record_spans(iterations, 5, 5)
+
+
+def _record_span(iterations, tags, logs, profile_sample_rate=None):
+    rec = harness.create_recorder()
+    params = {'tags': tags, 'logs': logs}
+    if profile_sample_rate is not None:
+        rec.enable_profiling(profile_sample_rate)
+        params['profile_sample_rate'] = profile_sample_rate
+    spans = [harness.create_span(rec, i, tags, logs)
+             for i in range(iterations)]
+    it = [iter(spans)]
+
+    def setup():
+        rec._span_records = []
+        it[0] = iter(spans)
+
+    def record():
+        rec.record_span(next(it[0]))
+
+    seconds = harness.measure(record, iterations, setup=setup)
+    return harness.result(
+        SUITE, 'record_span', params, iterations, seconds)
+
+
+def _record_spans(iterations, tags, logs):
+    rec = harness.create_recorder()
+    spans = [harness.create_span(rec, i, tags, logs)
+             for i in range(iterations)]
+
+    def setup():
+        rec._span_records = []
+
+    seconds = harness.measure(lambda: rec.record_spans(spans), 1,
+                              setup=setup)
+    return harness.result(
+        SUITE, 'record_spans', {'tags': tags, 'logs': logs}, iterations,
+        seconds)
@@ -0,0 +1,115 @@
+"""
+Runs the benchmark suites and writes the results as JSON.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare baseline.json --threshold 0.2
+
+With --compare, every result is matched against the baseline by suite, name
+and params; the exit status is 1 if any of them got slower per op by more
+than --threshold.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import platform
+import sys
+import time
+import warnings
+
+from . import encode_bench
+from . import import_bench
+from . import propagator_bench
+from . import recorder_bench
+from . import scope_bench
+from . import throughput_bench
+from . import wsgi_bench
+
+SUITES = [
+    import_bench,
+    recorder_bench,
+    encode_bench,
+    propagator_bench,
+    scope_bench,
+    throughput_bench,
+    wsgi_bench,
+]
+
+
+def run_suites(names=None, quick=False):
+    results = []
+    for suite in SUITES:
+        if names and suite.SUITE not in names:
+            continue
+        for entry in suite.run(quick=quick):
+            print('%-12s %-24s %-40s %12.2f ops/s' % (
+                entry['suite'], entry['name'],
+                json.dumps(entry['params'], sort_keys=True),
+                entry['ops_per_sec']), file=sys.stderr)
+            results.append(entry)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+
+def result_key(entry):
+    return (entry['suite'], entry['name'],
+            json.dumps(entry['params'], sort_keys=True))
+
+
+def compare(baseline, current, threshold):
+    """Returns the (key, baseline, current, ratio) of every result whose
+    seconds_per_op grew by more than `threshold` over the baseline.
+    """
+    previous = dict((result_key(e), e) for e in baseline['results'])
+    regressions = []
+    for entry in current['results']:
+        old = previous.get(result_key(entry))
+        if old is None:
+            continue
+        ratio = entry['seconds_per_op'] / old['seconds_per_op']
+        if ratio > 1 + threshold:
+            regressions.append((result_key(entry), old['seconds_per_op'],
+                                entry['seconds_per_op'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--suite', action='append', dest='suites',
+                        help='only run this suite (repeatable)')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer iterations, for smoke testing')
+    parser.add_argument('--compare', help='baseline JSON results to compare to')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown ratio before failing')
+    args = parser.parse_args(argv)
+    # Recorders built with periodic_flush_seconds=0 warn on construction.
+    warnings.simplefilter('ignore')
+
+    current = run_suites(args.suites, args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for key, old, new, ratio in regressions:
+            print('REGRESSION %s: %.3gs -> %.3gs per op (x%.2f)' % (
+                ' '.join(key), old, new, ratio), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Cost of activating spans, and of starting deeply nested active spans."""
+from __future__ import absolute_import
+
+from basictracer.recorder import SpanRecorder
+
+from zipkin_ot import scope_manager, tracer
+
+from . import harness
+
+SUITE = 'scope'
+
+
+class _NoopRecorder(SpanRecorder):
+
+    def record_span(self, span):
+        pass
+
+
+def _managers():
+    yield 'ThreadLocalScopeManager', scope_manager.ThreadLocalScopeManager
+    if scope_manager.contextvars is not None:
+        yield 'ContextVarsScopeManager', scope_manager.ContextVarsScopeManager
+
+
+def run(quick=False):
+    iterations = 2000 if quick else 50000
+    for name, manager_class in _managers():
+        manager = manager_class()
+        zipkin_tracer = tracer._OpenZipkinTracer(_NoopRecorder(), manager)
+        span = zipkin_tracer.start_span('activated')
+
+        def activate_close():
+            manager.activate(span).close()
+
+        seconds = harness.measure(activate_close, iterations)
+        yield harness.result(
+            SUITE, 'activate_close', {'scope_manager': name},
+            iterations, seconds)
+
+        for depth in (10, 100, 1000):
+            rounds = max(1, iterations // depth // 10)
+            seconds = harness.measure(
+                lambda: _nested(zipkin_tracer, depth), rounds)
+            yield harness.result(
+                SUITE, 'nested_active_spans',
+                {'scope_manager': name, 'depth': depth},
+                rounds * depth, seconds)
+
+
+def _nested(zipkin_tracer, depth):
+    scopes = []
+    for _ in range(depth):
+        scopes.append(zipkin_tracer.start_active_span('nested'))
+    for scope in reversed(scopes):
+        scope.close()
@@ -0,0 +1,58 @@
+"""End-to-end spans/sec: threads start and finish spans through a Tracer
+while a flusher thread reports them to a mock connection.
+"""
+from __future__ import absolute_import
+
+import threading
+
+from zipkin_ot import tracer
+
+from tests.support import MockConnection
+
+from . import harness
+
+SUITE = 'throughput'
+
+
+def run(quick=False):
+    spans_total = 2000 if quick else 20000
+    for threads in (1, 2, 4, 8, 16, 32, 64):
+        yield _run_threads(threads, spans_total)
+
+
+def _run_threads(threads, spans_total):
+    rec = harness.create_recorder()
+    zipkin_tracer = tracer._OpenZipkinTracer(rec)
+    connection = MockConnection(keep_bodies=False)
+    per_thread = spans_total // threads
+    done = threading.Event()
+
+    def work():
+        for i in range(per_thread):
+            with zipkin_tracer.start_span('throughput') as span:
+                span.set_tag('index', i)
+
+    def flush():
+        while not done.is_set():
+            rec.flush(connection)
+            done.wait(0.01)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    flusher = threading.Thread(target=flush)
+    start = harness.clock()
+    flusher.start()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    done.set()
+    flusher.join()
+    rec.flush(connection)
+    seconds = harness.clock() - start
+
+    sent = rec.metrics.spans_sent.value()
+    return harness.result(
+        SUITE, 'spans_per_sec', {'threads': threads},
+        per_thread * threads, seconds,
+        spans_sent=sent, reports=connection.posts,
+        bytes_sent=connection.bytes)
@@ -0,0 +1,84 @@
+"""Per-request overhead of zipkin_ot.wsgi.ZipkinMiddleware over a bare WSGI
+application, for sampled and unsampled requests.
+"""
+from __future__ import absolute_import
+
+from basictracer.recorder import Sampler
+
+from zipkin_ot import tracer
+from zipkin_ot.wsgi import ZipkinMiddleware
+
+from . import harness
+
+SUITE = 'wsgi'
+
+_BODY = [b'hello']
+_HEADERS = [('Content-Type', 'text/plain')]
+_CALLER = {
+    'HTTP_X_B3_TRACEID': '463ac35c9f6413ad',
+    'HTTP_X_B3_SPANID': 'a2fb4a1d1a96d312',
+}
+
+
+class _NeverSampler(Sampler):
+
+    def sampled(self, trace_id):
+        return False
+
+
+def _app(environ, start_response):
+    start_response('200 OK', _HEADERS)
+    return _BODY
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+def _environ(**headers):
+    environ = {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '',
+               'PATH_INFO': '/items', 'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80', 'wsgi.url_scheme': 'http'}
+    environ.update(headers)
+    return environ
+
+
+def _serve(app, environ):
+    """Calls app as a WSGI server would."""
+    def request():
+        response = app(environ, _start_response)
+        for _ in response:
+            pass
+        close = getattr(response, 'close', None)
+        if close is not None:
+            close()
+    return request
+
+
+def run(quick=False):
+    iterations = 2000 if quick else 50000
+    bare = harness.measure(_serve(_app, _environ()), iterations)
+    yield harness.result(SUITE, 'request', {'middleware': False},
+                         iterations, bare)
+
+    cases = [
+        ('root', _environ(), None),
+        ('caller_sampled', _environ(HTTP_X_B3_SAMPLED='1', **_CALLER), None),
+        ('root_unsampled', _environ(), _NeverSampler()),
+        ('caller_unsampled', _environ(HTTP_X_B3_SAMPLED='0', **_CALLER),
+         None),
+    ]
+    for name, environ, sampler in cases:
+        rec = harness.create_recorder()
+        middleware = ZipkinMiddleware(
+            _app, tracer._OpenZipkinTracer(rec, sampler=sampler))
+
+        def setup():
+            rec._span_records = []
+
+        seconds = harness.measure(_serve(middleware, environ), iterations,
+                                  setup=setup)
+        yield harness.result(
+            SUITE, 'request', {'middleware': True, 'request': name},
+            iterations, seconds,
+            overhead_per_request=(seconds - bare) / iterations)
@@ -19,9 +19,16 @@ setup(
     classifiers=[
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 2',
+        'Programming Language :: Python :: 3',
     ],
 
     keywords=[ 'opentracing', 'openzipkin', 'traceguide', 'tracing', 'microservices', 'distributed' ],
-    packages=find_packages(exclude=['docs*', 'tests*', 'sample*']),
+    packages=find_packages(exclude=['docs*', 'tests*', 'sample*', 'benchmarks*']),
     package_data={'': ['*.thrift']},
+    entry_points={
+        'console_scripts': [
+            'zipkin-ot-loadgen=zipkin_ot.loadgen:main',
+            'zipkin-ot-replay=zipkin_ot.replay:main',
+        ],
+    },
 )
@@ -0,0 +1,115 @@
+import unittest
+import warnings
+
+from basictracer.recorder import Sampler
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import constants
+from zipkin_ot.aggregation import REDAggregator
+
+
+class NeverSampler(Sampler):
+
+    def sampled(self, trace_id):
+        return False
+
+
+class REDAggregatorTest(unittest.TestCase):
+
+    def test_snapshot(self):
+        red = REDAggregator('svc', buckets=(0.1, 1.0))
+        red.observe('get', False, 0.05)
+        red.observe('get', False, 0.5)
+        red.observe('get', True, 2.0)
+        self.assertEqual(red.snapshot(), [
+            {'service': 'svc', 'operation': 'get', 'error': False,
+             'count': 2, 'sum': 0.55, 'buckets': [1, 1, 0]},
+            {'service': 'svc', 'operation': 'get', 'error': True,
+             'count': 1, 'sum': 2.0, 'buckets': [0, 0, 1]},
+        ])
+        self.assertEqual(red.quantile('get', 0.5), 0.1)
+        self.assertEqual(red.quantile('get', 1.0, error=True), float('inf'))
+        self.assertIsNone(red.quantile('put', 0.5))
+
+    def test_collect(self):
+        red = REDAggregator('svc', buckets=(1.0,))
+        red.observe('a', False, 0.5)
+        red.observe('b', False, 0.5)
+        self.assertEqual(len(red.collect()), 2)
+        self.assertEqual(red.collect(), [])
+        red.observe('a', False, 2.0)
+        series, = red.collect()
+        self.assertEqual((series['operation'], series['count'],
+                          series['sum'], series['buckets']),
+                         ('a', 1, 2.0, [0, 1]))
+
+    def test_max_series(self):
+        red = REDAggregator('svc', max_series=2)
+        for operation in ('a', 'b', 'c', 'd'):
+            red.observe(operation, False, 0.1)
+        operations = dict((s['operation'], s['count'])
+                          for s in red.snapshot())
+        self.assertEqual(
+            operations, {'a': 1, 'b': 1, constants.RED_OTHER_OPERATION: 2})
+
+    def test_exposition(self):
+        red = REDAggregator('my "svc"', buckets=(1.0,))
+        red.observe('get', True, 0.5)
+        text = red.exposition()
+        labels = 'service="my \\"svc\\"",operation="get",error="true"'
+        self.assertIn('# TYPE zipkin_ot_span_duration_seconds histogram',
+                      text)
+        self.assertIn('zipkin_ot_span_duration_seconds_bucket{%s,le="+Inf"} 1'
+                      % labels, text)
+        self.assertIn('zipkin_ot_span_duration_seconds_count{%s} 1' % labels,
+                      text)
+
+
+class RecorderREDTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+    def test_disabled_by_default(self):
+        recorder = zipkin_ot.recorder.Recorder(periodic_flush_seconds=0)
+        self.assertIsNone(recorder.red)
+        recorder.shutdown(flush=False)
+
+    def test_unsampled_spans_counted(self):
+        recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0, red_metrics=True)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(
+            recorder, sampler=NeverSampler())
+        for i in range(3):
+            tracer.start_span('get').finish()
+        span = tracer.start_span('get')
+        span.set_tag('error', True)
+        span.finish()
+        span = tracer.start_span('get')
+        span.set_tag('error', 'false')
+        span.finish()
+
+        self.assertEqual(len(recorder._span_records), 0)
+        counts = dict((s['error'], s['count'])
+                      for s in recorder.red.snapshot())
+        self.assertEqual(counts, {False: 4, True: 1})
+        recorder.shutdown(flush=False)
+
+    def test_handler(self):
+        reports = []
+        recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0,
+            red_handler=reports.append)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        tracer.start_span('get').finish()
+        recorder._report_red()
+        recorder._report_red()
+        tracer.start_span('get').finish()
+        recorder.shutdown(flush=False)
+        self.assertEqual([[s['count'] for s in series] for series in reports],
+                         [[1], [1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
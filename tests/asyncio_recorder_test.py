@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+
+try:
+    import asyncio
+    from zipkin_ot.asyncio_recorder import AsyncioRecorder, AsyncioTracer
+except (ImportError, SyntaxError):
+    asyncio = None
+
+import zipkin_ot.constants
+from zipkin_ot.mock_collector import MockCollector
+
+
+@unittest.skipIf(asyncio is None, 'requires Python 3.7+')
+class AsyncioRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.collector = MockCollector().start()
+        self.loop = asyncio.new_event_loop()
+        self.tracer = AsyncioTracer(
+            service_name='python/asyncio_recorder_test',
+            collector_host=self.collector.host,
+            collector_port=self.collector.port,
+            periodic_flush_seconds=0.05,
+            loop=self.loop)
+        self.recorder = self.tracer.recorder
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.recorder.shutdown(flush=False))
+        self.loop.close()
+        self.collector.stop()
+
+    def assertNoFlushThread(self):
+        self.assertIsNone(self.recorder._flush_thread)
+        self.assertNotIn(zipkin_ot.constants.FLUSH_THREAD_NAME,
+                         [t.name for t in threading.enumerate()])
+
+    def finish_spans(self, n):
+        for i in range(n):
+            self.tracer.start_span(str(i)).finish()
+
+    def test_flush(self):
+        self.finish_spans(10)
+        self.assertTrue(self.loop.run_until_complete(self.tracer.flush()))
+        self.assertEqual(self.collector.stats()['collector_spans_total'], 10)
+        self.assertNoFlushThread()
+
+    def test_periodic_flush(self):
+        self.loop.call_soon(self.finish_spans, 5)
+        self.loop.run_until_complete(asyncio.sleep(0.3))
+        self.assertEqual(self.collector.stats()['collector_spans_total'], 5)
+        self.assertEqual(self.recorder.metrics.flushes.value(), 1)
+        self.assertNoFlushThread()
+
+    def test_failed_flush_restores_spans(self):
+        self.collector.outage = True
+        self.finish_spans(3)
+        self.assertFalse(self.loop.run_until_complete(self.recorder.flush()))
+        self.assertEqual(len(self.recorder._span_records), 3)
+
+        self.collector.outage = False
+        self.assertTrue(self.loop.run_until_complete(self.recorder.shutdown()))
+        self.assertEqual(self.collector.stats()['collector_spans_total'], 3)
+        self.assertFalse(self.loop.run_until_complete(self.recorder.flush()))
+
+    def test_large_batch_uses_executor(self):
+        self.recorder._executor_threshold = 5
+        self.finish_spans(20)
+        self.assertTrue(self.loop.run_until_complete(self.recorder.flush()))
+        self.assertEqual(self.collector.stats()['collector_spans_total'], 20)
+
+    def test_shutdown_report(self):
+        self.finish_spans(10)
+        report = self.loop.run_until_complete(self.recorder.shutdown())
+        self.assertTrue(report)
+        self.assertEqual((report.sent, report.spooled, report.dropped),
+                         (10, 0, 0))
+        report = self.loop.run_until_complete(self.recorder.shutdown())
+        self.assertFalse(report.flushed)
+
+    def test_shutdown_deadline_and_spool(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        self.recorder._spool_dir = spool_dir
+        self.collector.latency = 1.0
+        self.finish_spans(4)
+        start = time.time()
+        report = self.loop.run_until_complete(
+            self.recorder.shutdown(timeout=0.2))
+        self.assertTrue(time.time() - start < 0.8)
+        self.assertEqual((report.sent, report.spooled, report.dropped),
+                         (0, 4, 0))
+        self.assertEqual(len(os.listdir(spool_dir)), 1)
+        self.assertEqual(self.recorder.metrics.spans_spooled.value(), 4)
+
+    def test_intake_stops_at_shutdown(self):
+        self.collector.outage = True
+        self.finish_spans(3)
+        shutdown = self.recorder.shutdown(timeout=0.5)
+        # Spans finished while the buffer is being sent are not recorded.
+        self.loop.call_soon(self.finish_spans, 2)
+        report = self.loop.run_until_complete(shutdown)
+        self.assertEqual((report.sent, report.dropped), (0, 3))
+        self.assertEqual(self.recorder._buffered_count(), 0)
+        self.assertEqual(
+            self.recorder.metrics.spans_shutdown_dropped.value(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import warnings
+
+from opentracing import Format
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot.baggage import EMPTY_BAGGAGE, Baggage, BaggageLimits
+from zipkin_ot.context import SpanContext
+from zipkin_ot.zipkin_propagator import (ZipkinBinaryPropagator,
+                                         ZipkinPropagator)
+
+
+class BaggageTest(unittest.TestCase):
+
+    def test_copy_on_write(self):
+        baggage = Baggage({'a': '1'})
+        self.assertEqual(baggage.nbytes, 2)
+        updated = baggage.with_item('b', '22')
+        self.assertEqual(baggage, {'a': '1'})
+        self.assertEqual(updated, {'a': '1', 'b': '22'})
+        self.assertEqual(updated.nbytes, 5)
+        self.assertEqual(updated.with_item('b', '').nbytes, 3)
+        with self.assertRaises(TypeError):
+            updated['c'] = '3'
+
+    def test_limits(self):
+        limits = BaggageLimits(max_items=2, max_bytes=10)
+        baggage = EMPTY_BAGGAGE.with_item('a', '1', limits)
+        baggage = baggage.with_item('b', '2', limits)
+        self.assertIs(baggage.with_item('c', '3', limits), baggage)
+        self.assertIs(baggage.with_item('a', 'x' * 9, limits), baggage)
+        self.assertEqual(baggage.with_item('a', 'x' * 7, limits).nbytes, 10)
+
+        bounded = limits.bound([('a', '1'), ('b', 'x' * 20), ('c', '3'),
+                                ('d', '4')])
+        self.assertEqual(bounded, {'a': '1', 'c': '3'})
+        self.assertIs(limits.apply(bounded), bounded)
+        self.assertEqual(limits.apply({'k': 'v' * 20}), {})
+
+
+class PropagatorLimitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limits = BaggageLimits(max_items=2, max_bytes=100)
+        self.context = SpanContext(
+            trace_id=1, span_id=2,
+            baggage={'a': '1', 'b': '2', 'c': '3'})
+
+    def test_text_round_trip(self):
+        propagator = ZipkinPropagator()
+        carrier = {}
+        propagator.inject(SpanContext(trace_id=1, span_id=2,
+                                      baggage={'user': 'bender'}), carrier)
+        self.assertEqual(carrier['ot-baggage-user'], 'bender')
+        carrier['OT-Baggage-Team'] = 'planet'
+        self.assertEqual(propagator.extract(carrier).baggage,
+                         {'user': 'bender', 'team': 'planet'})
+
+    def test_text_limits(self):
+        propagator = ZipkinPropagator(self.limits)
+        carrier = {}
+        propagator.inject(self.context, carrier)
+        self.assertEqual(
+            len([k for k in carrier if k.startswith('ot-baggage-')]), 2)
+
+        carrier = {'x-b3-traceid': '1', 'x-b3-spanid': '2',
+                   'x-b3-sampled': '1', 'ot-baggage-a': '1',
+                   'ot-baggage-b': '2', 'ot-baggage-c': '3'}
+        self.assertEqual(len(propagator.extract(carrier).baggage), 2)
+
+    def test_binary_limits(self):
+        carrier = bytearray()
+        ZipkinBinaryPropagator().inject(self.context, carrier)
+        extracted = ZipkinBinaryPropagator(self.limits).extract(carrier)
+        self.assertEqual(len(extracted.baggage), 2)
+
+        carrier = bytearray()
+        ZipkinBinaryPropagator(self.limits).inject(self.context, carrier)
+        extracted = ZipkinBinaryPropagator().extract(carrier)
+        self.assertEqual(len(extracted.baggage), 2)
+
+
+class TracerBaggageTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.tracer = zipkin_ot.tracer.Tracer(
+            periodic_flush_seconds=0, max_baggage_items=2,
+            max_baggage_bytes=100)
+
+    def tearDown(self):
+        self.tracer.recorder.shutdown(flush=False)
+
+    def test_children_share_baggage(self):
+        with self.tracer.start_span('root') as root:
+            root.set_baggage_item('user', 'bender')
+            child = self.tracer.start_span('child', child_of=root)
+            grandchild = self.tracer.start_span('grandchild', child_of=child)
+            self.assertIs(grandchild.context.baggage, root.context.baggage)
+
+            grandchild.set_baggage_item('team', 'planet')
+            self.assertEqual(grandchild.get_baggage_item('team'), 'planet')
+            self.assertIsNone(child.get_baggage_item('team'))
+            self.assertIs(child.context.baggage, root.context.baggage)
+
+            # Past max_baggage_items, items are dropped.
+            grandchild.set_baggage_item('ship', 'express')
+            self.assertIsNone(grandchild.get_baggage_item('ship'))
+
+    def test_inject_uses_limits(self):
+        span = self.tracer.start_span('root')
+        carrier = {}
+        self.tracer.inject(span.context, Format.HTTP_HEADERS, carrier)
+        carrier['ot-baggage-x'] = 'y' * 200
+        extracted = self.tracer.extract(Format.HTTP_HEADERS, carrier)
+        self.assertEqual(extracted.baggage, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import time
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot.clock import Clock
+from zipkin_ot.thrift import spans_from_list_bytes
+
+from tests.support import MockConnection
+
+
+class FakeClock(object):
+
+    def __init__(self, now_us):
+        self.now = now_us
+
+    def now_us(self):
+        return self.now
+
+
+class ClockTest(unittest.TestCase):
+
+    def test_now_us(self):
+        clock = Clock()
+        before = int(time.time() * 1000000)
+        now = clock.now_us()
+        self.assertTrue(isinstance(now, (int, type(2 ** 64))))
+        self.assertTrue(abs(now - before) < 1000000)
+        readings = [clock.now_us() for _ in range(1000)]
+        self.assertEqual(readings, sorted(readings))
+
+
+class SpanClockTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+
+    def tearDown(self):
+        self.recorder.shutdown(flush=False)
+
+    def flushed_annotations(self):
+        connection = MockConnection()
+        self.assertTrue(self.recorder.flush(connection))
+        span, = spans_from_list_bytes(connection.bodies[0])
+        return dict((a.value, a.timestamp) for a in span.annotations)
+
+    def test_integer_timestamps(self):
+        start_us = 1500000000123457
+        self.tracer.clock = clock = FakeClock(start_us)
+        span = self.tracer.start_span('op')
+        clock.now += 1
+        span.finish()
+        self.assertEqual((span.start_us, span.duration_us), (start_us, 1))
+        self.assertAlmostEqual(span.duration, 0.000001)
+        annotations = self.flushed_annotations()
+        self.assertEqual(annotations['sr'], start_us)
+        self.assertEqual(annotations['ss'], start_us + 1)
+
+    def test_explicit_times(self):
+        span = self.tracer.start_span('op', start_time=1500000000.5)
+        span.finish(finish_time=1500000002.25)
+        self.assertEqual(span.start_us, 1500000000500000)
+        self.assertEqual(span.duration_us, 1750000)
+        annotations = self.flushed_annotations()
+        self.assertEqual(annotations['cs'], 1500000000500000)
+        self.assertEqual(annotations['cr'], 1500000002250000)
+
+
+if __name__ == '__main__':
+    unittest.main()
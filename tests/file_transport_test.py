@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import constants
+from zipkin_ot.file_transport import NDJSON, FileTransport
+from zipkin_ot.thrift import (create_span, frames_in_list_bytes, span_frame,
+                              spans_from_list_bytes)
+
+
+def body(*names):
+    return frames_in_list_bytes([
+        span_frame(create_span('%x' % (i + 1), None, 'a', name, [], []))
+        for i, name in enumerate(names)])
+
+
+def read_records(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset < len(data):
+        length, = struct.unpack_from('!I', data, offset)
+        offset += 4
+        records.append(data[offset:offset + length])
+        offset += length
+    return records
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FileTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_thrift_records(self):
+        transport = FileTransport(self.directory, clock=self.clock)
+        transport.post(data=body('a', 'b')).raise_for_status()
+        transport.post(data=body('c'))
+        # The file is only complete once rotated.
+        self.assertEqual(transport.files(), [])
+        active, = os.listdir(self.directory)
+        self.assertTrue(active.endswith(constants.FILE_TRANSPORT_ACTIVE_SUFFIX))
+
+        transport.close()
+        path, = transport.files()
+        records = read_records(path)
+        self.assertEqual(records, [body('a', 'b'), body('c')])
+        self.assertEqual([s.name for s in spans_from_list_bytes(records[0])],
+                         ['a', 'b'])
+        with self.assertRaises(IOError):
+            transport.post(data=body('d'))
+
+    def test_ndjson(self):
+        transport = FileTransport(self.directory, format=NDJSON,
+                                  fsync_seconds=0, clock=self.clock)
+        transport.post(data=body('a', 'b'))
+        transport.close()
+        path, = transport.files()
+        self.assertTrue(path.endswith('.ndjson'))
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([s['name'] for s in spans], ['a', 'b'])
+        self.assertEqual(spans[1]['id'], '0000000000000002')
+
+    def test_rotation(self):
+        size = 4 + len(body('a'))
+        transport = FileTransport(self.directory, max_bytes=2 * size,
+                                  max_seconds=60, clock=self.clock)
+        for _ in range(5):
+            transport.post(data=body('a'))
+        # By size: two records per file.
+        self.assertEqual(len(transport.files()), 2)
+        self.clock.now += 61
+        transport.post(data=body('a'))
+        # By age: the file with the fifth record was rotated.
+        self.assertEqual(len(transport.files()), 3)
+        transport.close()
+        self.assertEqual(
+            [len(read_records(path)) for path in transport.files()],
+            [2, 2, 1, 1])
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            FileTransport(self.directory, format='xml')
+
+
+class RecorderTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_flush_and_shutdown(self):
+        transport = FileTransport(self.directory)
+        recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0, transport=transport)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        tracer.start_span('flushed').finish()
+        self.assertTrue(recorder.flush())
+        tracer.start_span('drained').finish()
+        report = recorder.shutdown()
+        self.assertEqual(report.sent, 1)
+
+        path, = transport.files()
+        names = [s.name for record in read_records(path)
+                 for s in spans_from_list_bytes(record)]
+        self.assertEqual(names, ['flushed', 'drained'])
+        self.assertEqual(recorder.metrics.spans_sent.value(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
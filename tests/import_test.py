@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ('thriftpy', 'requests', 'zipkinCore_thrift')
+
+
+class ImportTest(unittest.TestCase):
+    """Guards against `import zipkin_ot` pulling in heavy dependencies."""
+
+    def imported_modules(self, code):
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            code + '\nimport sys\n'
+            'print(",".join(m for m in %r if m in sys.modules))'
+            % (HEAVY_MODULES,)]).decode('ascii')
+        return set(m for m in output.strip().split(',') if m)
+
+    def test_import_is_lazy(self):
+        self.assertEqual(self.imported_modules('import zipkin_ot'), set())
+
+    def test_schema_loads_on_first_use(self):
+        modules = self.imported_modules(
+            'import zipkin_ot.thrift\n'
+            'zipkin_ot.thrift.create_annotation(0, "sr", None)')
+        self.assertEqual(modules, set(['thriftpy', 'zipkinCore_thrift']))
+
+    def test_dummy_endpoint_is_lazy(self):
+        self.assertEqual(self.imported_modules(
+            'from zipkin_ot.thrift import dummy_endpoint'), set())
+        modules = self.imported_modules(
+            'from zipkin_ot.thrift import dummy_endpoint\n'
+            'assert dummy_endpoint.service_name is None\n'
+            'import zipkin_ot.thrift\n'
+            'endpoint = zipkin_ot.thrift.dummy_endpoint\n'
+            'assert isinstance(endpoint, zipkin_ot.thrift.zipkin_core.Endpoint)')
+        self.assertEqual(modules, set(['thriftpy', 'zipkinCore_thrift']))
+
+
+if __name__ == '__main__':
+    unittest.main()
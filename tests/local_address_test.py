@@ -0,0 +1,66 @@
+import socket
+import threading
+import time
+import unittest
+
+from zipkin_ot import local_address
+from zipkin_ot import thrift
+
+
+class LocalAddressTest(unittest.TestCase):
+
+    def setUp(self):
+        local_address._cache.clear()
+        self._interface_address = local_address.interface_address
+        self._getaddrinfo = socket.getaddrinfo
+
+    def tearDown(self):
+        local_address.interface_address = self._interface_address
+        socket.getaddrinfo = self._getaddrinfo
+        local_address._cache.clear()
+
+    def test_cached(self):
+        addresses = local_address.local_addresses()
+        self.assertIs(local_address.local_addresses(), addresses)
+
+    def test_dns_fallback_does_not_block(self):
+        release = threading.Event()
+
+        def slow_getaddrinfo(host, *args):
+            release.wait(5)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                     ('10.1.2.3', 0))]
+
+        local_address.interface_address = lambda family: None
+        socket.getaddrinfo = slow_getaddrinfo
+        resolved = []
+
+        start = time.time()
+        addresses = local_address.local_addresses(callback=resolved.append)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(addresses, (local_address.LOOPBACK_IPV4, None))
+
+        release.set()
+        self.assertEqual(local_address.local_addresses(timeout=5),
+                         ('10.1.2.3', None))
+        self.assertEqual(resolved, [('10.1.2.3', None)])
+
+    def test_create_endpoint(self):
+        endpoint = thrift.create_endpoint(80, 'svc', host='1.2.3.4')
+        self.assertEqual(endpoint.ipv4, (1 << 24) | (2 << 16) | (3 << 8) | 4)
+        self.assertIsNone(endpoint.ipv6)
+
+        endpoint = thrift.create_endpoint(80, 'svc', host='2001:db8::1')
+        self.assertEqual(endpoint.ipv4, 0)
+        self.assertEqual(endpoint.ipv6,
+                         socket.inet_pton(socket.AF_INET6, '2001:db8::1'))
+
+        span = thrift.create_span('1', None, '2', 'op', [
+            thrift.create_annotation(1, 'sr', endpoint)], [])
+        body = thrift.thrift_obj_in_bytes(thrift.to_thrift_spans([span]))
+        decoded = thrift.spans_from_bytes(body).spans[0]
+        self.assertEqual(decoded.annotations[0].host.ipv6, endpoint.ipv6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import unittest
+
+from zipkin_ot import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counter_across_threads(self):
+        counter = metrics.Counter('c')
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.inc(5)
+        self.assertEqual(counter.value(), 8005)
+        # Cells of exited threads are retired but still counted.
+        self.assertEqual(counter.value(), 8005)
+
+    def test_short_lived_threads(self):
+        counter = metrics.Counter('c')
+        for _ in range(200):
+            t = threading.Thread(target=counter.inc)
+            t.start()
+            t.join()
+        # Each new thread retires the cells of those which have exited.
+        self.assertTrue(len(counter._cells._cells) <= 1)
+        self.assertEqual(counter.value(), 200)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('h', buckets=(1, 2, 5))
+        for v in (0.5, 1, 1.5, 3, 7, 7):
+            histogram.observe(v)
+        value = histogram.value()
+        self.assertEqual(value['count'], 6)
+        self.assertEqual(value['sum'], 20)
+        self.assertEqual(value['buckets'],
+                         {1: 2, 2: 1, 5: 1, float('inf'): 2})
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(0.99), float('inf'))
+        self.assertIsNone(metrics.Histogram('empty').quantile(0.5))
+
+    def test_exposition(self):
+        registry = metrics.Metrics()
+        registry.counter('things_total', 'Things.').inc(3)
+        registry.gauge('level', fn=lambda: 7)
+        registry.histogram('latency_seconds', buckets=(0.1, 1.0)).observe(0.5)
+
+        self.assertEqual(registry.snapshot()['things_total'], 3)
+        self.assertEqual(registry.exposition(), '\n'.join([
+            '# HELP zipkin_ot_things_total Things.',
+            '# TYPE zipkin_ot_things_total counter',
+            'zipkin_ot_things_total 3',
+            '# TYPE zipkin_ot_level gauge',
+            'zipkin_ot_level 7',
+            '# TYPE zipkin_ot_latency_seconds histogram',
+            'zipkin_ot_latency_seconds_bucket{le="0.1"} 0',
+            'zipkin_ot_latency_seconds_bucket{le="1.0"} 1',
+            'zipkin_ot_latency_seconds_bucket{le="+Inf"} 1',
+            'zipkin_ot_latency_seconds_sum 0.5',
+            'zipkin_ot_latency_seconds_count 1',
+        ]) + '\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
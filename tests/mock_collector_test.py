@@ -0,0 +1,85 @@
+import time
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import loadgen
+from zipkin_ot.mock_collector import MockCollector
+
+
+class MockCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.collector = MockCollector(seed=1).start()
+        self.collector.keep_spans = True
+        self.recorder = zipkin_ot.recorder.Recorder(
+            service_name='python/mock_collector_test',
+            collector_host=self.collector.host,
+            collector_port=self.collector.port,
+            periodic_flush_seconds=0)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+
+    def tearDown(self):
+        self.recorder.shutdown()
+        self.collector.stop()
+
+    def finish_spans(self, n):
+        for i in range(n):
+            self.tracer.start_span(str(i)).finish()
+
+    def test_receive_spans(self):
+        self.finish_spans(10)
+        self.assertTrue(self.recorder.flush())
+
+        stats = self.collector.stats()
+        self.assertEqual(stats['collector_requests_total'], 1)
+        self.assertEqual(stats['collector_spans_total'], 10)
+        self.assertEqual(sorted(s.name for s in self.collector.spans()),
+                         sorted(str(i) for i in range(10)))
+
+    def test_errors_and_outages(self):
+        self.collector.error_rate = 1.0
+        self.finish_spans(5)
+        self.assertFalse(self.recorder.flush())
+        self.collector.error_rate = 0.0
+        self.collector.outage = True
+        self.assertFalse(self.recorder.flush())
+        self.collector.outage = False
+        self.assertTrue(self.recorder.flush())
+
+        stats = self.collector.stats()
+        self.assertEqual(stats['collector_errors_total'], 2)
+        self.assertEqual(stats['collector_spans_total'], 5)
+        self.assertEqual(
+            self.recorder.metrics.flush_failures.value(), 2)
+
+    def test_latency(self):
+        self.collector.latency = 0.05
+        self.finish_spans(1)
+        start = time.time()
+        self.assertTrue(self.recorder.flush())
+        self.assertTrue(time.time() - start >= 0.05)
+
+    def test_loadgen(self):
+        report = loadgen.run(loadgen_args(threads=2, duration=0.2))
+        self.assertTrue(report['spans_finished'] > 0)
+        self.assertEqual(report['collector_spans'], report['spans_sent'])
+        self.assertEqual(report['spans_sent'] + report['spans_dropped'],
+                         report['spans_finished'])
+
+
+def loadgen_args(**kwargs):
+    parser_args = {
+        'collector_host': None, 'collector_port': 9411, 'threads': 1,
+        'duration': 1.0, 'rate': 0, 'tags': 1, 'max_span_records': 100000,
+        'flush_seconds': 0.05, 'latency': 0.0, 'error_rate': 0.0,
+        'outage_every': 0, 'outage_length': 0, 'seed': 1,
+    }
+    parser_args.update(kwargs)
+    return type('Args', (object,), parser_args)
+
+
+if __name__ == '__main__':
+    unittest.main()
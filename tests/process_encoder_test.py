@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+import unittest
+import warnings
+
+import zipkin_ot.tracer
+from zipkin_ot.mock_collector import MockCollector
+from zipkin_ot.process_encoder import (ProcessEncodingRecorder,
+                                       encode_records, record_frames)
+from zipkin_ot.thrift import spans_from_list_bytes
+
+from tests.support import MockConnection
+
+
+class ProcessEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.collector = MockCollector().start()
+        self.collector.keep_spans = True
+        self.recorder = ProcessEncodingRecorder(
+            service_name='python/process_encoder_test',
+            collector_host=self.collector.host,
+            collector_port=self.collector.port,
+            periodic_flush_seconds=0)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+
+    def tearDown(self):
+        self.recorder.shutdown()
+        self.collector.stop()
+
+    def finish_spans(self, n):
+        for i in range(n):
+            with self.tracer.start_span(str(i)) as span:
+                span.set_tag('index', i)
+                span.log_event('event', i)
+
+    def test_report(self):
+        parent = self.tracer.start_span('parent')
+        self.tracer.start_span('child', child_of=parent).finish()
+        parent.finish()
+        self.finish_spans(10)
+        self.assertTrue(self.recorder.flush())
+
+        pid = self.recorder.encoder.pid
+        self.assertNotEqual(pid, None)
+        self.assertNotEqual(pid, os.getpid())
+
+        spans = dict((s.name, s) for s in self.collector.spans())
+        self.assertEqual(len(spans), 12)
+        self.assertEqual(spans['child'].parent_id, spans['parent'].id)
+        self.assertEqual(spans['child'].trace_id, spans['parent'].trace_id)
+        self.assertEqual(spans['parent'].parent_id, None)
+        binary = dict((a.key, a.value) for a in spans['3'].binary_annotations)
+        self.assertEqual(binary['index'], b'3')
+        self.assertEqual(
+            self.recorder.metrics.spans_sent.value(), 12)
+        self.assertEqual(
+            self.recorder.metrics.bytes_sent.value(),
+            self.collector.stats()['collector_bytes_total'])
+
+    def test_matches_recorder(self):
+        """The in-process and helper encodings agree."""
+        self.finish_spans(3)
+        connection = MockConnection()
+        records = list(self.recorder._span_records)
+        self.assertTrue(self.recorder.flush(connection))
+        self.assertEqual(len(connection.bodies), 1)
+        self.assertEqual(
+            connection.bodies[0],
+            encode_records(self.recorder._endpoint_tuple(), records))
+        spans = spans_from_list_bytes(connection.bodies[0])
+        self.assertEqual(sorted(s.name for s in spans), ['0', '1', '2'])
+
+    def test_collector_error_restores_spans(self):
+        self.collector.outage = True
+        self.finish_spans(4)
+        self.assertFalse(self.recorder.flush())
+        self.assertEqual(len(self.recorder._span_records), 4)
+        self.assertEqual(self.recorder.metrics.flush_failures.value(), 1)
+        # The helper itself is still healthy.
+        pid = self.recorder.encoder.pid
+        self.collector.outage = False
+        self.assertTrue(self.recorder.flush())
+        self.assertEqual(self.recorder.encoder.pid, pid)
+        self.assertEqual(len(self.collector.spans()), 4)
+
+    def test_helper_restarted(self):
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        process = self.recorder.encoder._process
+        process.terminate()
+        process.join()
+
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        self.assertNotEqual(self.recorder.encoder.pid, process.pid)
+        self.assertEqual(len(self.collector.spans()), 2)
+
+    def test_fork_starts_own_helper(self):
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        encoder = self.recorder.encoder
+        process = encoder._process
+        # Pretend this is a child forked after the helper was started.
+        encoder._pid = -1
+        self.assertEqual(encoder.pid, None)
+
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        self.assertNotEqual(encoder.pid, process.pid)
+        # The "parent's" helper is left alone.
+        self.assertTrue(process.is_alive())
+        process.terminate()
+        process.join()
+
+    def test_shutdown_stops_helper(self):
+        self.finish_spans(2)
+        self.assertTrue(self.recorder.flush())
+        process = self.recorder.encoder._process
+        self.finish_spans(2)
+        self.assertTrue(self.recorder.shutdown())
+        self.assertFalse(process.is_alive())
+        self.assertEqual(self.recorder.encoder.pid, None)
+        self.assertEqual(len(self.collector.spans()), 4)
+
+    def test_batches(self):
+        self.finish_spans(6)
+        frame = record_frames(self.recorder._endpoint_tuple(),
+                              self.recorder._span_records[:1])[0]
+        self.recorder._max_batch_bytes = 5 + 2 * len(frame) + 10
+        self.assertTrue(self.recorder.flush())
+        self.assertEqual(self.collector.stats()['collector_requests_total'],
+                         3)
+        self.assertEqual(self.recorder.metrics.flushes.value(), 3)
+        self.assertEqual(len(self.collector.spans()), 6)
+
+        self.finish_spans(6)
+        connection = MockConnection()
+        self.assertTrue(self.recorder.flush(connection))
+        self.assertEqual(len(connection.bodies), 3)
+
+    def test_post_timeout(self):
+        # The helper is started with the encoder's timeout for its posts.
+        self.recorder.encoder.timeout = 0.3
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        pid = self.recorder.encoder.pid
+        self.recorder.encoder.timeout = 5.0
+
+        self.collector.latency = 1.0
+        self.finish_spans(2)
+        start = time.time()
+        self.assertFalse(self.recorder.flush())
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEqual(len(self.recorder._span_records), 2)
+        # The helper answered with the error, and was kept.
+        self.assertEqual(self.recorder.encoder.pid, pid)
+        self.collector.latency = 0.0
+
+    def test_slow_collector_report(self):
+        # Each body gets the timeout: a report of three bodies may take
+        # longer than one, without the helper being replaced.
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        pid = self.recorder.encoder.pid
+        self.recorder.encoder.timeout = 0.5
+        self.collector.latency = 0.3
+        self.finish_spans(6)
+        frame = record_frames(self.recorder._endpoint_tuple(),
+                              self.recorder._span_records[:1])[0]
+        self.recorder._max_batch_bytes = 5 + 2 * len(frame) + 10
+        self.assertTrue(self.recorder.flush())
+        self.assertEqual(self.recorder.encoder.pid, pid)
+        self.assertEqual(len(self.collector.spans()), 7)
+        self.collector.latency = 0.0
+
+    def test_report_timeout_keeps_sent_batches(self):
+        self.finish_spans(1)
+        self.assertTrue(self.recorder.flush())
+        self.recorder.encoder.timeout = 0.5
+        self.finish_spans(6)
+        frame = record_frames(self.recorder._endpoint_tuple(),
+                              self.recorder._span_records[:1])[0]
+        self.recorder._max_batch_bytes = 5 + 2 * len(frame) + 10
+        handle = self.collector._handle
+
+        def stall_third(body):
+            if self.collector.requests.value() >= 3:
+                time.sleep(1.0)
+            return handle(body)
+
+        self.collector._handle = stall_third
+        self.assertFalse(self.recorder.flush())
+        # Only the two spans of the body in flight are put back.
+        self.assertEqual(len(self.recorder._span_records), 2)
+        self.assertEqual(self.recorder.metrics.spans_sent.value(), 5)
+
+    def test_shutdown_during_report(self):
+        self.collector.latency = 5.0
+        self.finish_spans(2)
+        flusher = threading.Thread(target=self.recorder.flush)
+        flusher.start()
+        while self.recorder.encoder._lock.acquire(False):
+            # Wait for the report to take the encoder.
+            self.recorder.encoder._lock.release()
+            time.sleep(0.01)
+        start = time.time()
+        report = self.recorder.shutdown(timeout=0.5)
+        elapsed = time.time() - start
+        flusher.join()
+        self.assertTrue(elapsed < 1.5, elapsed)
+        self.assertTrue(report.seconds >= 0.5, report)
+        self.assertAlmostEqual(report.seconds, elapsed, places=1)
+        self.assertEqual(self.recorder.encoder.pid, None)
+
+    def test_tracer_option(self):
+        tracer = zipkin_ot.tracer.Tracer(
+            periodic_flush_seconds=0, encoder_process=True)
+        self.assertTrue(isinstance(tracer.recorder, ProcessEncodingRecorder))
+        tracer.recorder.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
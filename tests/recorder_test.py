@@ -1,4 +1,5 @@
 import json
+import threading
 import time
 import unittest
 import warnings
@@ -6,6 +7,7 @@ import warnings
 import jsonpickle
 
 import zipkin_ot.constants
+import zipkin_ot.context
 import zipkin_ot.recorder
 import zipkin_ot.tracer
 import zipkin_ot.recorder
@@ -16,36 +18,14 @@ from zipkin_ot.thrift import spans_from_bytes
 
 from zipkin_ot import thrift
 
-from collections import namedtuple
+from tests.support import MockConnection
 
 
-class ReportResponse(object):
-
-    def __init__(self):
-        self.status_code = 200
-
-    def raise_for_status(self):
-        pass
-
-
-SpanRecord = namedtuple('SpanRecord', 'url, data, headers')
-
-
-class MockConnection(object):
-    """MockConnection is used to debug and test Runtime.
+class ErrorConnection(object):
+    """ErrorConnection fails every report.
     """
-    def __init__(self):
-        self.reports = []
-
     def post(self, url, data, headers):
-        """Mimic the Thrift client's report method. Instead of sending report
-            requests save them to a list.
-        """
-        self.reports.append(SpanRecord(url, data, headers))
-        return ReportResponse()
-
-    def clear(self):
-        self.reports = []
+        raise IOError('collector unavailable')
 
 
 class RecorderTest(unittest.TestCase):
@@ -76,7 +56,7 @@ class RecorderTest(unittest.TestCase):
         self.assertTrue(recorder.flush(self.mock_connection))
 
         # Check 10 spans
-        self.check_spans(self.mock_connection.reports)
+        self.check_spans(self.mock_connection.bodies)
 
         # Delete current logs and shutdown runtime
         self.mock_connection.clear()
@@ -86,7 +66,7 @@ class RecorderTest(unittest.TestCase):
         for i in range(10):
             recorder.record_span(self.dummy_basic_span(recorder, i))
         self.assertFalse(recorder.flush(self.mock_connection))
-        self.assertEqual(len(self.mock_connection.reports), 0)
+        self.assertEqual(len(self.mock_connection.bodies), 0)
 
     def test_shutdown_twice(self):
         recorder = self.create_test_recorder()
@@ -101,16 +81,16 @@ class RecorderTest(unittest.TestCase):
         for i in range(1000):
             recorder.record_span(self.dummy_basic_span(recorder, i))
         self.assertTrue(recorder.flush(self.mock_connection))
-        self.assertEqual(len(RecorderTest.decode_span_array(self.mock_connection.reports[0].data)), 1000)
-        self.check_spans(self.mock_connection.reports)
+        self.assertEqual(len(RecorderTest.decode_span_array(self.mock_connection.bodies[0])), 1000)
+        self.check_spans(self.mock_connection.bodies)
 
     def test_stress_spans(self):
         recorder = self.create_test_recorder()
         for i in range(1000):
             recorder.record_span(self.dummy_basic_span(recorder, i))
         self.assertTrue(recorder.flush(self.mock_connection))
-        self.assertEqual(len(RecorderTest.decode_span_array(self.mock_connection.reports[0].data)), 1000)
-        self.check_spans(self.mock_connection.reports)
+        self.assertEqual(len(RecorderTest.decode_span_array(self.mock_connection.bodies[0])), 1000)
+        self.check_spans(self.mock_connection.bodies)
 
     # -------------
     # RUNTIME TESTS
@@ -128,6 +108,299 @@ class RecorderTest(unittest.TestCase):
         self.assertEqual(len(recorder._span_records), 88)
         self.assertTrue(recorder.flush(self.mock_connection))
 
+    def test_log_limits(self):
+        self.runtime_args.update({
+            'max_logs_per_span': 5,
+        })
+        recorder = self.create_test_recorder()
+
+        span = self.dummy_basic_span(recorder, 0)
+        for i in range(20):
+            span.log_event('event %d' % i, 'x' * 5000)
+        recorder.record_span(span)
+        self.assertTrue(recorder.flush(self.mock_connection))
+
+        spans = RecorderTest.decode_span_array(
+            self.mock_connection.bodies[0])
+        annotations = dict(
+            (a.key, a.value) for a in spans[0].binary_annotations)
+        self.assertEqual(
+            annotations[zipkin_ot.constants.DROPPED_LOGS_KEY], '15')
+        self.assertEqual(len(annotations), 6)
+        for value in annotations.values():
+            self.assertTrue(len(value) <= zipkin_ot.constants.MAX_LOG_LEN)
+
+    def test_metrics(self):
+        self.runtime_args.update({
+            'max_span_records': 10,
+        })
+        recorder = self.create_test_recorder()
+
+        for i in range(15):
+            recorder.record_span(self.dummy_basic_span(recorder, i))
+        self.assertFalse(recorder.flush(ErrorConnection()))
+        recorder.record_span(self.dummy_basic_span(recorder, 15))
+        self.assertTrue(recorder.flush(self.mock_connection))
+
+        snapshot = recorder.metrics.snapshot()
+        self.assertEqual(snapshot['spans_recorded_total'], 10)
+        self.assertEqual(snapshot['spans_dropped_total'], 6)
+        self.assertEqual(snapshot['flush_failures_total'], 1)
+        self.assertEqual(snapshot['spans_restored_total'], 10)
+        self.assertEqual(snapshot['spans_restore_dropped_total'], 0)
+        self.assertEqual(snapshot['flushes_total'], 1)
+        self.assertEqual(snapshot['spans_sent_total'], 10)
+        self.assertEqual(snapshot['bytes_sent_total'],
+                         len(self.mock_connection.bodies[0]))
+        self.assertEqual(snapshot['buffered_spans'], 0)
+        self.assertEqual(snapshot['encode_seconds']['count'], 2)
+        self.assertEqual(snapshot['flush_seconds']['count'], 1)
+        self.assertIn('zipkin_ot_spans_dropped_total 6',
+                      recorder.metrics.exposition())
+
+    def test_profiling(self):
+        recorder = self.create_test_recorder()
+        self.assertIsNone(recorder.profiler)
+
+        profiler = recorder.enable_profiling(sample_rate=0.5)
+        for i in range(10):
+            span = self.dummy_basic_span(recorder, i)
+            span.log_event('event', i)
+            recorder.record_span(span)
+        self.assertTrue(recorder.flush(self.mock_connection))
+        self.assertIs(recorder.disable_profiling(), profiler)
+        recorder.record_span(self.dummy_basic_span(recorder, 10))
+
+        stages = profiler.snapshot()
+        for stage in ('tags', 'logs', 'annotations', 'create_span'):
+            self.assertEqual(stages[stage]['count'], 5)
+        self.assertEqual(stages['lock_wait']['count'], 10)
+        self.assertEqual(stages['encode']['count'], 1)
+        self.assertEqual(stages['post']['count'], 1)
+        self.assertEqual(len(RecorderTest.decode_span_array(
+            self.mock_connection.bodies[0])), 10)
+
+    def test_frames_reused_on_retry(self):
+        recorder = self.create_test_recorder()
+        for i in range(10):
+            recorder.record_span(self.dummy_basic_span(recorder, i))
+        expected = thrift.span_list_in_bytes(list(recorder._span_records))
+
+        self.assertFalse(recorder.flush(ErrorConnection()))
+        frames = recorder._span_records
+        self.assertEqual(len(frames), 10)
+        self.assertTrue(all(isinstance(f, bytes) for f in frames))
+        self.assertEqual(sum(len(f) for f in frames) + 5, len(expected))
+
+        self.assertTrue(recorder.flush(self.mock_connection))
+        self.assertEqual(self.mock_connection.bodies[0], expected)
+        self.assertEqual(recorder.metrics.bytes_sent.value(), len(expected))
+
+    def test_batch_splitting(self):
+        recorder = self.create_test_recorder()
+        for i in range(10):
+            recorder.record_span(self.dummy_basic_span(recorder, i))
+        frame_size = len(thrift.span_frame(recorder._span_records[0]))
+        recorder._max_batch_bytes = 5 + 3 * frame_size
+
+        connection = self.mock_connection
+        post = connection.post
+
+        def fail_third(**kwargs):
+            if len(connection.bodies) == 2:
+                raise IOError('collector unavailable')
+            return post(**kwargs)
+        connection.post = fail_third
+
+        self.assertFalse(recorder.flush(connection))
+        self.assertEqual(len(connection.bodies), 2)
+        self.assertEqual(recorder.metrics.spans_sent.value(), 6)
+        # Only the spans which were not sent are retried.
+        self.assertEqual(len(recorder._span_records), 4)
+
+        connection.post = post
+        self.assertTrue(recorder.flush(connection))
+        self.assertEqual(
+            [len(RecorderTest.decode_span_array(body))
+             for body in connection.bodies], [3, 3, 3, 1])
+        self.check_spans(connection.bodies)
+
+    def test_priority_lanes(self):
+        self.runtime_args.update({
+            'max_span_records': 5,
+            'max_priority_span_records': 2,
+        })
+        recorder = self.create_test_recorder()
+        for i in range(6):
+            recorder.record_span(self.dummy_basic_span(recorder, i))
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 1)
+
+        not_error = self.dummy_basic_span(recorder, 6)
+        not_error.set_tag('error', False)
+        recorder.record_span(not_error)
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 2)
+
+        error = self.dummy_basic_span(recorder, 7)
+        error.set_tag('error', True)
+        recorder.record_span(error)
+        debug = BasicSpan(
+            zipkin_ot.tracer._OpenZipkinTracer(recorder),
+            operation_name='8',
+            context=zipkin_ot.context.SpanContext(
+                trace_id=1008, span_id=2008, debug=True),
+            start_time=time.time())
+        recorder.record_span(debug)
+        self.assertEqual(len(recorder._priority_records), 2)
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 2)
+
+        # The reserve is full: the next error span evicts a normal one, and
+        # normal spans can no longer get in.
+        error = self.dummy_basic_span(recorder, 9)
+        error.set_tag('error', 'true')
+        recorder.record_span(error)
+        recorder.record_span(self.dummy_basic_span(recorder, 10))
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 4)
+        self.assertEqual(recorder.metrics.priority_spans_dropped.value(), 0)
+
+        self.assertTrue(recorder.flush(self.mock_connection))
+        names = [s.name for s in RecorderTest.decode_span_array(
+            self.mock_connection.bodies[0])]
+        self.assertEqual(names, ['7', '8', '9', '1', '2', '3', '4'])
+
+    def test_unicode_error_tag(self):
+        recorder = self.create_test_recorder()
+        span = self.dummy_basic_span(recorder, 0)
+        span.set_tag('error', u'\xe9chec')
+        recorder.record_span(span)
+        self.assertEqual(len(recorder._priority_records), 1)
+
+    def test_priority_drops_and_restore(self):
+        self.runtime_args.update({
+            'max_span_records': 2,
+            'max_priority_span_records': 1,
+        })
+        recorder = self.create_test_recorder()
+        recorder.record_span(self.dummy_basic_span(recorder, 0))
+        for i in range(1, 5):
+            span = self.dummy_basic_span(recorder, i)
+            span.set_tag('error', True)
+            recorder.record_span(span)
+        self.assertEqual(len(recorder._priority_records), 3)
+        self.assertEqual(len(recorder._span_records), 0)
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 1)
+        self.assertEqual(recorder.metrics.priority_spans_dropped.value(), 1)
+
+        # A failed flush puts the spans back into their lanes.
+        self.assertFalse(recorder.flush(ErrorConnection()))
+        self.assertEqual(len(recorder._priority_records), 3)
+        self.assertEqual(recorder.metrics.spans_restore_dropped.value(), 0)
+        self.assertTrue(recorder.flush(self.mock_connection))
+        self.assertEqual(len(RecorderTest.decode_span_array(
+            self.mock_connection.bodies[0])), 3)
+
+    def test_record_spans(self):
+        self.runtime_args.update({
+            'max_span_records': 5,
+        })
+        recorder = self.create_test_recorder()
+        spans = [self.dummy_basic_span(recorder, i) for i in range(10)]
+        spans[8].set_tag('error', True)
+        self.assertEqual(recorder.record_spans(iter(spans)), 4)
+        self.assertEqual(recorder.metrics.spans_rejected.value(), 4)
+        self.assertEqual(recorder.metrics.spans_dropped.value(), 0)
+        self.assertTrue(recorder.flush(self.mock_connection))
+        names = [s.name for s in RecorderTest.decode_span_array(
+            self.mock_connection.bodies[0])]
+        self.assertEqual(names, ['8', '0', '1', '2', '3', '4'])
+
+    def test_record_spans_blocking(self):
+        self.runtime_args.update({
+            'max_span_records': 3,
+        })
+        recorder = self.create_test_recorder()
+        spans = [self.dummy_basic_span(recorder, i) for i in range(20)]
+        self.assertEqual(
+            recorder.record_spans(spans[:5], block=True, timeout=0.01), 2)
+
+        done = threading.Event()
+
+        def flush():
+            while not done.is_set():
+                recorder.flush(self.mock_connection)
+                done.wait(0.001)
+
+        self.mock_connection.clear()
+        recorder._take_records()
+        flusher = threading.Thread(target=flush)
+        flusher.start()
+        try:
+            self.assertEqual(
+                recorder.record_spans(spans, block=True, timeout=10), 0)
+        finally:
+            done.set()
+            flusher.join()
+        recorder.flush(self.mock_connection)
+        names = [s.name for body in self.mock_connection.bodies
+                 for s in RecorderTest.decode_span_array(body)]
+        self.assertEqual(names, [str(i) for i in range(20)])
+
+    def test_record_spans_block_needs_flush(self):
+        self.runtime_args.update({
+            'max_span_records': 3,
+        })
+        recorder = self.create_test_recorder()
+        spans = [self.dummy_basic_span(recorder, i) for i in range(5)]
+        # Nothing would ever flush to make room.
+        self.assertRaises(ValueError, recorder.record_spans, spans,
+                          block=True)
+        self.assertEqual(recorder._buffered_count(), 0)
+
+    def test_record_spans_buffers_frames(self):
+        recorder = self.create_test_recorder()
+        spans = [self.dummy_basic_span(recorder, i) for i in range(5)]
+        self.assertEqual(recorder.record_spans(spans), 0)
+        self.assertTrue(all(isinstance(record, bytes)
+                            for record in recorder._span_records))
+        self.assertTrue(recorder.flush(self.mock_connection))
+        self.check_spans(self.mock_connection.bodies)
+
+    def test_span_converted_during_shutdown(self):
+        recorder = self.create_test_recorder()
+        convert_span = recorder._convert_span
+
+        def convert_then_shut_down(span, truncated):
+            span_record = convert_span(span, truncated)
+            recorder.shutdown(flush=False)
+            return span_record
+
+        recorder._convert_span = convert_then_shut_down
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        tracer.start_span('late').finish()
+        self.assertEqual(recorder._buffered_count(), 0)
+        self.assertEqual(recorder.metrics.spans_shutdown_dropped.value(), 1)
+
+    def test_record_spans_blocked_at_shutdown(self):
+        self.runtime_args.update({
+            'max_span_records': 3,
+        })
+        recorder = self.create_test_recorder()
+        spans = [self.dummy_basic_span(recorder, i) for i in range(8)]
+        self.assertEqual(recorder.record_spans(spans[:3]), 0)
+
+        results = []
+        recording = threading.Thread(target=lambda: results.append(
+            recorder.record_spans(spans[3:], block=True, timeout=10)))
+        recording.start()
+        time.sleep(0.05)
+        recorder.shutdown(flush=False)
+        recording.join(5)
+        self.assertFalse(recording.is_alive())
+        self.assertEqual(results, [5])
+        self.assertEqual(recorder._buffered_count(), 0)
+        self.assertEqual(recorder.metrics.spans_rejected.value(), 0)
+        # The 3 buffered at shutdown, and the 5 which were waiting.
+        self.assertEqual(recorder.metrics.spans_shutdown_dropped.value(), 8)
+
     @staticmethod
     def decode_span_array(data):
         to_object = '\x0f\x00\x01' + data + '\x00'
@@ -137,13 +410,13 @@ class RecorderTest(unittest.TestCase):
     # ------
     # HELPER
     # ------
-    def check_spans(self, reports):
+    def check_spans(self, bodies):
         """Checks spans' name.
         """
         id = 0
 
-        for i, report in enumerate(reports):
-            spans = RecorderTest.decode_span_array(report.data)
+        for i, body in enumerate(bodies):
+            spans = RecorderTest.decode_span_array(body)
 
             for i in xrange(len(spans)):
                 self.assertEqual(spans[i].name, str(id))
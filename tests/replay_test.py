@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import warnings
+
+from zipkin_ot import replay
+from zipkin_ot.file_transport import RECORD_LENGTH, FileTransport
+from zipkin_ot.mock_collector import MockCollector
+from zipkin_ot.thrift import (annotation_list_builder, create_endpoint,
+                              create_span, frames_in_list_bytes, span_frame)
+
+
+def frame(trace_id, span_id, service='svc', timestamp=100.0):
+    host = create_endpoint(0, service, host='127.0.0.1')
+    return span_frame(create_span(
+        '%x' % span_id, None, '%x' % trace_id, 'op-%d' % span_id,
+        annotation_list_builder({'sr': timestamp}, host), []))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.directory = tempfile.mkdtemp()
+        self.frames = [frame(1, 1), frame(1, 2, 'other', 200.0),
+                       frame(0xb6dbb1c2b362bf51, 3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_iter_body(self):
+        body = frames_in_list_bytes(self.frames)
+        items = list(replay.iter_spans(body))
+        self.assertEqual([s.name for s, _ in items],
+                         ['op-1', 'op-2', 'op-3'])
+        self.assertEqual([f for _, f in items], self.frames)
+
+    def test_read_records(self):
+        transport = FileTransport(self.directory)
+        transport.post(data=frames_in_list_bytes(self.frames[:2]))
+        transport.post(data=frames_in_list_bytes(self.frames[2:]))
+        transport.close()
+        path, = transport.files()
+        frames = [f for _, f in replay.read_spans(path)]
+        self.assertEqual(frames, self.frames)
+        self.assertEqual(list(replay.read_spans(self.write('empty', b''))),
+                         [])
+
+    def test_truncated(self):
+        body = frames_in_list_bytes(self.frames)
+        for truncated in (body[:3], body[:-4]):
+            with self.assertRaises(replay.CaptureError):
+                list(replay.iter_spans(truncated, replay.BODY))
+        with self.assertRaises(replay.CaptureError):
+            list(replay.iter_spans(b'\x00\x00\x01\x00' + body))
+
+    def test_guess_format(self):
+        body = frames_in_list_bytes(self.frames)
+        record = as_record(body)
+        self.assertEqual(replay._guess_format(body), replay.BODY)
+        self.assertEqual(replay._guess_format(record), replay.RECORDS)
+        # A body which does not hold structs, a record longer than the
+        # capture, anything else.
+        for junk in (b'\x0b' + body[1:], record[:-1], b'{"traceId": 1}'):
+            with self.assertRaises(replay.CaptureError):
+                replay._guess_format(junk)
+
+    def test_filter(self):
+        spans = [s for s, _ in replay.iter_spans(
+            frames_in_list_bytes(self.frames))]
+
+        def names(span_filter):
+            return [s.name for s in spans if span_filter(s)]
+
+        self.assertEqual(names(replay.SpanFilter()),
+                         ['op-1', 'op-2', 'op-3'])
+        self.assertEqual(names(replay.SpanFilter(
+            trace_ids=['b6dbb1c2b362bf51', 1])), ['op-1', 'op-2', 'op-3'])
+        self.assertEqual(names(replay.SpanFilter(trace_ids=[1])),
+                         ['op-1', 'op-2'])
+        # 128-bit trace ids match on their low 64 bits.
+        self.assertEqual(names(replay.SpanFilter(
+            trace_ids=['463ac35c9f6413ad' + 'b6dbb1c2b362bf51'])), ['op-3'])
+        self.assertEqual(names(replay.SpanFilter(services=['other'])),
+                         ['op-2'])
+        self.assertEqual(names(replay.SpanFilter(start=150)), ['op-2'])
+        self.assertEqual(names(replay.SpanFilter(end=150)),
+                         ['op-1', 'op-3'])
+
+    def test_rebatching_and_rate(self):
+        clock = FakeClock()
+        bodies = []
+        original = replay.metrics.clock
+        replay.metrics.clock = clock
+        try:
+            spans, batches = replay.replay(
+                self.frames * 4, bodies.append, max_batch_spans=5,
+                spans_per_second=10, sleep=clock.sleep)
+        finally:
+            replay.metrics.clock = original
+        self.assertEqual((spans, batches), (12, 3))
+        self.assertEqual([len(list(replay.iter_spans(b))) for b in bodies],
+                         [5, 5, 2])
+        # The third batch waits for the ten spans before it.
+        self.assertAlmostEqual(clock.now, 1.0)
+
+        bodies = []
+        replay.replay(self.frames, bodies.append,
+                      max_batch_bytes=5 + len(self.frames[0]) +
+                      len(self.frames[1]))
+        self.assertEqual(len(bodies), 2)
+
+    def test_main(self):
+        collector = MockCollector().start()
+        collector.keep_spans = True
+        path = self.write('spool.thrift', frames_in_list_bytes(self.frames))
+        stdout = sys.stdout
+        try:
+            sys.stdout = Output()
+            replay.main(['--collector', '%s:%d' % (collector.host,
+                                                   collector.port),
+                         '--service', 'svc', path, path])
+            output = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+            collector.stop()
+        self.assertEqual(output['spans_read'], 6)
+        self.assertEqual(output['spans_sent'], 4)
+        self.assertEqual(sorted(s.name for s in collector.spans()),
+                         ['op-1', 'op-1', 'op-3', 'op-3'])
+
+    def test_main_trace_ids(self):
+        path = self.write('spool.thrift', frames_in_list_bytes(self.frames))
+        output_dir = os.path.join(self.directory, 'out')
+        stdout = sys.stdout
+        try:
+            sys.stdout = Output()
+            replay.main(['--output', output_dir, '--trace-id',
+                         '463ac35c9f6413adb6dbb1c2b362bf51', path])
+            output = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output['spans_sent'], 1)
+
+        stderr = sys.stderr
+        try:
+            sys.stderr = Output()
+            for trace_id in ('xyz', '1' * 33):
+                with self.assertRaises(SystemExit):
+                    replay.main(['--trace-id', trace_id, path])
+        finally:
+            sys.stderr = stderr
+
+    def test_post_timeout(self):
+        collector = MockCollector(latency=2.0).start()
+        path = self.write('spool.thrift', frames_in_list_bytes(self.frames))
+        start = time.time()
+        try:
+            with self.assertRaises(IOError):
+                replay.main(['--collector', '%s:%d' % (collector.host,
+                                                       collector.port),
+                             '--timeout', '0.2', path])
+        finally:
+            collector.stop()
+        self.assertTrue(time.time() - start < 1.5)
+
+
+def as_record(body):
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+class Output(object):
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+if __name__ == '__main__':
+    unittest.main()
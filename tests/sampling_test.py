@@ -0,0 +1,167 @@
+import threading
+import unittest
+import warnings
+
+import opentracing
+from basictracer.recorder import InMemoryRecorder, Sampler
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot.sampling import AdaptiveSampler
+from zipkin_ot.sharding import ShardedRecorder
+
+
+class AdaptiveSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.recorder = zipkin_ot.recorder.Recorder(
+            service_name='python/sampling_test',
+            periodic_flush_seconds=0,
+            max_span_records=100000)
+        self.sampler = AdaptiveSampler(
+            self.recorder, spans_per_second=100, interval=3600)
+        self.now = self.sampler._last
+
+    def tearDown(self):
+        self.recorder.shutdown()
+
+    def run_interval(self, roots, spans_per_trace=1, seconds=1.0):
+        """Starts `roots` traces per operation for one interval; returns
+        how many of them were sampled, per operation.
+        """
+        sampled = {}
+        for operation, count in roots.items():
+            sampled[operation] = 0
+            for i in range(count):
+                if self.sampler.sampled_operation(i, operation):
+                    sampled[operation] += 1
+                    self.recorder.metrics.spans_recorded.inc(spans_per_trace)
+        self.now += seconds
+        self.sampler._update(self.now)
+        return sampled
+
+    def test_quiet_operations_fully_sampled(self):
+        for _ in range(3):
+            self.run_interval({'busy': 1000, 'quiet': 5})
+        probabilities = self.sampler.probabilities()
+        self.assertEqual(probabilities['quiet'], 1.0)
+        self.assertTrue(probabilities['busy'] < 0.2, probabilities)
+
+    def test_converges_to_budget(self):
+        spans = []
+        for _ in range(30):
+            sampled = self.run_interval({'a': 2000, 'b': 500},
+                                        spans_per_trace=4)
+            spans.append(4 * sum(sampled.values()))
+        mean = sum(spans[-10:]) / 10.0
+        self.assertTrue(80 < mean < 120, spans)
+        # Both operations get the same share of the budget.
+        probabilities = self.sampler.probabilities()
+        self.assertAlmostEqual(probabilities['a'] * 2000,
+                               probabilities['b'] * 500)
+        # And traffic dying down lets probabilities climb back.
+        for _ in range(30):
+            self.run_interval({'a': 10, 'b': 10}, spans_per_trace=4)
+        probabilities = self.sampler.probabilities()
+        self.assertEqual(probabilities['a'], 1.0)
+        self.assertEqual(probabilities['b'], 1.0)
+
+    def test_backs_off_under_pressure(self):
+        for _ in range(10):
+            self.run_interval({'a': 100})
+        self.assertEqual(self.sampler.probabilities()['a'], 1.0)
+        self.recorder.metrics.spans_dropped.inc(50)
+        self.run_interval({'a': 100})
+        self.assertTrue(self.sampler.probabilities()['a'] < 1.0)
+
+    def test_backs_off_when_shards_fill_up(self):
+        recorder = ShardedRecorder(['localhost:1', 'localhost:2'],
+                                   service_name='python/sampling_test',
+                                   periodic_flush_seconds=0,
+                                   max_span_records=10)
+        self.assertEqual(recorder.capacity, 20)
+        memory = InMemoryRecorder()
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(memory)
+        while recorder.metrics.buffered_spans.value() < 18:
+            tracer.start_span('a').finish()
+            span = memory.get_spans().pop()
+            shard = recorder.shard_for(span.context.trace_id)
+            if len(shard._span_records) < 9:
+                shard.record_span(span)
+        sampler = AdaptiveSampler(recorder, spans_per_second=100)
+        self.assertTrue(sampler._pressure(0, 0, 0, 0) < 1.0)
+        recorder.shutdown(flush=False)
+
+    def test_concurrent_roots_counted(self):
+        self.sampler.spans_per_second = 10 ** 9
+
+        def start_roots():
+            for i in range(1000):
+                self.sampler.sampled_operation(i, 'a')
+
+        threads = [threading.Thread(target=start_roots) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.sampler._roots, {'a': 4000})
+        self.assertEqual(self.sampler._sampled_roots, 4000)
+
+    def test_operation_limit(self):
+        self.sampler.max_operations = 2
+        self.run_interval({'a': 1, 'b': 1, 'c': 1, 'd': 1})
+        probabilities = self.sampler.probabilities()
+        self.assertEqual(len(probabilities), 3)
+        self.assertIn(None, probabilities)
+
+    def test_min_probability(self):
+        self.sampler.min_probability = 0.05
+        for _ in range(3):
+            self.run_interval({'a': 10000})
+        self.assertEqual(self.sampler.probabilities()['a'], 0.05)
+
+
+class NeverSampler(Sampler):
+
+    def sampled(self, trace_id):
+        return False
+
+
+class TracerSamplingTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+    def test_unsampled_traces_not_recorded(self):
+        recorder = zipkin_ot.recorder.Recorder(periodic_flush_seconds=0)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(
+            recorder, sampler=NeverSampler())
+        with tracer.start_span('root') as root:
+            self.assertFalse(root.context.sampled)
+            carrier = {}
+            tracer.inject(root.context, opentracing.Format.HTTP_HEADERS,
+                          carrier)
+            self.assertEqual(carrier['x-b3-sampled'], '0')
+            tracer.start_span('child', child_of=root).finish()
+        self.assertEqual(len(recorder._span_records), 0)
+
+        # Downstream, the decision made at the root is kept.
+        downstream = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        context = downstream.extract(opentracing.Format.HTTP_HEADERS, carrier)
+        downstream.start_span('server', child_of=context).finish()
+        self.assertEqual(len(recorder._span_records), 0)
+        recorder.shutdown()
+
+    def test_spans_per_second(self):
+        tracer = zipkin_ot.tracer.Tracer(
+            periodic_flush_seconds=0, spans_per_second=10)
+        self.assertTrue(isinstance(tracer.sampler, AdaptiveSampler))
+        self.assertIs(tracer.sampler.recorder, tracer.recorder)
+        tracer.start_span('root').finish()
+        self.assertEqual(tracer.sampler._roots, {'root': 1})
+        tracer.recorder.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
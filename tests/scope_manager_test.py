@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+from basictracer.recorder import InMemoryRecorder
+
+import zipkin_ot.tracer
+from zipkin_ot import scope_manager
+
+
+class ThreadLocalScopeManagerTest(unittest.TestCase):
+
+    def create_scope_manager(self):
+        return scope_manager.ThreadLocalScopeManager()
+
+    def setUp(self):
+        self.recorder = InMemoryRecorder()
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(
+            self.recorder, self.create_scope_manager())
+
+    def test_nested_spans(self):
+        self.assertIsNone(self.tracer.active_span)
+        with self.tracer.start_active_span('parent') as parent:
+            with self.tracer.start_active_span('child') as child:
+                self.assertIs(self.tracer.active_span, child.span)
+                self.assertEqual(child.span.parent_id,
+                                 parent.span.context.span_id)
+                self.assertEqual(child.span.context.trace_id,
+                                 parent.span.context.trace_id)
+            self.assertIs(self.tracer.active_span, parent.span)
+            orphan = self.tracer.start_span('orphan', ignore_active_span=True)
+            self.assertIsNone(orphan.parent_id)
+        self.assertIsNone(self.tracer.active_span)
+        self.assertEqual([s.operation_name for s in self.recorder.get_spans()],
+                         ['child', 'parent'])
+
+    def test_finish_on_close(self):
+        span = self.tracer.start_span('span')
+        with self.tracer.scope_manager.activate(span, finish_on_close=False):
+            self.assertIs(self.tracer.active_span, span)
+        self.assertEqual(self.recorder.get_spans(), [])
+
+    def test_error(self):
+        try:
+            with self.tracer.start_active_span('failing'):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+        self.assertIsNone(self.tracer.active_span)
+        span, = self.recorder.get_spans()
+        self.assertEqual(
+            span.logs[0].key_values['python.exception.type'], ValueError)
+
+    def test_threads_are_isolated(self):
+        seen = []
+        with self.tracer.start_active_span('main'):
+            thread = threading.Thread(
+                target=lambda: seen.append(self.tracer.active_span))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+
+
+@unittest.skipIf(scope_manager.contextvars is None, 'requires contextvars')
+class ContextVarsScopeManagerTest(ThreadLocalScopeManagerTest):
+
+    def create_scope_manager(self):
+        return scope_manager.ContextVarsScopeManager()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+import atexit
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from basictracer.recorder import InMemoryRecorder
+from zipkin_ot import constants
+from zipkin_ot.mock_collector import MockCollector
+from zipkin_ot.sharding import HashRing, ShardedRecorder, parse_collector
+from zipkin_ot.thrift import list_length
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_balanced(self):
+        ring = HashRing(['a:1', 'b:1', 'c:1'])
+        counts = [0, 0, 0]
+        rand = random.Random(1)
+        for _ in range(30000):
+            counts[ring.index_for(rand.getrandbits(64))] += 1
+        for count in counts:
+            self.assertTrue(7000 < count < 13000, counts)
+
+    def test_consistent(self):
+        """Adding a node only moves keys to the new node."""
+        before = HashRing(['a:1', 'b:1', 'c:1'])
+        after = HashRing(['a:1', 'b:1', 'c:1', 'd:1'])
+        rand = random.Random(2)
+        moved = 0
+        for _ in range(10000):
+            key = rand.getrandbits(64)
+            old, new = before.index_for(key), after.index_for(key)
+            if old != new:
+                self.assertEqual(new, 3)
+                moved += 1
+        self.assertTrue(1500 < moved < 3500, moved)
+
+    def test_signed_ids(self):
+        ring = HashRing(['a:1', 'b:1', 'c:1'])
+        self.assertEqual(ring.index_for(-2), ring.index_for((1 << 64) - 2))
+
+    def test_successors(self):
+        ring = HashRing(['a:1', 'b:1', 'c:1'])
+        order = list(ring.successors(12345))
+        self.assertEqual(order[0], ring.index_for(12345))
+        self.assertEqual(sorted(order), [0, 1, 2])
+
+    def test_parse_collector(self):
+        self.assertEqual(parse_collector('zipkin:9411'), ('zipkin', 9411))
+        self.assertEqual(parse_collector(('zipkin', '9411')), ('zipkin', 9411))
+        self.assertEqual(parse_collector('[::1]:9411'), ('::1', 9411))
+        self.assertRaises(ValueError, parse_collector, '9411')
+
+
+class ShardedRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.collectors = [MockCollector().start() for _ in range(3)]
+        for collector in self.collectors:
+            collector.keep_spans = True
+        self.recorder = ShardedRecorder(
+            ['%s:%d' % (c.host, c.port) for c in self.collectors],
+            failure_threshold=2,
+            service_name='python/sharding_test',
+            periodic_flush_seconds=0)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+
+    def tearDown(self):
+        self.recorder.shutdown()
+        for collector in self.collectors:
+            collector.stop()
+
+    def finish_traces(self, n, spans_per_trace=3):
+        for i in range(n):
+            root = self.tracer.start_span('root')
+            for j in range(spans_per_trace - 1):
+                self.tracer.start_span('child', child_of=root).finish()
+            root.finish()
+
+    def test_traces_stay_together(self):
+        self.finish_traces(60)
+        self.assertTrue(self.recorder.flush())
+
+        owners = {}
+        for index, collector in enumerate(self.collectors):
+            spans = collector.spans()
+            # Every collector gets some of the traces.
+            self.assertTrue(spans)
+            for span in spans:
+                self.assertEqual(owners.setdefault(span.trace_id, index),
+                                 index)
+        self.assertEqual(len(owners), 60)
+        snapshot = self.recorder.metrics.snapshot()
+        self.assertEqual(snapshot['spans_sent_total'], 180)
+        self.assertEqual(snapshot['buffered_spans'], 0)
+
+    def test_record_spans(self):
+        memory = InMemoryRecorder()
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(memory)
+        self.finish_traces(20)
+        self.assertEqual(self.recorder.record_spans(memory.get_spans()), 0)
+        self.assertTrue(self.recorder.flush())
+        owners = {}
+        for index, collector in enumerate(self.collectors):
+            for span in collector.spans():
+                self.assertEqual(owners.setdefault(span.trace_id, index),
+                                 index)
+        self.assertEqual(len(owners), 20)
+        self.assertEqual(self.recorder.metrics.spans_sent.value(), 60)
+
+    def spool_traces(self, directory, n):
+        recorder = zipkin_ot.recorder.Recorder(
+            collector_host='localhost', collector_port=1,
+            periodic_flush_seconds=0, spool_dir=directory)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        self.finish_traces(n)
+        self.assertEqual(recorder.shutdown(flush=False).spooled, 3 * n)
+
+    def test_resend_spooled_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.spool_traces(directory, 60)
+        recorder = ShardedRecorder(
+            ['%s:%d' % (c.host, c.port) for c in self.collectors],
+            periodic_flush_seconds=0, spool_dir=directory)
+        self.collectors[0].outage = True
+        # Every shard's flush thread asks for the resend when it starts.
+        sent = sum(shard.resend_spooled() for shard in recorder.shards)
+        spans = 0
+        for index, collector in enumerate(self.collectors):
+            for span in collector.spans():
+                self.assertEqual(recorder.ring.index_for(span.trace_id),
+                                 index)
+                spans += 1
+        self.assertEqual(spans, sent)
+        self.assertEqual(recorder.metrics.spans_sent.value(), sent)
+        # What the collector which was out got is spooled again.
+        names = os.listdir(directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith(constants.SPOOL_FILE_SUFFIX))
+        with open(os.path.join(directory, names[0]), 'rb') as f:
+            self.assertEqual(list_length(f.read()), 180 - sent)
+        recorder.shutdown(flush=False)
+
+    def test_one_exit_hook(self):
+        registered = []
+        original = atexit.register
+        atexit.register = registered.append
+        try:
+            recorder = ShardedRecorder(['localhost:1', 'localhost:2'],
+                                       periodic_flush_seconds=0)
+        finally:
+            atexit.register = original
+        self.assertEqual(registered, [recorder.shutdown])
+        recorder.shutdown(flush=False)
+
+    def test_transport_closed_at_exit(self):
+        directory = tempfile.mkdtemp()
+        script = '\n'.join([
+            'import warnings',
+            'warnings.simplefilter("ignore")',
+            'import zipkin_ot.tracer',
+            'from zipkin_ot.file_transport import FileTransport',
+            'tracer = zipkin_ot.tracer.Tracer(',
+            '    collectors=["localhost:1", "localhost:2"],',
+            '    periodic_flush_seconds=0,',
+            '    transport=FileTransport(%r))' % directory,
+            'for i in range(10):',
+            '    tracer.start_span(str(i)).finish()',
+        ])
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        try:
+            self.assertEqual(subprocess.call([sys.executable, '-c', script],
+                                             env=env), 0)
+            names = os.listdir(directory)
+            self.assertTrue(names)
+            self.assertFalse([n for n in names if n.endswith('.active')])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_fail_over(self):
+        down = self.collectors[0]
+        down.outage = True
+        self.finish_traces(60)
+        shard = self.recorder.shards[0]
+        buffered = len(shard._span_records)
+        self.assertTrue(buffered > 0)
+
+        self.assertFalse(self.recorder.flush())
+        self.assertTrue(shard.healthy())
+        self.assertFalse(self.recorder.flush())
+        # The second failure takes the collector down, and its spans move
+        # on to the others.
+        self.assertFalse(shard.healthy())
+        self.assertEqual(len(shard._span_records), 0)
+        self.assertEqual(
+            self.recorder.metrics.spans_failed_over.value(), buffered)
+        self.assertEqual(self.recorder.metrics.shards_down.value(), 1)
+
+        self.finish_traces(30)
+        self.assertEqual(len(shard._span_records), 0)
+        self.assertTrue(self.recorder.flush())
+        received = sum(len(c.spans()) for c in self.collectors)
+        self.assertEqual(received, 270)
+        self.assertEqual(len(down.spans()), 0)
+
+    def test_recovery(self):
+        self.collectors[0].outage = True
+        self.finish_traces(30)
+        self.recorder.flush()
+        self.recorder.flush()
+        shard = self.recorder.shards[0]
+        self.assertFalse(shard.healthy())
+
+        self.collectors[0].outage = False
+        shard.down_until = 1  # The retry period is over.
+        self.assertTrue(shard.healthy())
+        self.finish_traces(30)
+        self.assertTrue(len(shard._span_records) > 0)
+        self.assertTrue(self.recorder.flush())
+        self.assertEqual(shard.failures, 0)
+        self.assertTrue(len(self.collectors[0].spans()) > 0)
+
+    def test_tracer_option(self):
+        tracer = zipkin_ot.tracer.Tracer(
+            collectors=['localhost:9411', 'localhost:9412'],
+            periodic_flush_seconds=0)
+        self.assertTrue(isinstance(tracer.recorder, ShardedRecorder))
+        self.assertEqual(len(tracer.recorder.shards), 2)
+        tracer.recorder.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
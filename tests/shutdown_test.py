@@ -0,0 +1,166 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import constants
+from zipkin_ot.mock_collector import MockCollector
+
+
+class ShutdownTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.collector = MockCollector().start()
+        self.collector.keep_spans = True
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.collector.stop()
+        shutil.rmtree(self.spool_dir)
+
+    def create_recorder(self, **kwargs):
+        return zipkin_ot.recorder.Recorder(
+            service_name='python/shutdown_test',
+            collector_host=self.collector.host,
+            collector_port=self.collector.port,
+            periodic_flush_seconds=0,
+            **kwargs)
+
+    def finish_spans(self, recorder, n):
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        for i in range(n):
+            tracer.start_span(str(i)).finish()
+
+    def test_flush(self):
+        recorder = self.create_recorder()
+        self.finish_spans(recorder, 10)
+        report = recorder.shutdown()
+        self.assertTrue(report)
+        self.assertEqual((report.sent, report.spooled, report.dropped),
+                         (10, 0, 0))
+        self.assertEqual(len(self.collector.spans()), 10)
+
+        # Intake has stopped.
+        self.finish_spans(recorder, 1)
+        self.assertEqual(recorder.metrics.buffered_spans.value(), 0)
+        self.assertFalse(recorder.shutdown())
+
+    def test_no_flush(self):
+        recorder = self.create_recorder()
+        self.finish_spans(recorder, 3)
+        report = recorder.shutdown(flush=False)
+        self.assertFalse(report)
+        self.assertEqual(report.dropped, 3)
+        self.assertEqual(
+            recorder.metrics.spans_shutdown_dropped.value(), 3)
+        self.assertEqual(self.collector.stats()['collector_requests_total'], 0)
+
+    def test_no_spans(self):
+        recorder = self.create_recorder()
+        self.assertTrue(recorder.shutdown(flush=False))
+
+    def test_deadline(self):
+        self.collector.latency = 2.0
+        recorder = self.create_recorder()
+        self.finish_spans(recorder, 5)
+        start = time.time()
+        report = recorder.shutdown(timeout=0.3)
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertFalse(report)
+        self.assertEqual((report.sent, report.dropped), (0, 5))
+
+    def test_deadline_at_exit(self):
+        script = '\n'.join([
+            'import warnings',
+            'warnings.simplefilter("ignore")',
+            'import zipkin_ot.recorder, zipkin_ot.tracer',
+            'recorder = zipkin_ot.recorder.Recorder(',
+            '    collector_host=%r, collector_port=%d,' % (
+                self.collector.host, self.collector.port),
+            '    periodic_flush_seconds=0, shutdown_timeout=0.3)',
+            'tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)',
+            'for i in range(5):',
+            '    tracer.start_span(str(i)).finish()',
+        ])
+        self.collector.latency = 2.0
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        process = subprocess.Popen([sys.executable, '-c', script], env=env,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        _, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0)
+        # No shutdown thread was left running into interpreter teardown.
+        self.assertEqual(stderr.decode('utf-8'), '')
+
+    def test_parallel_batches(self):
+        self.collector.latency = 0.3
+        recorder = self.create_recorder()
+        self.finish_spans(recorder, 8)
+        frame_size = len(recorder._encode_frames(recorder._span_records[:1])[0])
+        recorder._max_batch_bytes = 5 + 2 * frame_size
+
+        start = time.time()
+        report = recorder.shutdown(timeout=5)
+        elapsed = time.time() - start
+        self.assertTrue(report)
+        self.assertEqual(report.sent, 8)
+        self.assertEqual(self.collector.stats()['collector_requests_total'],
+                         4)
+        # Four batches of 0.3s each, sent side by side.
+        self.assertTrue(elapsed < 1.0, elapsed)
+
+    def test_spool_and_resend(self):
+        self.collector.outage = True
+        recorder = self.create_recorder(spool_dir=self.spool_dir)
+        self.finish_spans(recorder, 6)
+        report = recorder.shutdown(timeout=2)
+        self.assertFalse(report)
+        self.assertEqual((report.sent, report.spooled, report.dropped),
+                         (0, 6, 0))
+        names = os.listdir(self.spool_dir)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith(constants.SPOOL_FILE_PREFIX))
+
+        # The next process sends them.
+        self.collector.outage = False
+        recorder = self.create_recorder(spool_dir=self.spool_dir)
+        self.assertEqual(recorder.resend_spooled(), 6)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.assertEqual(sorted(s.name for s in self.collector.spans()),
+                         [str(i) for i in range(6)])
+        self.assertTrue(recorder.shutdown())
+
+    def test_resend_claims_files(self):
+        self.collector.outage = True
+        for _ in range(2):
+            recorder = self.create_recorder(spool_dir=self.spool_dir)
+            self.finish_spans(recorder, 3)
+            recorder.shutdown(timeout=1)
+        # Spooled in the same microsecond or not, the files are distinct.
+        self.assertEqual(len(os.listdir(self.spool_dir)), 2)
+
+        self.collector.outage = False
+        first = self.create_recorder(spool_dir=self.spool_dir)
+        second = self.create_recorder(spool_dir=self.spool_dir)
+        claims = first._claim_spooled()
+        path, claimed = next(claims)
+        # A file being resent is left alone by other recorders.
+        self.assertEqual(second.resend_spooled(), 3)
+        first._release_spooled(path, claimed)
+        self.assertEqual(first.resend_spooled(), 3)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.assertEqual(len(self.collector.spans()), 6)
+        first.shutdown()
+        second.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
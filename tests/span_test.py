@@ -0,0 +1,66 @@
+import unittest
+
+import zipkin_ot.constants
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot.span import truncate_log
+from zipkin_ot.util import encode_utf8
+
+
+class ZipkinSpanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = zipkin_ot.recorder.Recorder(
+            service_name='python/span_test',
+            periodic_flush_seconds=0,
+            max_logs_per_span=3,
+            max_log_bytes_per_span=100)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+
+    def test_log_count_limit(self):
+        span = self.tracer.start_span('count')
+        for i in range(10):
+            span.log_event('event', i)
+        self.assertEqual(len(span.logs), 3)
+        self.assertEqual(span.dropped_logs, 7)
+
+    def test_log_bytes_limit(self):
+        span = self.tracer.start_span('bytes')
+        span.log_event('e' * 60)
+        span.log_event('e' * 60)
+        span.log_event('e' * 10, 'p' * 10)
+        self.assertEqual(len(span.logs), 2)
+        self.assertEqual(span.log_bytes, 80)
+        self.assertEqual(span.dropped_logs, 1)
+
+    def test_log_truncation(self):
+        self.recorder.max_log_bytes_per_span = 10000
+        span = zipkin_ot.tracer._OpenZipkinTracer(self.recorder).start_span('x')
+        span.log_event(u'\u200b' * 1000, {'big': 'p' * 2000})
+        log = span.logs[0].key_values
+        self.assertEqual(len(encode_utf8(log['event'])),
+                         zipkin_ot.constants.MAX_LOG_LEN)
+        self.assertEqual(len(encode_utf8(log['payload'])),
+                         zipkin_ot.constants.MAX_LOG_LEN)
+        self.assertEqual(span.log_bytes, 2 * zipkin_ot.constants.MAX_LOG_LEN)
+
+    def test_log_truncation_keeps_characters_whole(self):
+        event, payload, size = truncate_log(
+            {'event': u'x' + u'\u200b' * 1000, 'payload': u'\u00e9' * 1000})
+        # 'x' and 327 three-byte characters; the next one would not fit.
+        self.assertEqual(encode_utf8(event), (u'x' + u'\u200b' * 327).encode(
+            'utf-8'))
+        self.assertEqual(encode_utf8(payload), (u'\u00e9' * 492).encode(
+            'utf-8'))
+        self.assertEqual(size, 982 + 984)
+
+    def test_child_context(self):
+        parent = self.tracer.start_span('parent')
+        child = self.tracer.start_span('child', child_of=parent)
+        self.assertEqual(child.context.trace_id, parent.context.trace_id)
+        self.assertEqual(child.context.parent_id, parent.context.span_id)
+        self.assertEqual(child.parent_id, parent.context.span_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
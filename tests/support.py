@@ -0,0 +1,40 @@
+"""
+Fixtures shared by the tests and the benchmarks.
+
+MockConnection stands in for the recorder's requests session, for tests
+which need no HTTP round trip:
+
+    recorder = Recorder(periodic_flush_seconds=0)
+    connection = MockConnection()
+    recorder.flush(connection)
+    spans = spans_from_list_bytes(connection.bodies[0])
+"""
+
+
+class MockConnection(object):
+    """A connection for Recorder.flush, answering every post successfully.
+
+    :param bool keep_bodies: keep the bodies posted in `bodies`; when False
+        only `posts` and `bytes` are counted, as the benchmarks do.
+    """
+
+    status_code = 200
+
+    def __init__(self, keep_bodies=True):
+        self.keep_bodies = keep_bodies
+        self.bodies = []
+        self.posts = 0
+        self.bytes = 0
+
+    def post(self, url, data, headers):
+        self.posts += 1
+        self.bytes += len(data)
+        if self.keep_bodies:
+            self.bodies.append(data)
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def clear(self):
+        self.bodies = []
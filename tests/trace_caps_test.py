@@ -0,0 +1,66 @@
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import constants
+from zipkin_ot.thrift import spans_from_list_bytes
+from zipkin_ot.trace_caps import TraceSpanCounter
+
+from tests.support import MockConnection
+
+
+class TraceSpanCounterTest(unittest.TestCase):
+
+    def test_counts(self):
+        counter = TraceSpanCounter(max_spans=10, max_traces=100)
+        self.assertEqual([counter.add(1) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(counter.add(2), 1)
+
+    def test_bounded(self):
+        counter = TraceSpanCounter(max_spans=10, max_traces=4)
+        counter.add('old')
+        counter.add('old')
+        for trace_id in range(1, 4):
+            counter.add(trace_id)
+            self.assertTrue(len(counter) <= 4)
+        # 'old' survived one generation; its count carries over.
+        self.assertEqual(counter.add('old'), 3)
+        for trace_id in range(4, 10):
+            counter.add(trace_id)
+        self.assertTrue(len(counter) <= 4)
+        self.assertEqual(counter.add(1), 1)
+
+
+class RecorderTraceCapsTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+    def test_runaway_trace_capped(self):
+        recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0,
+            max_spans_per_trace=5)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        with tracer.start_span('runaway') as root:
+            for i in range(20):
+                tracer.start_span('item', child_of=root).finish()
+        with tracer.start_span('other') as other:
+            tracer.start_span('child', child_of=other).finish()
+
+        self.assertEqual(recorder.metrics.spans_capped.value(), 16)
+        connection = MockConnection()
+        self.assertTrue(recorder.flush(connection))
+        spans = spans_from_list_bytes(connection.bodies[0])
+        self.assertEqual([s.name for s in spans],
+                         ['item'] * 5 + ['child', 'other'])
+        markers = [[b.value for b in s.binary_annotations
+                    if b.key == constants.TRACE_TRUNCATED_KEY]
+                   for s in spans]
+        self.assertEqual(markers[4], [b'5'])
+        self.assertEqual(sum(len(m) for m in markers), 1)
+        recorder.shutdown(flush=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
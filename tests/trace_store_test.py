@@ -0,0 +1,123 @@
+import json
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import constants
+from zipkin_ot.thrift import create_endpoint, create_span, span_frame
+from zipkin_ot.trace_store import TraceStore
+
+
+def frame(trace_id, span_id, name='op'):
+    return span_frame(create_span(
+        '%x' % span_id, None, '%x' % trace_id, name, [], []))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TraceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_lookup(self):
+        store = TraceStore(1 << 20, clock=self.clock)
+        big_id = 0xb6dbb1c2b362bf51
+        store.add(frame(big_id, 1, 'a'))
+        store.add(frame(2, 2))
+        store.add(frame(big_id, 3, 'b'))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.trace_ids(), [big_id, 2])
+        self.assertEqual([s.name for s in store.spans(big_id)], ['a', 'b'])
+        self.assertEqual(len(store.frames('b6dbb1c2b362bf51')), 2)
+        self.assertEqual(store.frames(3), [])
+        self.assertIsNone(store.thrift(3))
+        self.assertIsNone(store.json(3))
+
+    def test_byte_cap(self):
+        cost = len(frame(1, 1)) + constants.TRACE_STORE_SPAN_OVERHEAD_BYTES
+        store = TraceStore(3 * cost, clock=self.clock)
+        store.add(frame(1, 1))
+        store.add(frame(2, 2))
+        store.add(frame(1, 3))
+        # Trace 2 is the least recently updated one.
+        store.add(frame(3, 4))
+        self.assertEqual(sorted(store.trace_ids()), [1, 3])
+        self.assertTrue(store.memory() <= 3 * cost)
+        # A single trace over the cap keeps its newest spans.
+        for span_id in range(10, 20):
+            store.add(frame(4, span_id))
+        self.assertEqual(store.trace_ids(), [4])
+        self.assertEqual([s.id for s in store.spans(4)], [17, 18, 19])
+        self.assertEqual(store.memory(), 3 * cost)
+
+    def test_age_cap(self):
+        store = TraceStore(1 << 20, max_age_seconds=10, clock=self.clock)
+        store.add(frame(1, 1))
+        self.clock.now += 6
+        store.add(frame(2, 2))
+        self.clock.now += 6
+        self.assertEqual(store.frames(1), [])
+        self.assertEqual(store.trace_ids(), [2])
+        self.clock.now += 6
+        self.assertEqual(store.trace_ids(), [])
+        self.assertEqual(store.memory(), 0)
+
+    def test_json(self):
+        store = TraceStore(1 << 20, clock=self.clock)
+        host = create_endpoint(8080, 'svc', host='10.0.0.1')
+        from zipkin_ot.thrift import (annotation_list_builder,
+                                      binary_annotation_list_builder)
+        store.add(span_frame(create_span(
+            '2', '1', 'b6dbb1c2b362bf51', 'get',
+            annotation_list_builder({'sr': 1.5}, host),
+            binary_annotation_list_builder({'http.path': '/x'}, host))))
+        span, = json.loads(store.json(0xb6dbb1c2b362bf51))
+        endpoint = {'serviceName': 'svc', 'ipv4': '10.0.0.1', 'port': 8080}
+        self.assertEqual(span, {
+            'traceId': 'b6dbb1c2b362bf51',
+            'id': '0000000000000002',
+            'parentId': '0000000000000001',
+            'name': 'get',
+            'annotations': [{'timestamp': 1500000, 'value': 'sr',
+                             'endpoint': endpoint}],
+            'binaryAnnotations': [{'key': 'http.path', 'value': '/x',
+                                   'endpoint': endpoint}],
+        })
+
+
+class RecorderTraceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+
+    def test_disabled_by_default(self):
+        recorder = zipkin_ot.recorder.Recorder(periodic_flush_seconds=0)
+        self.assertIsNone(recorder.trace_store)
+        recorder.shutdown(flush=False)
+
+    def test_record_span(self):
+        recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0,
+            trace_store_bytes=1 << 20)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        with tracer.start_span('root') as root:
+            tracer.start_span('child', child_of=root).finish()
+        spans = recorder.trace_store.spans(root.context.trace_id)
+        self.assertEqual([s.name for s in spans], ['child', 'root'])
+        # The buffer holds the same frames.
+        self.assertEqual(recorder._span_records,
+                         recorder.trace_store.frames(root.context.trace_id))
+        recorder.shutdown(flush=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
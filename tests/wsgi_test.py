@@ -0,0 +1,200 @@
+import unittest
+import warnings
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from basictracer.recorder import Sampler
+from opentracing import Span
+from zipkin_ot.thrift import spans_from_list_bytes
+from zipkin_ot.wsgi import ZipkinMiddleware
+
+from tests.support import MockConnection
+
+
+class NeverSampler(Sampler):
+
+    def sampled(self, trace_id):
+        return False
+
+
+class Response(list):
+
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class WSGIMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.recorder = zipkin_ot.recorder.Recorder(
+            service_name='svc', periodic_flush_seconds=0)
+        self.tracer = zipkin_ot.tracer._OpenZipkinTracer(self.recorder)
+        self.active = []
+        self.status = '200 OK'
+
+    def tearDown(self):
+        self.recorder.shutdown(flush=False)
+
+    def app(self, environ, start_response):
+        self.active.append(self.tracer.active_span)
+        start_response(self.status, [('Content-Type', 'text/plain')])
+        self.response = Response([b'hello'])
+        return self.response
+
+    def call(self, middleware, **headers):
+        environ = {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '/app',
+                   'PATH_INFO': '/items'}
+        environ.update(headers)
+        statuses = []
+        response = middleware(
+            environ, lambda status, headers, exc_info=None:
+            statuses.append(status))
+        body = b''.join(response)
+        if hasattr(response, 'close'):
+            response.close()
+        return statuses, body
+
+    def flushed(self):
+        connection = MockConnection()
+        self.assertTrue(self.recorder.flush(connection))
+        return [span for body in connection.bodies
+                for span in spans_from_list_bytes(body)]
+
+    def test_root_span(self):
+        self.status = '503 Service Unavailable'
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.assertEqual(self.call(middleware),
+                         (['503 Service Unavailable'], b'hello'))
+        self.assertTrue(self.response.closed)
+        self.assertTrue(self.active[0] is not None)
+        self.assertTrue(self.tracer.active_span is None)
+
+        span, = self.flushed()
+        self.assertEqual(span.name, 'GET')
+        self.assertEqual(span.parent_id, None)
+        self.assertEqual(sorted(a.value for a in span.annotations),
+                         ['sr', 'ss'])
+        tags = dict((b.key, b.value) for b in span.binary_annotations)
+        self.assertEqual(tags['http.method'], b'GET')
+        self.assertEqual(tags['http.path'], b'/app/items')
+        self.assertEqual(tags['http.status_code'], b'503')
+        self.assertEqual(tags['span.kind'], b'server')
+        self.assertEqual(tags['error'], b'True')
+
+    def test_joins_caller_trace(self):
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='1', HTTP_OT_BAGGAGE_USER_ID='7')
+        self.assertEqual(self.active[0].context.baggage, {'user-id': '7'})
+        span, = self.flushed()
+        self.assertEqual((span.trace_id, span.parent_id), (0x1f, 0x2a))
+
+    def test_corrupted_context_starts_trace(self):
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.call(middleware, HTTP_X_B3_TRACEID='zz', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='1')
+        span, = self.flushed()
+        self.assertEqual(span.parent_id, None)
+
+    def test_unsampled_passed_through(self):
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='0')
+        self.tracer.sampler = NeverSampler()
+        self.assertEqual(self.call(middleware), (['200 OK'], b'hello'))
+        self.assertEqual([type(span) for span in self.active],
+                         [Span, Span])
+        self.assertEqual(self.active[0].context.trace_id, 0x1f)
+        self.assertTrue(self.tracer.active_span is None)
+        self.assertEqual(self.flushed(), [])
+
+    def test_unsampled_children_not_recorded(self):
+        children = []
+
+        def app(environ, start_response):
+            child = self.tracer.start_span('db.query')
+            child.finish()
+            children.append(child)
+            return self.app(environ, start_response)
+
+        middleware = ZipkinMiddleware(app, self.tracer)
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='0')
+        self.tracer.sampler = NeverSampler()
+        self.call(middleware)
+        for child in children:
+            self.assertFalse(child.context.sampled)
+            self.assertTrue(child.parent_id is not None)
+        self.assertEqual(children[0].context.trace_id, 0x1f)
+        self.assertEqual(self.flushed(), [])
+
+    def test_new_unsampled_traces_share_a_span(self):
+        self.tracer.sampler = NeverSampler()
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.call(middleware)
+        self.call(middleware)
+        self.assertTrue(self.active[0] is middleware._unsampled_span)
+        self.assertTrue(self.active[1] is middleware._unsampled_span)
+        self.assertTrue(self.tracer.active_span is None)
+
+    def test_deferred_sampling_joins_caller_trace(self):
+        middleware = ZipkinMiddleware(self.app, self.tracer)
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a')
+        span, = self.flushed()
+        self.assertEqual((span.trace_id, span.parent_id), (0x1f, 0x2a))
+
+        self.tracer.sampler = NeverSampler()
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a')
+        self.assertEqual(self.active[1].context.trace_id, 0x1f)
+        self.assertFalse(self.active[1].context.sampled)
+        self.assertEqual(self.flushed(), [])
+
+    def test_streamed_body_keeps_parent(self):
+        children = []
+
+        def body():
+            child = self.tracer.start_span('render')
+            child.finish()
+            children.append(child)
+            yield b'hello'
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            return body()
+
+        middleware = ZipkinMiddleware(app, self.tracer)
+        self.assertEqual(self.call(middleware), (['200 OK'], b'hello'))
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='0')
+        self.assertTrue(self.tracer.active_span is None)
+        server = [s for s in self.flushed() if s.name == 'GET']
+        self.assertEqual(children[0].parent_id, server[0].id & (2 ** 64 - 1))
+        self.assertEqual(children[1].context.trace_id, 0x1f)
+        self.assertFalse(children[1].context.sampled)
+
+    def test_trace_unsampled(self):
+        middleware = ZipkinMiddleware(self.app, self.tracer,
+                                      trace_unsampled=True)
+        self.call(middleware, HTTP_X_B3_TRACEID='1f', HTTP_X_B3_SPANID='2a',
+                  HTTP_X_B3_SAMPLED='0')
+        self.assertEqual(self.active[0].context.trace_id, 0x1f)
+        self.assertFalse(self.active[0].context.sampled)
+        self.assertEqual(self.flushed(), [])
+
+    def test_application_error(self):
+        def failing(environ, start_response):
+            raise ValueError()
+
+        middleware = ZipkinMiddleware(failing, self.tracer)
+        self.assertRaises(ValueError, self.call, middleware)
+        self.assertTrue(self.tracer.active_span is None)
+        span, = self.flushed()
+        tags = dict((b.key, b.value) for b in span.binary_annotations)
+        self.assertEqual(tags['error'], b'True')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from opentracing import Format, InvalidCarrierException
+from opentracing import SpanContextCorruptedException
+
+import zipkin_ot.recorder
+import zipkin_ot.tracer
+from zipkin_ot import util
+from zipkin_ot.context import SpanContext
+from zipkin_ot.thrift import span_to_json, spans_from_list_bytes
+from zipkin_ot.zipkin_propagator import ZipkinBinaryPropagator
+
+from tests.support import MockConnection
+
+
+class ZipkinBinaryPropagatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.propagator = ZipkinBinaryPropagator()
+
+    def round_trip(self, span_context):
+        carrier = bytearray()
+        self.propagator.inject(span_context, carrier)
+        return carrier, self.propagator.extract(carrier)
+
+    def test_round_trip_64_bit(self):
+        carrier, extracted = self.round_trip(SpanContext(
+            trace_id=0xb6dbb1c2b362bf51,
+            span_id=0x17133d482ba4f605,
+            parent_id=42,
+            sampled=True))
+        self.assertEqual(len(carrier), 2 + 24 + 2)
+        self.assertEqual(extracted.trace_id, 0xb6dbb1c2b362bf51)
+        self.assertEqual(extracted.span_id, 0x17133d482ba4f605)
+        self.assertEqual(extracted.parent_id, 42)
+        self.assertTrue(extracted.sampled)
+        self.assertFalse(extracted.debug)
+        self.assertEqual(extracted.baggage, {})
+
+    def test_round_trip_128_bit(self):
+        trace_id = (0x463ac35c9f6413ad << 64) | 0x48485a3953bb6124
+        carrier, extracted = self.round_trip(SpanContext(
+            trace_id=trace_id, span_id=7, sampled=False, debug=True))
+        self.assertEqual(len(carrier), 2 + 32 + 2)
+        self.assertEqual(extracted.trace_id, trace_id)
+        self.assertIsNone(extracted.parent_id)
+        self.assertFalse(extracted.sampled)
+        self.assertTrue(extracted.debug)
+
+    def test_128_bit_trace_recorded(self):
+        trace_id = (0x463ac35c9f6413ad << 64) | 0xb6dbb1c2b362bf51
+        carrier, _ = self.round_trip(SpanContext(
+            trace_id=trace_id, span_id=7, sampled=True))
+        recorder = zipkin_ot.recorder.Recorder(periodic_flush_seconds=0)
+        tracer = zipkin_ot.tracer._OpenZipkinTracer(recorder)
+        parent = tracer.extract(Format.BINARY, carrier)
+        tracer.start_span('child', child_of=parent).finish()
+        connection = MockConnection()
+        self.assertTrue(recorder.flush(connection))
+        recorder.shutdown(flush=False)
+        span, = spans_from_list_bytes(connection.bodies[0])
+        self.assertEqual(span.trace_id, util.unsigned_hex_to_signed_int(
+            'b6dbb1c2b362bf51'))
+        self.assertEqual(span.trace_id_high, 0x463ac35c9f6413ad)
+        self.assertEqual(span.parent_id, 7)
+        self.assertEqual(span_to_json(span)['traceId'],
+                         '463ac35c9f6413adb6dbb1c2b362bf51')
+
+    def test_round_trip_baggage(self):
+        _, extracted = self.round_trip(SpanContext(
+            trace_id=1, span_id=2,
+            baggage={'user': 'bender', 'unicode': u'\u200b'}))
+        # UTF-8 on the wire; native strings (bytes on Python 2) out.
+        self.assertEqual(extracted.baggage, {
+            'user': 'bender',
+            'unicode': util.decode_utf8(u'\u200b'.encode('utf-8'))})
+
+    def test_invalid_carrier(self):
+        with self.assertRaises(InvalidCarrierException):
+            self.propagator.inject(SpanContext(trace_id=1, span_id=2), {})
+        with self.assertRaises(InvalidCarrierException):
+            self.propagator.extract('not a bytearray')
+
+    def test_corrupted_carrier(self):
+        carrier, _ = self.round_trip(SpanContext(
+            trace_id=1, span_id=2, baggage={'key': 'value'}))
+        for truncated in (bytearray(), carrier[:10], carrier[:-1]):
+            with self.assertRaises(SpanContextCorruptedException):
+                self.propagator.extract(truncated)
+
+        carrier[0] = 99
+        with self.assertRaises(SpanContextCorruptedException):
+            self.propagator.extract(carrier)
+
+
+if __name__ == '__main__':
+    unittest.main()
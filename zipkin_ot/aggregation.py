@@ -0,0 +1,131 @@
+"""
+Rate, errors and duration (RED) of finished spans, aggregated in process.
+
+A Recorder with red_metrics enabled folds every finished span, sampled or
+not, into a latency histogram per (operation, error) before sampling and
+buffering, so the aggregates stay exact however aggressively traces are
+sampled. They can be read with snapshot() or exposition(), or handed to a
+callback in compact form from the flush thread (see Recorder's red_handler).
+"""
+from __future__ import absolute_import
+
+import threading
+
+from . import constants, metrics
+
+
+class REDAggregator(object):
+    """Per-(operation, error) span counts and latency histograms.
+
+    :param str service_name: service reported with every series.
+    :param buckets: upper bounds of the latency buckets, in seconds.
+    :param int max_series: series kept; spans of further operations are
+        aggregated under constants.RED_OTHER_OPERATION.
+    """
+
+    def __init__(self, service_name, buckets=metrics.DEFAULT_LATENCY_BUCKETS,
+                 max_series=constants.RED_MAX_SERIES):
+        self.service_name = service_name
+        self.buckets = tuple(buckets)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+        self._collected = {}
+
+    def observe(self, operation, error, seconds):
+        key = (operation, error)
+        histogram = self._series.get(key)
+        if histogram is None:
+            histogram = self._add(key)
+        histogram.observe(seconds)
+
+    def _add(self, key):
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                if len(self._series) >= self.max_series:
+                    key = (constants.RED_OTHER_OPERATION, key[1])
+                    histogram = self._series.get(key)
+                if histogram is None:
+                    histogram = metrics.Histogram(
+                        'span_duration_seconds', buckets=self.buckets)
+                    # Copy on write: observe() reads without the lock.
+                    series = dict(self._series)
+                    series[key] = histogram
+                    self._series = series
+            return histogram
+
+    def snapshot(self):
+        """Returns one dict per series, with the service, operation and
+        error labels, the span count, the sum of the durations and the
+        (non-cumulative) count per bucket, aligned with buckets + (+Inf,).
+        """
+        bounds = self.buckets + (float('inf'),)
+        result = []
+        for (operation, error), histogram in sorted(
+                self._series.items(), key=lambda item: str(item[0])):
+            value = histogram.value()
+            result.append({
+                'service': self.service_name,
+                'operation': operation,
+                'error': error,
+                'count': value['count'],
+                'sum': value['sum'],
+                'buckets': [value['buckets'][bound] for bound in bounds],
+            })
+        return result
+
+    def collect(self):
+        """Returns the snapshot() series which changed since the previous
+        collect(), with counts relative to it.
+        """
+        with self._lock:
+            changed = []
+            collected = {}
+            for series in self.snapshot():
+                key = (series['operation'], series['error'])
+                collected[key] = series
+                previous = self._collected.get(key)
+                if previous is None:
+                    changed.append(series)
+                elif series['count'] != previous['count']:
+                    changed.append(dict(
+                        series,
+                        count=series['count'] - previous['count'],
+                        sum=series['sum'] - previous['sum'],
+                        buckets=[now - before for now, before in zip(
+                            series['buckets'], previous['buckets'])]))
+            self._collected = collected
+            return changed
+
+    def quantile(self, operation, q, error=False):
+        """Estimates the q-quantile of an operation's latency; see
+        metrics.Histogram.quantile.
+        """
+        histogram = self._series.get((operation, error))
+        return None if histogram is None else histogram.quantile(q)
+
+    def exposition(self):
+        """Returns the series in the Prometheus plain-text format."""
+        name = metrics.EXPOSITION_PREFIX + 'span_duration_seconds'
+        lines = ['# HELP %s Duration of finished spans.' % name,
+                 '# TYPE %s histogram' % name]
+        bounds = self.buckets + (float('inf'),)
+        for series in self.snapshot():
+            labels = 'service="%s",operation="%s",error="%s"' % (
+                _escape(series['service']), _escape(series['operation']),
+                'true' if series['error'] else 'false')
+            cumulative = 0
+            for bound, count in zip(bounds, series['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, le, cumulative))
+            lines.append('%s_sum{%s} %r' % (name, labels, series['sum']))
+            lines.append('%s_count{%s} %d' % (name, labels, series['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
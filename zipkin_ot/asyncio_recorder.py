@@ -0,0 +1,312 @@
+"""
+An asyncio-native Recorder (Python 3.7+).
+
+AsyncioRecorder flushes as a task on the running event loop and POSTs to the
+collector with a small HTTP client built on asyncio streams, so it never
+starts a thread. Only batches of executor_threshold spans or more are encoded
+in an executor, to keep the loop responsive.
+
+    tracer = AsyncioTracer(service_name='my-service')
+    ...
+    await tracer.flush()
+    report = await tracer.recorder.shutdown()
+"""
+import asyncio
+import atexit
+import functools
+import traceback
+from urllib.parse import urlsplit
+
+from . import constants, metrics
+from .recorder import Recorder, ShutdownReport
+from .thrift import frames_in_list_bytes
+from .tracer import _OpenZipkinTracer, _pop_baggage_limits
+
+
+class HTTPError(IOError):
+    """The collector answered with an error status."""
+
+    def __init__(self, status):
+        super(HTTPError, self).__init__('collector returned HTTP %d' % status)
+        self.status = status
+
+
+async def post(url, data, headers=None,
+               timeout=constants.ASYNC_POST_TIMEOUT_SECS):
+    """POSTs data to an http:// url over a fresh connection.
+
+    Returns the response status; raises HTTPError for 4xx/5xx statuses and
+    asyncio.TimeoutError if the exchange takes longer than timeout seconds.
+    """
+    return await asyncio.wait_for(_post(url, data, headers or {}), timeout)
+
+
+async def _post(url, data, headers):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or 80)
+    try:
+        head = ['POST %s HTTP/1.1' % path,
+                'Host: %s' % parts.netloc,
+                'Content-Length: %d' % len(data),
+                'Connection: close']
+        head.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(data)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise IOError('malformed HTTP response: %r' % status_line)
+        # Headers and body are not needed; the connection is closed below.
+    finally:
+        writer.close()
+    if status >= 400:
+        raise HTTPError(status)
+    return status
+
+
+class AsyncioRecorder(Recorder):
+    """A Recorder which reports from the asyncio event loop.
+
+    Takes the Recorder arguments, plus:
+
+    :param loop: event loop to flush on; defaults to the running loop.
+    :param int executor_threshold: batches of at least this many spans are
+        encoded in the loop's default executor.
+    :param float post_timeout: seconds allowed for each collector POST.
+
+    flush() and shutdown() return awaitables. The periodic flush task starts
+    with the first span recorded while the loop is running.
+    """
+
+    def __init__(self,
+                 loop=None,
+                 executor_threshold=constants.ASYNC_EXECUTOR_THRESHOLD,
+                 post_timeout=constants.ASYNC_POST_TIMEOUT_SECS,
+                 **kwargs):
+        super(AsyncioRecorder, self).__init__(**kwargs)
+        # shutdown() is a coroutine here; the caller has to await it.
+        atexit.unregister(self.shutdown)
+        self._loop = loop
+        self._executor_threshold = executor_threshold
+        self._post_timeout = post_timeout
+        self._flush_task = None
+
+    def _get_loop(self):
+        if self._loop is not None:
+            return self._loop
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.get_event_loop()
+
+    def _maybe_init_flush_thread(self):
+        """Starts the periodic flush task, if the loop is running."""
+        if self._periodic_flush_seconds <= 0 or self._flush_task is not None:
+            return
+        loop = self._get_loop()
+        if loop.is_running():
+            self._flush_task = loop.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while not self._disabled_runtime:
+            await asyncio.sleep(self._periodic_flush_seconds)
+            await self._flush_worker()
+            if (self._red_handler is not None and
+                    metrics.clock() >= self._next_red_report):
+                self._report_red()
+
+    def flush(self, connection=None):
+        """Schedules a flush on the loop.
+
+        Returns a Task resolving to whether the data was flushed. If given,
+        connection.post(url=, data=, headers=) must be a coroutine returning
+        the HTTP status.
+        """
+        loop = self._get_loop()
+        if self._disabled_runtime:
+            return _done(loop, False)
+        self._maybe_init_flush_thread()
+        return loop.create_task(self._flush_worker(connection))
+
+    def shutdown(self, flush=True, timeout=None):
+        """Stops intake and the periodic flush task and, optionally, sends
+        the buffer, per Recorder.shutdown: in parallel batches until
+        timeout seconds (shutdown_timeout by default) have passed, spooling
+        or dropping what could not be sent.
+
+        Returns a Task resolving to a ShutdownReport.
+        """
+        loop = self._get_loop()
+        if self._disabled_runtime:
+            return _done(loop, ShutdownReport(flushed=False))
+        return loop.create_task(self._shutdown(flush, timeout))
+
+    async def _shutdown(self, flush, timeout):
+        if self._disabled_runtime:
+            return ShutdownReport(flushed=False)
+        start = metrics.clock()
+        deadline = start + (
+            self._shutdown_timeout if timeout is None else timeout)
+        flush_task, self._flush_task = self._flush_task, None
+        if flush_task is not None:
+            # A flush in progress puts its spans back when cancelled.
+            flush_task.cancel()
+            try:
+                await flush_task
+            except asyncio.CancelledError:
+                pass
+        self._disabled_runtime = True
+
+        span_records, _ = self._take_records()
+        report = ShutdownReport()
+        frames = None
+        if span_records and (flush or self._spool_dir):
+            try:
+                frames = await self._encode(span_records)
+            except Exception as e:
+                self._fine("Caught exception encoding spans at shutdown: "
+                           "%s, stack trace: %s", (e, traceback.format_exc()))
+
+        if frames is None:
+            report.dropped = len(span_records)
+        else:
+            unsent = await self._drain(frames, deadline) if flush else frames
+            report.sent = len(frames) - len(unsent)
+            if unsent and self._spool_dir:
+                # The disk is kept off the loop, as transports are.
+                report.spooled = await self._get_loop().run_in_executor(
+                    None, self._spool, unsent)
+            report.dropped = len(unsent) - report.spooled
+        self._close_transport()
+
+        self.metrics.spans_spooled.inc(report.spooled)
+        self.metrics.spans_shutdown_dropped.inc(report.dropped)
+        self._report_red()
+        report.flushed = not report.spooled and not report.dropped
+        report.seconds = metrics.clock() - start
+        self._finest("Shutdown: %r", (report,))
+        return report
+
+    async def _drain(self, frames, deadline):
+        """POSTs frames in parallel batches until deadline; returns the
+        frames which were not sent.
+        """
+        batches = list(self._batches(frames))
+        sent = [False] * len(batches)
+        workers = asyncio.Semaphore(constants.SHUTDOWN_MAX_WORKERS)
+
+        async def send(index):
+            async with workers:
+                body = frames_in_list_bytes(batches[index])
+                start = metrics.clock()
+                try:
+                    await self._post(body)
+                except Exception as e:
+                    self._fine("Caught exception during shutdown report: "
+                               "%s", (e,))
+                    self.metrics.flush_failures.inc()
+                    return
+                self._observe_post(len(batches[index]), len(body),
+                                   metrics.clock() - start)
+                sent[index] = True
+
+        remaining = deadline - metrics.clock()
+        if batches and remaining > 0:
+            loop = self._get_loop()
+            tasks = [loop.create_task(send(index))
+                     for index in range(len(batches))]
+            _, pending = await asyncio.wait(tasks, timeout=remaining)
+            for task in pending:
+                task.cancel()
+
+        unsent = []
+        for index, batch in enumerate(batches):
+            if not sent[index]:
+                unsent.extend(batch)
+        return unsent
+
+    async def _encode(self, span_records):
+        """Encodes span records into frames, in the executor for large
+        batches.
+        """
+        if len(span_records) >= self._executor_threshold:
+            return await self._get_loop().run_in_executor(
+                None, self._encode_frames, span_records)
+        return self._encode_frames(span_records)
+
+    async def _post(self, body, connection=None):
+        """POSTs a request body to the collector."""
+        headers = {'Content-Type': 'application/x-thrift'}
+        if connection:
+            await connection.post(
+                url=self._collector_url, data=body, headers=headers)
+        elif self._transport is not None:
+            # Transports block (on the disk, say): keep them off the loop.
+            await self._get_loop().run_in_executor(
+                None, functools.partial(
+                    self._transport.post, url=self._collector_url,
+                    data=body, headers=headers))
+        else:
+            await post(self._collector_url, body, headers,
+                       self._post_timeout)
+
+    async def _flush_worker(self, connection=None):
+        if not self._buffered_count():
+            return True
+
+        span_records, priority_count = self._take_records()
+
+        frames = None
+        sent = 0
+        try:
+            start = metrics.clock()
+            frames = await self._encode(span_records)
+            self._observe_encode(metrics.clock() - start)
+
+            for batch in self._batches(frames):
+                body = frames_in_list_bytes(batch)
+                start = metrics.clock()
+                await self._post(body, connection)
+                self._observe_post(
+                    len(batch), len(body), metrics.clock() - start)
+                sent += len(batch)
+            return True
+
+        except asyncio.CancelledError:
+            self._restore_frames(span_records, priority_count, frames, sent)
+            raise
+        except Exception as e:
+            self._fine("Caught exception during report: %s, stack "
+                       "trace: %s", (e, traceback.format_exc()))
+            self.metrics.flush_failures.inc()
+            self._restore_frames(span_records, priority_count, frames, sent)
+            return False
+
+
+def _done(loop, result):
+    future = loop.create_future()
+    future.set_result(result)
+    return future
+
+
+def AsyncioTracer(**kwargs):
+    """Instantiates OpenZipkin's OpenTracing implementation with an
+    AsyncioRecorder; see zipkin_ot.Tracer and AsyncioRecorder for the
+    arguments.
+    """
+    scope_manager = kwargs.pop('scope_manager', None)
+    sampler = kwargs.pop('sampler', None)
+    spans_per_second = kwargs.pop('spans_per_second', None)
+    baggage_limits = _pop_baggage_limits(kwargs)
+    recorder = AsyncioRecorder(**kwargs)
+    if spans_per_second is not None:
+        from .sampling import AdaptiveSampler
+        sampler = AdaptiveSampler(recorder, spans_per_second)
+    return _OpenZipkinTracer(recorder, scope_manager, sampler, baggage_limits)
@@ -0,0 +1,139 @@
+"""
+Immutable baggage, shared between span contexts.
+
+basictracer gives every child span its own copy of its parent's baggage
+dict. Here baggage is an immutable Baggage map instead: a child's context
+holds its parent's map as is, and only setting an item builds a new map
+(copy on write), so a deep trace with baggage set at its root carries a
+single map.
+
+The size of baggage is bounded by a number of items and a number of bytes
+(the encoded keys and values), both when items are set on a span and when
+baggage is injected or extracted; items beyond the limits are dropped.
+"""
+from __future__ import absolute_import
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from . import util
+
+
+def item_bytes(key, value):
+    """Returns the size charged for a baggage item: its encoded length."""
+    return _length(key) + _length(value)
+
+
+def _length(value):
+    return len(util.encode_utf8(value))
+
+
+class BaggageLimits(object):
+    """How much baggage a context may carry.
+
+    :param int max_items: maximum number of items.
+    :param int max_bytes: maximum encoded size of the keys and values.
+    """
+
+    __slots__ = ('max_items', 'max_bytes')
+
+    def __init__(self, max_items, max_bytes):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
+    def admits(self, items, nbytes):
+        return items <= self.max_items and nbytes <= self.max_bytes
+
+    def apply(self, baggage):
+        """Returns baggage (a Baggage or a dict) as a Baggage within the
+        limits.
+        """
+        if (isinstance(baggage, Baggage) and
+                self.admits(len(baggage), baggage.nbytes)):
+            return baggage
+        return self.bound(baggage.items())
+
+    def bound(self, items):
+        """Returns a Baggage of the (key, value) pairs, in order, which fit
+        within the limits.
+        """
+        kept = {}
+        nbytes = 0
+        for key, value in items:
+            size = item_bytes(key, value)
+            if key in kept:
+                size -= item_bytes(key, kept[key])
+            elif len(kept) >= self.max_items:
+                continue
+            if nbytes + size > self.max_bytes:
+                continue
+            kept[key] = value
+            nbytes += size
+        return Baggage._wrap(kept, nbytes) if kept else EMPTY_BAGGAGE
+
+
+class Baggage(Mapping):
+    """An immutable map of baggage items.
+
+    :ivar int nbytes: the encoded size of the keys and values.
+    """
+
+    __slots__ = ('_items', 'nbytes')
+
+    def __init__(self, items=None):
+        self._items = dict(items or ())
+        self.nbytes = sum(
+            item_bytes(k, v) for k, v in self._items.items())
+
+    @classmethod
+    def _wrap(cls, items, nbytes):
+        baggage = cls.__new__(cls)
+        baggage._items = items
+        baggage.nbytes = nbytes
+        return baggage
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return 'Baggage(%r)' % (self._items,)
+
+    def copy(self):
+        """Returns the items as a new, mutable dict."""
+        return dict(self._items)
+
+    def with_item(self, key, value, limits=None):
+        """Returns a Baggage with key set to value; self if the result would
+        exceed limits.
+        """
+        nbytes = self.nbytes + item_bytes(key, value)
+        if key in self._items:
+            nbytes -= item_bytes(key, self._items[key])
+            count = len(self._items)
+        else:
+            count = len(self._items) + 1
+        if limits is not None and not limits.admits(count, nbytes):
+            return self
+        items = dict(self._items)
+        items[key] = value
+        return Baggage._wrap(items, nbytes)
+
+
+EMPTY_BAGGAGE = Baggage()
+
+
+def as_baggage(baggage):
+    """Returns baggage (a Baggage, a dict or None) as a Baggage."""
+    if isinstance(baggage, Baggage):
+        return baggage
+    if not baggage:
+        return EMPTY_BAGGAGE
+    return Baggage(baggage)
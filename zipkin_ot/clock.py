@@ -0,0 +1,50 @@
+"""
+The span clock: wall-clock time in integer microseconds, advanced by a
+monotonic high-resolution counter.
+
+Reading time.time() for each span start and finish makes durations jump
+with NTP steps, and a float of seconds since the epoch only has about a
+quarter of a microsecond of precision left. A Clock reads the wall clock
+once, when created, and from then on adds the time elapsed on a monotonic
+counter, so ZipkinSpans get their start (start_us) and duration
+(duration_us) as exact integers, which the Recorder encodes as is.
+
+On Python 3.7+ the counter is time.perf_counter_ns() and the arithmetic is
+on integers only. Earlier Python 3 versions use time.perf_counter(). Python
+2 has no monotonic clock in its standard library and falls back to
+time.time(), which keeps the integer timestamps but not the immunity to
+clock steps.
+"""
+from __future__ import absolute_import
+
+import time
+
+MICROS_PER_SECOND = 1000000
+
+
+class Clock(object):
+    """Reads the time, in integer microseconds since the epoch, with now_us().
+
+    Long-running processes drift from the wall clock by as much as the
+    system clock is slewed or stepped after the Clock is created.
+    """
+
+    def __init__(self):
+        counter_ns = getattr(time, 'perf_counter_ns', None)
+        if counter_ns is not None:
+            offset_ns = time.time_ns() - counter_ns()
+
+            def now_us():
+                return (offset_ns + counter_ns()) // 1000
+        else:
+            counter = getattr(time, 'perf_counter', time.time)
+            anchor_us = int(time.time() * MICROS_PER_SECOND)
+            anchor = counter()
+
+            def now_us():
+                return anchor_us + int((counter() - anchor) *
+                                       MICROS_PER_SECOND)
+        self.now_us = now_us
+
+
+default_clock = Clock()
@@ -2,16 +2,89 @@
 
 HTTP_URL = 'http.url'
 HTTP_PATH = 'http.path'
+ERROR_TAG = 'error'
+# Values of the error tag which do not mark an error.
+FALSE_TAG_VALUES = frozenset(['false', '0', ''])
 
 # Runtime constants
 FLUSH_THREAD_NAME = 'Flush Thread'
 FLUSH_PERIOD_SECS = 2.5
 DEFAULT_MAX_SPAN_RECORDS = 1000
+DEFAULT_MAX_PRIORITY_SPAN_RECORDS = 100
+DEFAULT_MAX_BATCH_BYTES = 5 * 1024 * 1024
+SHUTDOWN_TIMEOUT_SECS = 5.0
+SHUTDOWN_MAX_WORKERS = 4
+# Part of the shutdown budget left for the shutdown threads to wind down.
+SHUTDOWN_GRACE_SECS = 0.1
+SHUTDOWN_THREAD_NAME = 'Shutdown Flush Thread'
+SPOOL_FILE_PREFIX = 'zipkin-ot-spool-'
+SPOOL_FILE_SUFFIX = '.thrift'
+# Appended to the name of a spool file while a recorder resends it.
+SPOOL_CLAIMED_SUFFIX = '.sending'
+LIST_HEADER_BYTES = 5
+# Spans Recorder.record_spans converts and buffers at a time.
+RECORD_SPANS_CHUNK = 256
+
+# asyncio recorder constants
+ASYNC_EXECUTOR_THRESHOLD = 1000
+ASYNC_POST_TIMEOUT_SECS = 10.0
+
+# process encoder constants
+ENCODER_PROCESS_NAME = 'zipkin_ot encoder'
+ENCODER_PROCESS_TIMEOUT_SECS = 30.0
+ENCODER_LOCK_POLL_SECS = 0.01
+
+# adaptive sampler constants
+ADAPTIVE_SAMPLER_INTERVAL_SECS = 1.0
+ADAPTIVE_SAMPLER_SMOOTHING = 0.3
+ADAPTIVE_SAMPLER_MIN_PROBABILITY = 0.001
+ADAPTIVE_SAMPLER_MAX_FLUSH_SECS = 1.0
+ADAPTIVE_SAMPLER_MAX_OPERATIONS = 1000
+# Buffer occupancy above which the sampler backs off.
+ADAPTIVE_SAMPLER_HIGH_OCCUPANCY = 0.75
+# Root spans/sec below which an operation is forgotten.
+ADAPTIVE_SAMPLER_MIN_ROOT_RATE = 0.01
+
+# sharding constants
+DEFAULT_SHARD_REPLICAS = 100
+SHARD_FAILURE_THRESHOLD = 3
+SHARD_RETRY_SECS = 30.0
+
+# RED aggregation constants
+RED_MAX_SERIES = 1000
+RED_OTHER_OPERATION = 'other'
+RED_REPORT_SECS = 10.0
+
+# file transport constants
+FILE_TRANSPORT_PREFIX = 'zipkin-ot-spans-'
+FILE_TRANSPORT_ACTIVE_SUFFIX = '.active'
+FILE_TRANSPORT_MAX_BYTES = 64 * 1024 * 1024
+FILE_TRANSPORT_MAX_SECS = 3600.0
+FILE_TRANSPORT_BUFFER_BYTES = 64 * 1024
+
+# replay constants
+REPLAY_BATCH_SPANS = 1000
+REPLAY_POST_TIMEOUT_SECS = 10.0
+
+# trace cap constants
+TRACE_CAP_TRACES = 10000
+TRACE_TRUNCATED_KEY = 'zipkin_ot.trace_truncated'
+
+# trace store constants
+TRACE_STORE_MAX_AGE_SECS = 300.0
+# Bytes charged per span on top of its frame, for the objects holding it.
+TRACE_STORE_SPAN_OVERHEAD_BYTES = 96
 
 # utils constants
 SECONDS_TO_MICRO = 1000000
 
 # Recorder constants
-MAX_LOG_MEMORY = 1024
 MAX_LOG_LEN = 984
+DEFAULT_MAX_LOGS_PER_SPAN = 256
+DEFAULT_MAX_LOG_BYTES_PER_SPAN = 64 * 1024
+DROPPED_LOGS_KEY = 'zipkin_ot.dropped_logs'
+
+# baggage constants
+DEFAULT_MAX_BAGGAGE_ITEMS = 64
+DEFAULT_MAX_BAGGAGE_BYTES = 8 * 1024
 JOIN_ID_TAG_PREFIX = "join:"
@@ -0,0 +1,46 @@
+from __future__ import absolute_import
+
+from basictracer.context import SpanContext as BasicSpanContext
+
+from .baggage import as_baggage
+
+
+class SpanContext(BasicSpanContext):
+    """A basictracer SpanContext that also carries the B3 parent span id and
+    debug flag, so they survive a round trip through a propagator.
+
+    Its baggage is an immutable zipkin_ot.baggage.Baggage, which child
+    contexts share.
+    """
+
+    def __init__(
+            self,
+            trace_id=None,
+            span_id=None,
+            baggage=None,
+            sampled=True,
+            parent_id=None,
+            debug=False):
+        super(SpanContext, self).__init__(
+            trace_id=trace_id,
+            span_id=span_id,
+            baggage=baggage,
+            sampled=sampled)
+        self._baggage = as_baggage(baggage)
+        self.parent_id = parent_id
+        self.debug = debug
+
+    def with_baggage_item(self, key, value, limits=None):
+        """Returns a context with the baggage item set, or this context if
+        the item does not fit within limits (a BaggageLimits).
+        """
+        new_baggage = self._baggage.with_item(key, value, limits)
+        if new_baggage is self._baggage:
+            return self
+        return SpanContext(
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            baggage=new_baggage,
+            sampled=self.sampled,
+            parent_id=self.parent_id,
+            debug=self.debug)
@@ -0,0 +1,167 @@
+"""
+A transport which appends spans to local files instead of POSTing them.
+
+For hosts which cannot reach the collector: the Recorder hands each batch
+to a FileTransport, which appends it to the current file of a directory,
+and rotates to a new file by size and age. The files can then be shipped
+by a log forwarder or bulk-loaded.
+
+    transport = FileTransport('/var/spool/zipkin', format='ndjson')
+    tracer = Tracer(service_name='my-service', transport=transport)
+
+Files are written under a name ending in '.active' and renamed once
+rotated, so only complete files carry their final name:
+
+- 'thrift' files are a sequence of records, each a 4-byte big-endian
+  length followed by a collector request body (a TBinaryProtocol list of
+  spans), as sent to /api/v1/spans.
+- 'ndjson' files hold one span per line, in the collector's v1 JSON format.
+
+Like any transport, it is only used from the flush thread and shutdown, so
+record_span never waits on the disk.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import struct
+import threading
+import time
+
+from . import constants
+from .thrift import span_to_json, spans_from_list_bytes
+
+THRIFT = 'thrift'
+NDJSON = 'ndjson'
+
+# The length prefixing each record of a 'thrift' file.
+RECORD_LENGTH = struct.Struct('!I')
+
+
+class _Written(object):
+    """What FileTransport.post returns, in place of an HTTP response."""
+
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+_WRITTEN = _Written()
+
+
+class FileTransport(object):
+    """Appends the request bodies it is posted to rotating files.
+
+    :param str directory: where files are written; created if missing.
+    :param str format: THRIFT or NDJSON.
+    :param int max_bytes: size after which the file is rotated.
+    :param float max_seconds: age after which the file is rotated.
+    :param float fsync_seconds: if set, written data is fsync()ed when at
+        least this many seconds passed since the last fsync (0: after every
+        batch). By default, durability is left to the OS.
+    :param str prefix: start of the file names.
+    :param int buffer_bytes: size of the write buffer.
+    """
+
+    def __init__(self, directory, format=THRIFT,
+                 max_bytes=constants.FILE_TRANSPORT_MAX_BYTES,
+                 max_seconds=constants.FILE_TRANSPORT_MAX_SECS,
+                 fsync_seconds=None,
+                 prefix=constants.FILE_TRANSPORT_PREFIX,
+                 buffer_bytes=constants.FILE_TRANSPORT_BUFFER_BYTES,
+                 clock=time.time):
+        if format not in (THRIFT, NDJSON):
+            raise ValueError('format must be %r or %r' % (THRIFT, NDJSON))
+        self.directory = directory
+        self.format = format
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_seconds = fsync_seconds
+        self.prefix = prefix
+        self.buffer_bytes = buffer_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._opened = 0
+        self._last_fsync = 0
+        self._sequence = 0
+        self._closed = False
+
+    def post(self, url=None, data=None, headers=None):
+        """Appends a collector request body; the signature is that of
+        requests.post, so the transport can stand in for a connection.
+        """
+        if self.format == THRIFT:
+            chunk = RECORD_LENGTH.pack(len(data)) + data
+        else:
+            chunk = ''.join(
+                json.dumps(span_to_json(span), separators=(',', ':')) + '\n'
+                for span in spans_from_list_bytes(data)).encode('utf-8')
+        with self._lock:
+            if self._closed:
+                raise IOError('FileTransport is closed')
+            now = self._clock()
+            if self._file is not None and (
+                    self._size + len(chunk) > self.max_bytes or
+                    now - self._opened >= self.max_seconds):
+                self._rotate_locked()
+            if self._file is None:
+                self._open_locked(now)
+            self._file.write(chunk)
+            self._size += len(chunk)
+            if (self.fsync_seconds is not None and
+                    now - self._last_fsync >= self.fsync_seconds):
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+        return _WRITTEN
+
+    def _open_locked(self, now):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._sequence += 1
+        name = '%s%d-%d-%d.%s' % (self.prefix, int(now * 1000000),
+                                  os.getpid(), self._sequence, self.format)
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path + constants.FILE_TRANSPORT_ACTIVE_SUFFIX,
+                          'ab', self.buffer_bytes)
+        self._size = 0
+        self._opened = now
+
+    def _rotate_locked(self):
+        f, self._file = self._file, None
+        f.flush()
+        if self.fsync_seconds is not None:
+            os.fsync(f.fileno())
+        f.close()
+        os.rename(self._path + constants.FILE_TRANSPORT_ACTIVE_SUFFIX,
+                  self._path)
+
+    def rotate(self):
+        """Closes the current file, if any, under its final name."""
+        with self._lock:
+            if self._file is not None:
+                self._rotate_locked()
+
+    def close(self):
+        """Rotates the current file; later posts fail. Called by the
+        Recorder at shutdown.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._rotate_locked()
+            self._closed = True
+
+    def files(self):
+        """Returns the paths of the complete files, oldest first."""
+        suffix = '.' + self.format
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(
+            os.path.join(self.directory, name) for name in names
+            if name.startswith(self.prefix) and name.endswith(suffix))
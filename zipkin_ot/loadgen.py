@@ -0,0 +1,167 @@
+"""
+Load generator: drives a Tracer against a collector and reports throughput,
+drop rate and flush latency.
+
+    python -m zipkin_ot.loadgen --threads 8 --duration 10 --latency 0.05
+
+Without --collector-host an in-process MockCollector is started, whose
+latency, error rate and outages can be set from the command line.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import sys
+import threading
+import time
+import warnings
+
+from . import constants, metrics
+from .mock_collector import MockCollector
+from .tracer import Tracer
+
+
+def generate_load(tracer, threads, duration, rate=0, tags=5):
+    """Starts and finishes spans from `threads` threads for `duration`
+    seconds, at most `rate` spans/sec per thread (0: unbounded).
+
+    Returns the number of spans finished.
+    """
+    deadline = metrics.clock() + duration
+    counts = [0] * threads
+    interval = 1.0 / rate if rate else 0
+
+    def work(index):
+        n = 0
+        next_start = metrics.clock()
+        while metrics.clock() < deadline:
+            with tracer.start_span('loadgen/%d' % index) as span:
+                for t in range(tags):
+                    span.set_tag('tag.%d' % t, n)
+            n += 1
+            if interval:
+                next_start += interval
+                delay = next_start - metrics.clock()
+                if delay > 0:
+                    time.sleep(delay)
+        counts[index] = n
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts)
+
+
+def _outage_loop(collector, every, length, done):
+    while not done.wait(every):
+        collector.outage = True
+        done.wait(length)
+        collector.outage = False
+
+
+def run(args):
+    collector = None
+    host, port = args.collector_host, args.collector_port
+    if host is None:
+        collector = MockCollector(
+            latency=args.latency, error_rate=args.error_rate,
+            seed=args.seed).start()
+        host, port = collector.host, collector.port
+
+    done = threading.Event()
+    if collector is not None and args.outage_every > 0:
+        outages = threading.Thread(
+            target=_outage_loop,
+            args=(collector, args.outage_every, args.outage_length, done))
+        outages.daemon = True
+        outages.start()
+
+    tracer = Tracer(
+        service_name='loadgen',
+        collector_host=host,
+        collector_port=port,
+        max_span_records=args.max_span_records,
+        periodic_flush_seconds=args.flush_seconds)
+    try:
+        start = metrics.clock()
+        finished = generate_load(
+            tracer, args.threads, args.duration, args.rate, args.tags)
+        elapsed = metrics.clock() - start
+        done.set()
+        if collector is not None:
+            collector.outage = False
+        tracer.recorder.shutdown()
+        # A periodic flush may still be in flight; let it land before
+        # reading the counters.
+        flush_thread = tracer.recorder._flush_thread
+        if flush_thread is not None:
+            flush_thread.join(args.flush_seconds + 30)
+
+        snapshot = tracer.metrics.snapshot()
+        dropped = (snapshot['spans_dropped_total'] +
+                   snapshot['spans_restore_dropped_total'] +
+                   snapshot['spans_shutdown_dropped_total'])
+        report = {
+            'threads': args.threads,
+            'duration': elapsed,
+            'spans_finished': finished,
+            'spans_per_sec': finished / elapsed,
+            'spans_sent': snapshot['spans_sent_total'],
+            'spans_dropped': dropped,
+            'drop_rate': float(dropped) / finished if finished else 0.0,
+            'flushes': snapshot['flushes_total'],
+            'flush_failures': snapshot['flush_failures_total'],
+            'flush_p99_seconds':
+                tracer.metrics.flush_seconds.quantile(0.99),
+        }
+        if collector is not None:
+            received = collector.stats()
+            report['collector_spans'] = received['collector_spans_total']
+            report['collector_requests'] = received['collector_requests_total']
+            report['collector_errors'] = received['collector_errors_total']
+        return report
+    finally:
+        done.set()
+        if collector is not None:
+            collector.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Drive a Tracer against a Zipkin collector.')
+    parser.add_argument('--collector-host',
+                        help='collector to use instead of a MockCollector')
+    parser.add_argument('--collector-port', type=int, default=9411)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to generate spans for')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='max spans/sec per thread, 0 for unbounded')
+    parser.add_argument('--tags', type=int, default=5,
+                        help='tags per span')
+    parser.add_argument('--max-span-records', type=int,
+                        default=constants.DEFAULT_MAX_SPAN_RECORDS)
+    parser.add_argument('--flush-seconds', type=float,
+                        default=constants.FLUSH_PERIOD_SECS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='MockCollector latency per request, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='MockCollector probability of answering 500')
+    parser.add_argument('--outage-every', type=float, default=0,
+                        help='seconds between MockCollector outages')
+    parser.add_argument('--outage-length', type=float, default=1.0,
+                        help='seconds each MockCollector outage lasts')
+    parser.add_argument('--seed', type=int, help='seed for error injection')
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter('ignore')
+    json.dump(run(args), sys.stdout, indent=2, sort_keys=True)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Resolution of the local host's addresses for the span Endpoint.
+
+Addresses are read from the interfaces used for outbound traffic, which only
+takes local system calls, and cached per process. DNS is a fallback that runs
+in a background thread, so callers never block on the network.
+"""
+from __future__ import absolute_import
+
+import os
+import socket
+import threading
+
+# Unroutable documentation addresses (RFC 5737 and RFC 3849): connect() on a
+# UDP socket only selects the source address, nothing is sent.
+_PROBE_IPV4 = ('192.0.2.1', 9)
+_PROBE_IPV6 = ('2001:db8::1', 9)
+
+LOOPBACK_IPV4 = '127.0.0.1'
+
+_lock = threading.Lock()
+_cache = {}
+_pending = {}
+
+
+def interface_address(family):
+    """Returns the address of the interface this host would use to reach the
+    network over `family`, or None if there is no such route.
+    """
+    probe = _PROBE_IPV4 if family == socket.AF_INET else _PROBE_IPV6
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+    except (socket.error, OSError):
+        return None
+    try:
+        sock.connect(probe)
+        address = sock.getsockname()[0]
+    except (socket.error, OSError):
+        return None
+    finally:
+        sock.close()
+    if address in ('0.0.0.0', '::'):
+        return None
+    return address
+
+
+def local_addresses(timeout=0, callback=None):
+    """Returns an (ipv4, ipv6) pair for this process; either may be None.
+
+    Interface addresses are tried first. If there are none, a DNS lookup of
+    the host name is started in the background and, until it completes,
+    (LOOPBACK_IPV4, None) is returned. `timeout` is how long to wait for that
+    lookup; `callback`, if given, is called with the pair once it completes.
+    Results are cached per process.
+    """
+    pid = os.getpid()
+    addresses = _cache.get(pid)
+    if addresses is not None:
+        return addresses
+
+    addresses = (interface_address(socket.AF_INET),
+                 interface_address(socket.AF_INET6))
+    if addresses != (None, None):
+        _cache[pid] = addresses
+        return addresses
+
+    with _lock:
+        addresses = _cache.get(pid)
+        if addresses is not None:
+            return addresses
+        lookup = _pending.get(pid)
+        if lookup is None:
+            lookup = _pending[pid] = _DNSLookup(pid)
+            lookup.start()
+        if callback is not None:
+            lookup.callbacks.append(callback)
+    if timeout:
+        lookup.done.wait(timeout)
+    if lookup.done.is_set():
+        return _cache[pid]
+    return LOOPBACK_IPV4, None
+
+
+class _DNSLookup(threading.Thread):
+    """Resolves the host name in a daemon thread and caches the result."""
+
+    def __init__(self, pid):
+        super(_DNSLookup, self).__init__(name='Local Address Lookup')
+        self.daemon = True
+        self.pid = pid
+        self.done = threading.Event()
+        self.callbacks = []
+
+    def run(self):
+        ipv4 = ipv6 = None
+        try:
+            for family, _, _, _, sockaddr in socket.getaddrinfo(
+                    socket.gethostname(), None, 0, socket.SOCK_STREAM):
+                if family == socket.AF_INET and ipv4 is None:
+                    ipv4 = sockaddr[0]
+                elif family == socket.AF_INET6 and ipv6 is None:
+                    ipv6 = sockaddr[0]
+        except (socket.error, OSError):
+            pass
+        addresses = (ipv4 or LOOPBACK_IPV4, ipv6)
+        with _lock:
+            _cache[self.pid] = addresses
+            _pending.pop(self.pid, None)
+            callbacks = self.callbacks
+            self.callbacks = []
+        for callback in callbacks:
+            try:
+                callback(addresses)
+            except Exception:
+                pass
+        self.done.set()
@@ -0,0 +1,262 @@
+"""
+Self-telemetry for the recorder: counters, gauges and latency histograms.
+
+Counters and histograms keep one cell per thread, so the hot path is a
+thread-local lookup and an in-place add; no lock is taken. Cells are only
+summed when a snapshot is read.
+"""
+from __future__ import absolute_import
+
+import bisect
+import threading
+import time
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+DEFAULT_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+EXPOSITION_PREFIX = 'zipkin_ot_'
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class _PerThreadCells(object):
+    """Hands out one mutable cell per thread and folds the cells of threads
+    which have exited into a retired total, when a thread registers its
+    cell and when read, so short-lived threads do not accumulate cells.
+    """
+
+    def __init__(self, cell_size):
+        self._cell_size = cell_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []
+        self._retired = [0] * cell_size
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._cell_size
+            self._local.cell = cell
+            with self._lock:
+                self._retire_locked()
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def total(self):
+        with self._lock:
+            self._retire_locked()
+            totals = list(self._retired)
+            for _, cell in self._cells:
+                for i, v in enumerate(cell):
+                    totals[i] += v
+        return totals
+
+    def _retire_locked(self):
+        """Folds the cells of exited threads into the retired total;
+        self._lock must be held.
+        """
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for i, v in enumerate(cell):
+                    self._retired[i] += v
+        self._cells = live
+
+
+class Counter(object):
+    """A monotonically increasing count."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self._cells = _PerThreadCells(1)
+
+    def inc(self, n=1):
+        self._cells.cell()[0] += n
+
+    def value(self):
+        return self._cells.total()[0]
+
+
+class Gauge(object):
+    """A value which can go up and down, either set or read from `fn`."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help='', fn=None):
+        self.name = name
+        self.help = help
+        self._fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        if self._fn is not None:
+            return self._fn()
+        return self._value
+
+
+class Histogram(object):
+    """A distribution of observations over fixed buckets.
+
+    :param buckets: sorted upper bounds of the buckets; observations above the
+        last bound land in an implicit +Inf bucket.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help='', buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # Cell layout: one count per bucket, the +Inf count, then the sum.
+        self._sum_index = len(self.buckets) + 1
+        self._cells = _PerThreadCells(len(self.buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[self._sum_index] += value
+
+    def value(self):
+        """Returns a dict with the per-bucket (non-cumulative) counts, the
+        total count and the sum of all observations.
+        """
+        totals = self._cells.total()
+        counts = totals[:self._sum_index]
+        return {
+            'buckets': dict(zip(self.buckets + (float('inf'),), counts)),
+            'count': sum(counts),
+            'sum': totals[self._sum_index],
+        }
+
+    def quantile(self, q):
+        """Estimates the q-quantile as the upper bound of the bucket holding
+        it; returns None without observations.
+        """
+        totals = self._cells.total()
+        counts = totals[:self._sum_index]
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        bounds = self.buckets + (float('inf'),)
+        for bound, count in zip(bounds, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return bounds[-1]
+
+
+class Metrics(object):
+    """A registry of named metrics with snapshot and text exposition."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help=''):
+        return self._register(Counter(name, help))
+
+    def gauge(self, name, help='', fn=None):
+        return self._register(Gauge(name, help, fn))
+
+    def histogram(self, name, help='', buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Returns a dict of metric name to its current value."""
+        return dict((m.name, m.value()) for m in self._metrics)
+
+    def exposition(self):
+        """Returns the metrics in the Prometheus plain-text format."""
+        lines = []
+        for metric in self._metrics:
+            name = EXPOSITION_PREFIX + metric.name
+            if metric.help:
+                lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.kind))
+            value = metric.value()
+            if metric.kind != 'histogram':
+                lines.append('%s %s' % (name, _format_number(value)))
+                continue
+            cumulative = 0
+            for bound in metric.buckets + (float('inf'),):
+                cumulative += value['buckets'][bound]
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket{le="%s"} %d' % (name, le, cumulative))
+            lines.append('%s_sum %s' % (name, _format_number(value['sum'])))
+            lines.append('%s_count %d' % (name, value['count']))
+        return '\n'.join(lines) + '\n'
+
+
+class RecorderMetrics(Metrics):
+    """The metrics kept by a Recorder.
+
+    :param buffer_size: callable returning the number of buffered spans.
+    """
+
+    def __init__(self, buffer_size=None):
+        super(RecorderMetrics, self).__init__()
+        self.spans_recorded = self.counter(
+            'spans_recorded_total', 'Spans accepted into the buffer.')
+        self.spans_dropped = self.counter(
+            'spans_dropped_total',
+            'Normal spans dropped, or evicted by error and debug spans, '
+            'because the buffer was full.')
+        self.priority_spans_dropped = self.counter(
+            'priority_spans_dropped_total',
+            'Error and debug spans dropped because the buffer was full.')
+        self.spans_capped = self.counter(
+            'spans_capped_total',
+            'Spans dropped because their trace reached max_spans_per_trace.')
+        self.spans_rejected = self.counter(
+            'spans_rejected_total',
+            'Spans record_spans() returned as rejected because the buffer '
+            'was full.')
+        self.spans_sent = self.counter(
+            'spans_sent_total', 'Spans sent to the collector.')
+        self.bytes_sent = self.counter(
+            'bytes_sent_total', 'Bytes of span data sent to the collector.')
+        self.flushes = self.counter(
+            'flushes_total', 'Successful flushes.')
+        self.flush_failures = self.counter(
+            'flush_failures_total', 'Failed flushes.')
+        self.spans_restored = self.counter(
+            'spans_restored_total',
+            'Spans put back into the buffer after a failed flush.')
+        self.spans_restore_dropped = self.counter(
+            'spans_restore_dropped_total',
+            'Spans lost after a failed flush because the buffer was full.')
+        self.spans_spooled = self.counter(
+            'spans_spooled_total',
+            'Spans written to the spool directory at shutdown.')
+        self.spans_shutdown_dropped = self.counter(
+            'spans_shutdown_dropped_total',
+            'Spans neither sent nor spooled at shutdown.')
+        self.buffered_spans = self.gauge(
+            'buffered_spans', 'Spans currently buffered.', buffer_size)
+        self.encode_seconds = self.histogram(
+            'encode_seconds', 'Time spent encoding a flushed batch.')
+        self.flush_seconds = self.histogram(
+            'flush_seconds', 'Time spent sending a batch to the collector.')
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,145 @@
+"""
+An in-process stand-in for a Zipkin collector, for end-to-end load testing.
+
+MockCollector runs a threaded HTTP server accepting Thrift encoded spans on
+/api/v1/spans. It can inject latency, random errors and outages, and counts
+what it received.
+"""
+from __future__ import absolute_import
+
+import random
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:  # pragma: no cover
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from . import metrics
+from .thrift import spans_from_list_bytes
+
+SPANS_PATH = '/api/v1/spans'
+
+
+class MockCollector(object):
+    """A local Zipkin collector.
+
+    :param str host: interface to listen on.
+    :param int port: port to listen on; 0 picks a free port.
+    :param float latency: seconds to wait before answering each request.
+    :param float error_rate: probability of answering a request with a 500.
+    :param seed: seed for the error injection, for reproducible runs.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+                 seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.outage = False
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._spans = []
+        self.keep_spans = False
+
+        self.metrics = metrics.Metrics()
+        self.requests = self.metrics.counter(
+            'collector_requests_total', 'Requests received.')
+        self.errors = self.metrics.counter(
+            'collector_errors_total', 'Requests answered with an error.')
+        self.spans_received = self.metrics.counter(
+            'collector_spans_total', 'Spans accepted.')
+        self.bytes_received = self.metrics.counter(
+            'collector_bytes_total', 'Bytes of span data accepted.')
+        self.request_seconds = self.metrics.histogram(
+            'collector_request_seconds', 'Time spent handling a request.')
+
+        self._server = _Server((host, port), _Handler)
+        self._server.collector = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """Starts serving in a daemon thread; returns self."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,),
+            name='Mock Zipkin Collector')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def spans(self):
+        """Returns the spans received so far, if keep_spans is set."""
+        with self._lock:
+            return list(self._spans)
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _handle(self, body):
+        """Returns the HTTP status to answer a POST of `body` with."""
+        self.requests.inc()
+        if self.outage:
+            self.errors.inc()
+            return 503
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors.inc()
+            return 500
+        try:
+            spans = spans_from_list_bytes(body)
+        except Exception:
+            self.errors.inc()
+            return 400
+        self.spans_received.inc(len(spans))
+        self.bytes_received.inc(len(body))
+        if self.keep_spans:
+            with self._lock:
+                self._spans.extend(spans)
+        return 202
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        start = metrics.clock()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        collector = self.server.collector
+        if self.path.split('?')[0] != SPANS_PATH:
+            status = 404
+        else:
+            status = collector._handle(body)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        collector.request_seconds.observe(metrics.clock() - start)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,358 @@
+"""
+Out-of-process encoding and reporting of spans.
+
+ProcessEncodingRecorder buffers spans as compact tuples of plain values and
+hands each batch to a helper process over a pipe. The helper builds the
+Thrift structs, encodes them and POSTs the body to the collector, so the
+traced process only pays for pickling tuples.
+
+    tracer = Tracer(service_name='my-service', encoder_process=True)
+"""
+from __future__ import absolute_import
+
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from . import constants, metrics, util
+from .recorder import Recorder, frame_batches
+from .thrift import (create_annotation, create_binary_annotation,
+                     create_span, frames_in_list_bytes, load_zipkin_core,
+                     span_frame)
+
+_HEADERS = {'Content-Type': 'application/x-thrift'}
+
+
+def encode_records(endpoint, records):
+    """Encodes compact span records as a collector request body; see
+    record_frames for the arguments.
+    """
+    return frames_in_list_bytes(record_frames(endpoint, records))
+
+
+def record_frames(endpoint, records):
+    """Encodes compact span records as span frames (see
+    zipkin_ot.thrift.span_frame).
+
+    :param endpoint: (ipv4, port, service_name, ipv6) of the Endpoint to use
+        as the host of every annotation.
+    :param records: (trace_id, span_id, parent_id, name, annotations,
+        binary_annotations) tuples, ids as ints, annotations as
+        (timestamp_us, value) pairs and binary annotations as (key, value)
+        string pairs.
+    """
+    zipkin_core = load_zipkin_core()
+    ipv4, port, service_name, ipv6 = endpoint
+    host = zipkin_core.Endpoint(
+        ipv4=ipv4, port=port, service_name=service_name, ipv6=ipv6)
+    string_type = zipkin_core.AnnotationType.STRING
+    frames = []
+    for (trace_id, span_id, parent_id, name,
+         annotations, binary_annotations) in records:
+        frames.append(span_frame(create_span(
+            util.id_to_hex(span_id),
+            util.id_to_hex(parent_id),
+            util.id_to_hex(trace_id),
+            name,
+            [create_annotation(timestamp, value, host)
+             for timestamp, value in annotations],
+            [create_binary_annotation(key, value, string_type, host)
+             for key, value in binary_annotations],
+        )))
+    return frames
+
+
+# The helper's replies: one _POSTED (spans, nbytes, seconds) for each
+# request body the collector accepted, then _DONE (error, encode_seconds).
+_POSTED = 'posted'
+_DONE = 'done'
+
+
+def _encoder_main(conn, timeout):
+    """The helper process: encodes and POSTs each (url, endpoint, records,
+    max_batch_bytes) message received on conn, until it receives None or
+    the pipe closes. Requests time out after timeout seconds.
+
+    Each request body the collector accepts is reported as it goes, with
+    (_POSTED, (spans, nbytes, seconds)), and each message is then answered
+    with (_DONE, (error, encode_seconds)), error being None if every body
+    was accepted.
+    """
+    import requests
+    session = requests.Session()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, IOError):
+            return
+        if message is None:
+            return
+        url, endpoint, records, max_batch_bytes = message
+        encode_seconds = 0.0
+        try:
+            start = metrics.clock()
+            frames = record_frames(endpoint, records)
+            encode_seconds = metrics.clock() - start
+            for batch in frame_batches(frames, max_batch_bytes):
+                body = frames_in_list_bytes(batch)
+                start = metrics.clock()
+                r = session.post(url=url, data=body, headers=_HEADERS,
+                                 timeout=timeout)
+                r.raise_for_status()
+                if not _send(conn, (_POSTED, (len(batch), len(body),
+                                              metrics.clock() - start))):
+                    return
+            reply = (_DONE, (None, encode_seconds))
+        except Exception as e:
+            reply = (_DONE, ('%s: %s' % (type(e).__name__, e),
+                             encode_seconds))
+        if not _send(conn, reply):
+            return
+
+
+def _send(conn, message):
+    """Sends message to the parent; returns False if the pipe is gone."""
+    try:
+        conn.send(message)
+    except (EOFError, IOError):
+        return False
+    return True
+
+
+class ReportError(IOError):
+    """A batch could not be reported, or only in part.
+
+    posts lists the (spans, nbytes, seconds) of the request bodies which
+    were accepted, as EncoderProcess.report returns them.
+    """
+
+    def __init__(self, message, posts=()):
+        super(ReportError, self).__init__(message)
+        self.posts = list(posts)
+
+
+class EncoderProcess(object):
+    """The helper process of a ProcessEncodingRecorder.
+
+    The helper is started on first use, and restarted if it dies, hangs for
+    longer than timeout seconds, or belongs to the parent of a fork().
+    """
+
+    def __init__(self, timeout=constants.ENCODER_PROCESS_TIMEOUT_SECS):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._process = None
+        self._conn = None
+
+    @property
+    def pid(self):
+        """The helper's process id, or None if it is not running."""
+        process = self._process
+        if process is None or self._pid != os.getpid():
+            return None
+        return process.pid
+
+    def report(self, url, endpoint, records, max_batch_bytes):
+        """Has the helper encode and POST records to url, in request bodies
+        of at most max_batch_bytes.
+
+        Returns (posts, encode_seconds), posts listing (spans, nbytes,
+        seconds) for each request body; raises ReportError if the records
+        could not all be reported. The helper has timeout seconds for each
+        request body, not for the whole report.
+        """
+        posts = []
+        with self._lock:
+            self._ensure_started()
+            conn = self._conn
+            try:
+                conn.send((url, endpoint, records, max_batch_bytes))
+                while True:
+                    if not conn.poll(self.timeout):
+                        raise IOError('no reply within %ss' % self.timeout)
+                    kind, value = conn.recv()
+                    if kind == _DONE:
+                        error, encode_seconds = value
+                        break
+                    posts.append(value)
+            except (EOFError, IOError, OSError) as e:
+                # Its state is unknown: replace the helper on the next report.
+                self._stop(terminate=True)
+                raise ReportError('encoder process failed: %s' % (e,), posts)
+        if error is not None:
+            raise ReportError(error, posts)
+        return posts, encode_seconds
+
+    def close(self, timeout=None):
+        """Asks the helper to exit, terminating it after timeout seconds.
+
+        The timeout includes waiting for a report in progress; past it, the
+        helper is terminated under the report, which then fails.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = metrics.clock() + timeout
+        # Python 2 locks cannot be acquired with a timeout.
+        while not self._lock.acquire(False):
+            if metrics.clock() >= deadline:
+                process = self._process
+                if process is not None and self._pid == os.getpid():
+                    process.terminate()
+                return
+            time.sleep(constants.ENCODER_LOCK_POLL_SECS)
+        try:
+            self._stop(timeout=max(0, deadline - metrics.clock()))
+        finally:
+            self._lock.release()
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # After a fork() the handles belong to the parent's helper, which
+            # the parent still uses; forget them without touching it.
+            self._process = self._conn = None
+        elif self._process is not None:
+            if self._process.is_alive():
+                return
+            self._stop(terminate=True)
+
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_encoder_main, args=(child_conn, self.timeout),
+            name=constants.ENCODER_PROCESS_NAME)
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        self._pid = os.getpid()
+        self._process = process
+        self._conn = parent_conn
+
+    def _stop(self, terminate=False, timeout=0):
+        process, conn = self._process, self._conn
+        self._process = self._conn = None
+        if process is None or self._pid != os.getpid():
+            return
+        if not terminate:
+            try:
+                conn.send(None)
+            except (EOFError, IOError, OSError):
+                pass
+            process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        conn.close()
+
+
+class ProcessEncodingRecorder(Recorder):
+    """A Recorder which encodes and reports from a helper process.
+
+    Takes the Recorder arguments, plus:
+
+    :param float encoder_timeout: seconds to wait for the helper to report
+        a batch before it is replaced and the batch restored to the buffer.
+
+    flush(connection) encodes in the calling process, so that a mocked
+    connection sees the same body as with a Recorder; so does every flush
+    when a transport is set.
+    """
+
+    def __init__(self,
+                 encoder_timeout=constants.ENCODER_PROCESS_TIMEOUT_SECS,
+                 **kwargs):
+        super(ProcessEncodingRecorder, self).__init__(**kwargs)
+        self.encoder = EncoderProcess(encoder_timeout)
+
+    def _build_annotations(self, span, annotation_filter, binary_annotations):
+        annotations = [
+            (timestamp, key)
+            for key, timestamp in
+            self._standard_annotations(span, annotation_filter).items()
+        ]
+        return annotations, [
+            (key, str(value)) for key, value in binary_annotations.items()]
+
+    def _create_span_record(self, span, annotations, binary_annotations):
+        return (
+            span.context.trace_id,
+            span.context.span_id,
+            span.parent_id,
+            util.coerce_str(span.operation_name),
+            annotations,
+            binary_annotations,
+        )
+
+    def _keep_recent(self, span_record):
+        # The tuple stays in the buffer, for the helper to encode.
+        self.trace_store.add(
+            record_frames(self._endpoint_tuple(), [span_record])[0])
+        return span_record
+
+    def _endpoint_tuple(self):
+        endpoint = self.endpoint
+        return (endpoint.ipv4, endpoint.port, endpoint.service_name,
+                endpoint.ipv6)
+
+    def _encode_frames(self, span_records):
+        # Used by shutdown(), which drains the buffer from this process.
+        frames = iter(record_frames(
+            self._endpoint_tuple(),
+            [r for r in span_records if not isinstance(r, bytes)]))
+        return [record if isinstance(record, bytes) else next(frames)
+                for record in span_records]
+
+    def shutdown(self, flush=True, timeout=None):
+        if timeout is None:
+            timeout = self._shutdown_timeout
+        start = metrics.clock()
+        report = super(ProcessEncodingRecorder, self).shutdown(flush, timeout)
+        self.encoder.close(max(0, timeout - report.seconds))
+        report.seconds = metrics.clock() - start
+        return report
+
+    def _flush_worker(self, connection=None):
+        if not self._buffered_count():
+            return True
+
+        span_records, priority_count = self._take_records()
+        connection = connection or self._transport
+
+        sent = 0
+        try:
+            if connection:
+                start = metrics.clock()
+                frames = record_frames(self._endpoint_tuple(), span_records)
+                self._observe_encode(metrics.clock() - start)
+                for batch in self._batches(frames):
+                    body = frames_in_list_bytes(batch)
+                    start = metrics.clock()
+                    connection.post(url=self._collector_url, data=body,
+                                    headers=_HEADERS).raise_for_status()
+                    self._observe_post(len(batch), len(body),
+                                       metrics.clock() - start)
+                    sent += len(batch)
+            else:
+                posts = []
+                try:
+                    posts, encode_seconds = self.encoder.report(
+                        self._collector_url, self._endpoint_tuple(),
+                        span_records, self._max_batch_bytes)
+                except ReportError as e:
+                    posts = e.posts
+                    raise
+                finally:
+                    for spans, nbytes, seconds in posts:
+                        self._observe_post(spans, nbytes, seconds)
+                        sent += spans
+                self._observe_encode(encode_seconds)
+            return True
+
+        except Exception as e:
+            self._fine("Caught exception during report: %s, stack "
+                       "trace: %s", (e, traceback.format_exc()))
+            self.metrics.flush_failures.inc()
+            self._restore_spans(span_records[sent:],
+                                max(0, priority_count - sent))
+            return False
@@ -0,0 +1,75 @@
+"""
+Sampled per-stage timers for the recorder hot path.
+
+A Recorder only consults its profiler when one is enabled (see
+Recorder.enable_profiling), so an idle profiler costs a single attribute
+check per span.
+"""
+from __future__ import absolute_import
+
+import itertools
+
+from . import metrics
+
+TAGS = 'tags'
+LOGS = 'logs'
+ANNOTATIONS = 'annotations'
+CREATE_SPAN = 'create_span'
+LOCK_WAIT = 'lock_wait'
+ENCODE = 'encode'
+POST = 'post'
+
+STAGES = (TAGS, LOGS, ANNOTATIONS, CREATE_SPAN, LOCK_WAIT, ENCODE, POST)
+
+# Upper bounds (in seconds) of the stage timer buckets.
+STAGE_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001,
+    0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.1, 1.0,
+)
+
+
+class StageProfiler(object):
+    """Times each stage of recording and flushing spans.
+
+    :param float sample_rate: fraction of recorded spans to time; it is
+        applied deterministically as "every Nth span". Flushes are always
+        timed.
+    """
+
+    def __init__(self, sample_rate=0.01):
+        if sample_rate <= 0:
+            raise ValueError('sample_rate must be positive')
+        self.sample_rate = sample_rate
+        self._interval = max(1, int(round(1.0 / sample_rate)))
+        # next() on an itertools.count is atomic under the GIL.
+        self._counter = itertools.count()
+        self.metrics = metrics.Metrics()
+        self.timers = dict(
+            (stage, self.metrics.histogram(
+                'stage_%s_seconds' % stage, buckets=STAGE_BUCKETS))
+            for stage in STAGES)
+
+    def sample(self):
+        """Returns whether the next recorded span should be timed."""
+        return next(self._counter) % self._interval == 0
+
+    def observe(self, stage, seconds):
+        self.timers[stage].observe(seconds)
+
+    def snapshot(self):
+        """Returns, per stage, the number of timings, their total and mean
+        in seconds, and p50/p99 bucket estimates.
+        """
+        stages = {}
+        for stage in STAGES:
+            timer = self.timers[stage]
+            value = timer.value()
+            count = value['count']
+            stages[stage] = {
+                'count': count,
+                'total_seconds': value['sum'],
+                'mean_seconds': value['sum'] / count if count else None,
+                'p50_seconds': timer.quantile(0.5),
+                'p99_seconds': timer.quantile(0.99),
+            }
+        return stages
@@ -6,25 +6,29 @@ https://github.com/opentracing/basictracer-python
 See the API definition for comments.
 """
 
+from __future__ import print_function
+
 import atexit
-import ssl
+import itertools
+import os
 import sys
 import threading
 import time
 import traceback
 import warnings
-import requests
 
 from basictracer.recorder import SpanRecorder
 
-from zipkin_ot.thrift import annotation_list_builder
+from zipkin_ot.thrift import micros_annotation_list_builder
 from zipkin_ot.thrift import binary_annotation_list_builder
 from zipkin_ot.thrift import create_span
-from zipkin_ot.thrift import to_thrift_spans
-from zipkin_ot.thrift import thrift_obj_in_bytes
+from zipkin_ot.thrift import frames_in_list_bytes
+from zipkin_ot.thrift import list_length
+from zipkin_ot.thrift import span_frame
 from zipkin_ot.thrift import create_endpoint
 
-from . import constants, util
+from . import constants, local_address, metrics, profiling, util
+from .span import truncate_log
 
 
 STANDARD_ANNOTATIONS = {
@@ -34,6 +38,59 @@ STANDARD_ANNOTATIONS = {
 STANDARD_ANNOTATIONS_KEYS = frozenset(STANDARD_ANNOTATIONS.keys())
 
 
+def frame_batches(frames, max_batch_bytes):
+    """Splits span frames into lists making request bodies of at most
+    max_batch_bytes (a larger span is sent on its own).
+    """
+    limit = max_batch_bytes - constants.LIST_HEADER_BYTES
+    batch = []
+    size = 0
+    for frame in frames:
+        if batch and size + len(frame) > limit:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(frame)
+        size += len(frame)
+    if batch:
+        yield batch
+
+
+class ShutdownReport(object):
+    """What Recorder.shutdown() did with the buffered spans.
+
+    :ivar int sent: spans sent to the collector.
+    :ivar int spooled: spans written to the spool directory.
+    :ivar int dropped: spans lost.
+    :ivar float seconds: time the shutdown took.
+    :ivar bool flushed: whether every buffered span was sent; also the truth
+        value of the report. False if the recorder was already shut down.
+    """
+
+    def __init__(self, sent=0, spooled=0, dropped=0, seconds=0.0,
+                 flushed=True):
+        self.sent = sent
+        self.spooled = spooled
+        self.dropped = dropped
+        self.seconds = seconds
+        self.flushed = flushed
+
+    def __bool__(self):
+        return self.flushed
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return ('ShutdownReport(sent=%d, spooled=%d, dropped=%d, '
+                'seconds=%.3f, flushed=%r)' % (
+                    self.sent, self.spooled, self.dropped, self.seconds,
+                    self.flushed))
+
+
+# Numbers the spool files written by this process.
+_spool_sequence = itertools.count()
+
+
 class Recorder(SpanRecorder):
     """Recorder translates, buffers, and reports basictracer.BasicSpans.
 
@@ -42,11 +99,19 @@ class Recorder(SpanRecorder):
     For parameter semantics, see Tracer() documentation; Recorder() respects
     service_name, collector_host, collector_port,
     max_span_records, periodic_flush_seconds, verbosity,
-    and certificate_verification.
+    max_logs_per_span, max_log_bytes_per_span, max_batch_bytes,
+    max_priority_span_records, shutdown_timeout, spool_dir,
+    red_metrics, red_handler, red_report_seconds, trace_store_bytes,
+    trace_store_seconds, transport, max_spans_per_trace,
+    trace_cap_traces and certificate_verification.
 
     :param port: The port number of the service. Defaults to 0.
 
     """
+    # Whether the recorder shuts itself down at exit; recorders owned by
+    # another one (the shards of a ShardedRecorder) leave it to their owner.
+    _shutdown_at_exit = True
+
     def __init__(self,
                  service_name=None,
                  collector_host='localhost',
@@ -56,10 +121,28 @@ class Recorder(SpanRecorder):
                  verbosity=0,
                  include=('client', 'server'),
                  port=0,
-                 certificate_verification=True):
+                 certificate_verification=True,
+                 max_logs_per_span=constants.DEFAULT_MAX_LOGS_PER_SPAN,
+                 max_log_bytes_per_span=constants.DEFAULT_MAX_LOG_BYTES_PER_SPAN,
+                 max_batch_bytes=constants.DEFAULT_MAX_BATCH_BYTES,
+                 max_priority_span_records=
+                 constants.DEFAULT_MAX_PRIORITY_SPAN_RECORDS,
+                 shutdown_timeout=constants.SHUTDOWN_TIMEOUT_SECS,
+                 spool_dir=None,
+                 red_metrics=False,
+                 red_handler=None,
+                 red_report_seconds=constants.RED_REPORT_SECS,
+                 trace_store_bytes=0,
+                 trace_store_seconds=constants.TRACE_STORE_MAX_AGE_SECS,
+                 transport=None,
+                 max_spans_per_trace=0,
+                 trace_cap_traces=constants.TRACE_CAP_TRACES):
         self.verbosity = verbosity
+        self.max_logs_per_span = max_logs_per_span
+        self.max_log_bytes_per_span = max_log_bytes_per_span
 
         if certificate_verification is False:
+            import ssl
             warnings.warn('SSL CERTIFICATE VERIFICATION turned off. '
                           'ALL FUTURE HTTPS calls will be unverified.')
             ssl._create_default_https_context = ssl._create_unverified_context
@@ -67,7 +150,11 @@ class Recorder(SpanRecorder):
         if service_name is None:
             service_name = sys.argv[0]
 
-        self.endpoint = create_endpoint(port, service_name)
+        # The endpoint is built on first use from the local addresses, which
+        # are resolved without blocking on DNS (see zipkin_ot.local_address).
+        self._port = port
+        self._service_name = service_name
+        self._endpoint = None
 
         if not set(include).issubset(STANDARD_ANNOTATIONS_KEYS):
             raise Exception(
@@ -84,11 +171,43 @@ class Recorder(SpanRecorder):
             collector_host,
             collector_port)
         self._mutex = threading.Lock()
+        # Notified when flushes make room, for record_spans(block=True).
+        self._room = threading.Condition(self._mutex)
+        # Spans are buffered in two lanes: error and debug spans go into
+        # _priority_records, which has max_priority_span_records of reserved
+        # capacity and may borrow from the normal lane beyond that.
         self._span_records = []
+        self._priority_records = []
         self._max_span_records = max_span_records
+        self._max_priority_span_records = max_priority_span_records
+        self._max_batch_bytes = max_batch_bytes
+        self._shutdown_timeout = shutdown_timeout
+        self._spool_dir = spool_dir
+        self._transport = transport
+        self._trace_caps = None
+        if max_spans_per_trace:
+            from .trace_caps import TraceSpanCounter
+            self._trace_caps = TraceSpanCounter(
+                max_spans_per_trace, trace_cap_traces)
+        self.metrics = metrics.RecorderMetrics(
+            buffer_size=self._buffered_count)
+        self.profiler = None
+        self.red = None
+        if red_metrics or red_handler is not None:
+            from .aggregation import REDAggregator
+            self.red = REDAggregator(service_name)
+        self._red_handler = red_handler
+        self._red_report_seconds = red_report_seconds
+        self._next_red_report = metrics.clock() + red_report_seconds
+        self.trace_store = None
+        if trace_store_bytes:
+            from .trace_store import TraceStore
+            self.trace_store = TraceStore(
+                trace_store_bytes, trace_store_seconds)
 
         self._disabled_runtime = False
-        atexit.register(self.shutdown)
+        if self._shutdown_at_exit:
+            atexit.register(self.shutdown)
 
         self._periodic_flush_seconds = periodic_flush_seconds
         # _flush_thread is created lazily since some
@@ -101,6 +220,34 @@ class Recorder(SpanRecorder):
                 ' flush to zipkin_ot unless explicitly requested.'.format(
                     self._periodic_flush_seconds))
 
+    @property
+    def capacity(self):
+        """The number of normal spans the buffer holds (max_span_records)."""
+        return self._max_span_records
+
+    @property
+    def endpoint(self):
+        """The zipkin Endpoint recorded as the host of every annotation."""
+        endpoint = self._endpoint
+        if endpoint is None:
+            endpoint = self._endpoint = self._create_endpoint(
+                local_address.local_addresses(
+                    callback=self._on_local_addresses))
+        return endpoint
+
+    @endpoint.setter
+    def endpoint(self, endpoint):
+        self._endpoint = endpoint
+
+    def _create_endpoint(self, addresses):
+        ipv4, ipv6 = addresses
+        return create_endpoint(
+            self._port, self._service_name, host=ipv4, ipv6=ipv6)
+
+    def _on_local_addresses(self, addresses):
+        """Called once a background DNS lookup of the local host completes."""
+        self._endpoint = self._create_endpoint(addresses)
+
     def _maybe_init_flush_thread(self):
         """Start a periodic flush mechanism for this recorder if:
 
@@ -121,11 +268,11 @@ class Recorder(SpanRecorder):
 
     def _fine(self, fmt, args):
         if self.verbosity >= 1:
-            print "[Zipkin_OpenTracing Tracer]:", (fmt % args)
+            print("[Zipkin_OpenTracing Tracer]:", (fmt % args))
 
     def _finest(self, fmt, args):
         if self.verbosity >= 2:
-            print "[Zipkin_OpenTracing Tracer]:", (fmt % args)
+            print("[Zipkin_OpenTracing Tracer]:", (fmt % args))
 
     def record_span(self, span):
         """Per BasicSpan.record_span, safely add a span to the buffer.
@@ -134,69 +281,322 @@ class Recorder(SpanRecorder):
         """
         if self._disabled_runtime:
             return
+        truncated = self._admit(span)
+        if truncated is None:
+            return
 
         # Lazy-init the flush loop (if need be).
         self._maybe_init_flush_thread()
 
+        priority = self._is_priority(span)
+        profiler = self.profiler
+        if profiler is not None and profiler.sample():
+            self._record_span_profiled(span, priority, profiler, truncated)
+            return
+
         # Checking the len() here *could* result in a span getting dropped that
         # might have fit if a report started before the append(). This would
         # only happen if the client lib was being saturated anyway (and likely
         # dropping spans). But on the plus side, having the check here avoids
         # doing a span conversion when the span will just be dropped while also
-        # keeping the lock scope minimized.
+        # keeping the lock scope minimized. Priority spans can always make
+        # room by evicting normal ones, so they are not checked.
+        if not priority:
+            with self._mutex:
+                if not self._normal_room_locked():
+                    self.metrics.spans_dropped.inc()
+                    return
+
+        span_record = self._convert_span(span, truncated)
         with self._mutex:
-            if len(self._span_records) >= self._max_span_records:
-                return
+            self._append_locked(span_record, priority)
 
-        annotations = {}
-        binary_annotations = {}
-        annotation_filter = self.annotation_filter
+    def record_spans(self, spans, block=False, timeout=None):
+        """Records many spans, as record_span does each of them.
 
+        Spans are converted and encoded a chunk (of RECORD_SPANS_CHUNK
+        spans) at a time, outside the buffer lock, and a chunk's frames are
+        buffered under a single acquisition of it. When the buffer is full,
+        normal spans are not dropped: with block, record_spans waits for
+        flushes to make room (in all, at most timeout seconds if given);
+        spans which still do not fit are rejected, i.e. not recorded, and
+        counted in spans_rejected_total.
+
+        Blocking relies on another thread to flush; it must not be used from
+        the event loop of an AsyncioRecorder. Without the periodic flush
+        (periodic_flush_seconds <= 0), block needs a timeout, and ValueError
+        is raised otherwise. Error and debug spans are buffered as by
+        record_span.
+
+        Spans which arrive, or are still waiting, once shutdown() has begun
+        are not recorded either; they count in spans_shutdown_dropped_total.
+
+        Returns the number of rejected (or dropped) spans.
+        """
+        deadline = None
+        if block and timeout is not None:
+            deadline = metrics.clock() + timeout
+        self._maybe_init_flush_thread()
+        if block and timeout is None and self._flush_thread is None:
+            raise ValueError('record_spans(block=True) would wait forever '
+                             'without the periodic flush; pass a timeout')
+        rejected = 0
+        shut_down = 0
+        with self._mutex:
+            room = self._normal_room_locked()
+        for chunk in util.chunks(spans, constants.RECORD_SPANS_CHUNK):
+            if self._disabled_runtime:
+                shut_down += len(chunk)
+                continue
+            records = []
+            priorities = []
+            for span in chunk:
+                truncated = self._admit(span)
+                if truncated is None:
+                    continue
+                priority = self._is_priority(span)
+                if not (priority or room or block):
+                    # Not worth converting.
+                    rejected += 1
+                    continue
+                records.append(self._convert_span(span, truncated))
+                priorities.append(priority)
+            # The chunk is buffered as frames, so flushes only join bytes.
+            start = metrics.clock()
+            frames = self._encode_frames(records)
+            self._observe_encode(metrics.clock() - start)
+            with self._mutex:
+                for index, priority in enumerate(priorities):
+                    room = priority or self._wait_for_room_locked(
+                        block, deadline)
+                    if self._disabled_runtime:
+                        # shutdown() began, and took the buffer, meanwhile.
+                        shut_down += len(frames) - index
+                        break
+                    if not room:
+                        rejected += 1
+                        continue
+                    self._append_locked(frames[index], priority)
+                room = self._normal_room_locked()
+        if rejected:
+            self.metrics.spans_rejected.inc(rejected)
+        if shut_down:
+            self.metrics.spans_shutdown_dropped.inc(shut_down)
+        return rejected + shut_down
+
+    def _wait_for_room_locked(self, block, deadline):
+        """Returns whether the normal lane has room, waiting for it until
+        deadline if block; self._mutex must be held.
+        """
+        while not self._normal_room_locked():
+            if not block or self._disabled_runtime:
+                return False
+            if deadline is None:
+                self._room.wait()
+                continue
+            remaining = deadline - metrics.clock()
+            if remaining <= 0:
+                return False
+            self._room.wait(remaining)
+        return True
+
+    def _admit(self, span):
+        """Applies what comes before buffering to span: RED metrics, sampling
+        and max_spans_per_trace.
+
+        Returns None if span is not to be recorded, and otherwise whether it
+        is the span reaching max_spans_per_trace.
+        """
+        # Every span counts towards the RED metrics, sampled or not.
+        red = self.red
+        if red is not None:
+            red.observe(span.operation_name, self._is_error(span),
+                        span.duration)
+        # The trace was not sampled at its root (B3 debug forces sampling).
+        context = span.context
+        if not context.sampled and not getattr(context, 'debug', False):
+            return None
+
+        # Past max_spans_per_trace, the trace's spans are dropped; the span
+        # reaching it carries a marker.
+        caps = self._trace_caps
+        if caps is not None:
+            count = caps.add(context.trace_id)
+            if count >= caps.max_spans:
+                if count > caps.max_spans:
+                    self.metrics.spans_capped.inc()
+                    return None
+                return True
+        return False
+
+    def _convert_span(self, span, truncated=False):
+        """Returns the record buffered for span."""
+        binary_annotations = self._convert_tags(span)
+        if truncated:
+            binary_annotations[constants.TRACE_TRUNCATED_KEY] = str(
+                self._trace_caps.max_spans)
+        annotation_filter = self._convert_logs(span, binary_annotations)
+        thrift_annotations, thrift_binary_annotations = \
+            self._build_annotations(span, annotation_filter, binary_annotations)
+        span_record = self._create_span_record(
+            span, thrift_annotations, thrift_binary_annotations)
+        if self.trace_store is not None:
+            span_record = self._keep_recent(span_record)
+        return span_record
+
+    def _record_span_profiled(self, span, priority, profiler, truncated):
+        """record_span, timing each stage into the profiler."""
+        clock = metrics.clock
+        observe = profiler.observe
+
+        if not priority:
+            start = clock()
+            with self._mutex:
+                observe(profiling.LOCK_WAIT, clock() - start)
+                if not self._normal_room_locked():
+                    self.metrics.spans_dropped.inc()
+                    return
+
+        start = clock()
+        binary_annotations = self._convert_tags(span)
+        if truncated:
+            binary_annotations[constants.TRACE_TRUNCATED_KEY] = str(
+                self._trace_caps.max_spans)
+        end = clock()
+        observe(profiling.TAGS, end - start)
+
+        start = end
+        annotation_filter = self._convert_logs(span, binary_annotations)
+        end = clock()
+        observe(profiling.LOGS, end - start)
+
+        start = end
+        thrift_annotations, thrift_binary_annotations = \
+            self._build_annotations(span, annotation_filter, binary_annotations)
+        end = clock()
+        observe(profiling.ANNOTATIONS, end - start)
+
+        start = end
+        span_record = self._create_span_record(
+            span, thrift_annotations, thrift_binary_annotations)
+        if self.trace_store is not None:
+            span_record = self._keep_recent(span_record)
+        end = clock()
+        observe(profiling.CREATE_SPAN, end - start)
+
+        start = end
+        with self._mutex:
+            observe(profiling.LOCK_WAIT, clock() - start)
+            self._append_locked(span_record, priority)
+
+    def _keep_recent(self, span_record):
+        """Adds span_record to the trace store; returns what to buffer in
+        its place, its frame, so that it is only encoded once.
+        """
+        frame = span_frame(span_record)
+        self.trace_store.add(frame)
+        return frame
+
+    def _is_priority(self, span):
+        """Returns whether span belongs in the priority lane: it is tagged
+        as an error or carries the debug flag.
+        """
+        return getattr(span.context, 'debug', False) or self._is_error(span)
+
+    def _is_error(self, span):
+        """Returns whether span is tagged as an error."""
+        error = span.tags.get(constants.ERROR_TAG)
+        return (error is not None and
+                util.coerce_str(error).lower() not in
+                constants.FALSE_TAG_VALUES)
+
+    def _convert_tags(self, span):
+        """Returns the span's tags as a dict of binary annotations."""
+        binary_annotations = {}
         if span.tags:
             for key in span.tags:
                 # You might want to handle key[:len(constants.JOIN_ID_TAG_PREFIX)] ==
                 # constants.JOIN_ID_TAG_PREFIX) differently.
                 binary_annotations[key] = util.coerce_str(span.tags[key])
+        return binary_annotations
+
+    def _convert_logs(self, span, binary_annotations):
+        """Adds the span's logs to binary_annotations and returns the
+        annotation filter to apply to the span.
+        """
+        annotation_filter = self.annotation_filter
 
+        # ZipkinSpans already enforce the log limits when logging; spans from
+        # other tracers get the same limits applied here.
+        dropped_logs = getattr(span, 'dropped_logs', 0)
+        log_count = 0
+        log_bytes = 0
         for log in span.logs:
-            event = log.key_values.get('event') or ''
-            if len(event) > 0:
-                # Don't allow for arbitrarily long log messages.
-                if sys.getsizeof(event) > constants.MAX_LOG_MEMORY:
-                    event = event[:constants.MAX_LOG_LEN]
-            payload = log.key_values.get('payload')
-            if event == 'include':
+            if log.key_values.get('event') == 'include':
                 annotation_filter = set()
-                for include_name in payload:
+                for include_name in log.key_values.get('payload'):
                     annotation_filter.update(STANDARD_ANNOTATIONS[include_name])
-            else:
-                binary_annotations["%s@%s" % (event, str(log.timestamp))] = payload
+                continue
+            # Don't allow for arbitrarily long or many log messages.
+            event, payload, size = truncate_log(log.key_values)
+            if (log_count >= self.max_logs_per_span or
+                    log_bytes + size > self.max_log_bytes_per_span):
+                dropped_logs += 1
+                continue
+            log_count += 1
+            log_bytes += size
+            binary_annotations["%s@%s" % (event, str(log.timestamp))] = payload
+
+        if dropped_logs:
+            binary_annotations[constants.DROPPED_LOGS_KEY] = str(dropped_logs)
+        return annotation_filter
+
+    def _build_annotations(self, span, annotation_filter, binary_annotations):
+        """Returns the span's thrift annotations and binary annotations."""
+        annotations = self._standard_annotations(span, annotation_filter)
+        endpoint = self.endpoint
+        thrift_annotations = micros_annotation_list_builder(
+            annotations, endpoint
+        )
+        thrift_binary_annotations = binary_annotation_list_builder(
+            binary_annotations, endpoint
+        )
+        return thrift_annotations, thrift_binary_annotations
+
+    def _standard_annotations(self, span, annotation_filter):
+        """Returns a dict of the span's standard annotations which pass
+        annotation_filter, to their timestamps in integer microseconds.
+        """
+        # ZipkinSpans are timed in microseconds already; spans from other
+        # tracers are converted.
+        start = getattr(span, 'start_us', None)
+        if start is None:
+            start = int(span.start_time * constants.SECONDS_TO_MICRO)
+            duration = span.duration
+            if duration != -1:
+                duration = int(duration * constants.SECONDS_TO_MICRO)
+        else:
+            duration = span.duration_us
 
         # To get a full span we just set cs=sr and ss=cr.
         full_annotations = {
-            'cs': span.start_time,
-            'sr': span.start_time
+            'cs': start,
+            'sr': start
         }
-        if span.duration != -1:
-            full_annotations['ss'] = span.start_time + span.duration
+        if duration != -1:
+            full_annotations['ss'] = start + duration
             full_annotations['cr'] = full_annotations['ss']
 
         # But we filter down if we only want to emit some of the annotations
-        filtered_annotations = {}
+        annotations = {}
         for k, v in full_annotations.items():
             if k in annotation_filter:
-                filtered_annotations[k] = v
-
-        annotations.update(filtered_annotations)
-
-        thrift_annotations = annotation_list_builder(
-            annotations, self.endpoint
-        )
-        thrift_binary_annotations = binary_annotation_list_builder(
-            binary_annotations, self.endpoint
-        )
+                annotations[k] = v
+        return annotations
 
-        span_record = create_span(
+    def _create_span_record(self, span, thrift_annotations,
+                            thrift_binary_annotations):
+        return create_span(
             util.id_to_hex(span.context.span_id),
             util.id_to_hex(span.parent_id),
             util.id_to_hex(span.context.trace_id),
@@ -205,9 +605,73 @@ class Recorder(SpanRecorder):
             thrift_binary_annotations,
         )
 
-        with self._mutex:
-            if len(self._span_records) < self._max_span_records:
+    def _normal_room_locked(self):
+        """Returns whether the normal lane has room; self._mutex must be
+        held.
+        """
+        borrowed = max(0, len(self._priority_records) -
+                       self._max_priority_span_records)
+        return len(self._span_records) < self._max_span_records - borrowed
+
+    def _append_locked(self, span_record, priority=False):
+        """Buffers span_record in its lane if there is room; self._mutex
+        must be held.
+
+        A priority span which finds the buffer full evicts the oldest normal
+        span. Returns whether the record was buffered.
+
+        Once shutdown() has begun, spans still being converted by then are
+        dropped instead: it has taken the buffer already.
+        """
+        if self._disabled_runtime:
+            self.metrics.spans_shutdown_dropped.inc()
+            return False
+        if not priority:
+            if self._normal_room_locked():
                 self._span_records.append(span_record)
+                self.metrics.spans_recorded.inc()
+                return True
+            self.metrics.spans_dropped.inc()
+            return False
+
+        capacity = self._max_span_records + self._max_priority_span_records
+        if len(self._priority_records) + len(self._span_records) >= capacity:
+            if not self._span_records:
+                self.metrics.priority_spans_dropped.inc()
+                return False
+            del self._span_records[0]
+            self.metrics.spans_dropped.inc()
+        self._priority_records.append(span_record)
+        self.metrics.spans_recorded.inc()
+        return True
+
+    def _buffered_count(self):
+        return len(self._span_records) + len(self._priority_records)
+
+    def _take_records(self):
+        """Empties the buffer; returns its records, priority lane first, and
+        how many of them are priority records.
+        """
+        with self._mutex:
+            priority_records = self._priority_records
+            span_records = self._span_records
+            self._priority_records = []
+            self._span_records = []
+            self._room.notify_all()
+        return priority_records + span_records, len(priority_records)
+
+    def enable_profiling(self, sample_rate=0.01):
+        """Starts timing the stages of record_span and flushes.
+
+        Returns the new zipkin_ot.profiling.StageProfiler.
+        """
+        self.profiler = profiling.StageProfiler(sample_rate)
+        return self.profiler
+
+    def disable_profiling(self):
+        """Stops timing; returns the profiler which was in use, if any."""
+        profiler, self.profiler = self.profiler, None
+        return profiler
 
     def flush(self, connection=None):
         """Immediately send unreported data to the server.
@@ -227,94 +691,377 @@ class Recorder(SpanRecorder):
         self._maybe_init_flush_thread()
         return self._flush_worker(connection)
 
-    def shutdown(self, flush=True):
+    def shutdown(self, flush=True, timeout=None):
         """Shutdown the Runtime's connection by (optionally) flushing the
         remaining logs and spans and then disabling the Runtime.
 
         Note: spans and logs will no longer be reported after shutdown is
         called.
 
-        Returns whether the data was successfully flushed.
+        Intake stops at once. The buffer is then sent in parallel batches
+        until timeout seconds (shutdown_timeout by default) have passed;
+        what could not be sent is written to spool_dir, if set, and dropped
+        otherwise. shutdown() returns within the timeout, give or take the
+        time to encode and spool the buffer.
+
+        Returns a ShutdownReport, which is true if everything was sent.
         """
         # Closing connection twice results in an error. Exit early
         # if runtime has already been disabled.
         if self._disabled_runtime:
-            return False
-
-        if flush:
-            flushed = self.flush()
+            return ShutdownReport(flushed=False)
 
+        start = metrics.clock()
+        deadline = start + (
+            self._shutdown_timeout if timeout is None else timeout)
         self._disabled_runtime = True
 
-        return flushed
+        span_records, _ = self._take_records()
+        report = ShutdownReport()
+        frames = None
+        if span_records and (flush or self._spool_dir):
+            try:
+                frames = self._encode_frames(span_records)
+            except Exception as e:
+                self._fine("Caught exception encoding spans at shutdown: "
+                           "%s, stack trace: %s", (e, traceback.format_exc()))
+
+        if frames is None:
+            report.dropped = len(span_records)
+        else:
+            unsent = self._drain(frames, deadline) if flush else frames
+            report.sent = len(frames) - len(unsent)
+            if unsent and self._spool_dir:
+                report.spooled = self._spool(unsent)
+            report.dropped = len(unsent) - report.spooled
+        self._close_transport()
+
+        self.metrics.spans_spooled.inc(report.spooled)
+        self.metrics.spans_shutdown_dropped.inc(report.dropped)
+        self._report_red()
+        report.flushed = not report.spooled and not report.dropped
+        report.seconds = metrics.clock() - start
+        self._finest("Shutdown: %r", (report,))
+        return report
+
+    def _close_transport(self):
+        """Closes the transport, for those which have a close()."""
+        close = getattr(self._transport, 'close', None)
+        if close is not None:
+            close()
+
+    def _drain(self, frames, deadline):
+        """POSTs frames in parallel batches until deadline; returns the
+        frames which were not sent.
+
+        Requests time out a little before the deadline, leaving the worker
+        threads time to finish: one still running when the interpreter
+        exits would fail noisily. Batches still in flight at the deadline
+        count as not sent (so they may reach the collector twice if
+        spooled).
+        """
+        batches = list(self._batches(frames))
+        sent = [False] * len(batches)
+        pending = list(range(len(batches)))
+        pending.reverse()
+        lock = threading.Lock()
+        post_deadline = deadline - min(constants.SHUTDOWN_GRACE_SECS,
+                                       (deadline - metrics.clock()) / 4)
+        if self._transport is None:
+            # Not from the workers: imports may block at interpreter exit.
+            import requests
+
+        def work():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    index = pending.pop()
+                remaining = post_deadline - metrics.clock()
+                if remaining <= 0:
+                    return
+                body = frames_in_list_bytes(batches[index])
+                post_start = metrics.clock()
+                args = {
+                    "url": self._collector_url,
+                    "data": body,
+                    "headers": {'Content-Type': 'application/x-thrift'}
+                }
+                try:
+                    if self._transport is not None:
+                        r = self._transport.post(**args)
+                    else:
+                        r = requests.post(timeout=remaining, **args)
+                    r.raise_for_status()
+                except Exception as e:
+                    self._fine("Caught exception during shutdown report: "
+                               "%s", (e,))
+                    self.metrics.flush_failures.inc()
+                    continue
+                self._observe_post(len(batches[index]), len(body),
+                                   metrics.clock() - post_start)
+                sent[index] = True
+
+        workers = [
+            threading.Thread(target=work, name=constants.SHUTDOWN_THREAD_NAME)
+            for _ in range(min(len(batches), constants.SHUTDOWN_MAX_WORKERS))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join(max(0, deadline - metrics.clock()))
+
+        unsent = []
+        for index, batch in enumerate(batches):
+            if not sent[index]:
+                unsent.extend(batch)
+        return unsent
+
+    def _spool(self, frames):
+        """Writes frames to a new file in spool_dir, as a collector request
+        body; returns how many spans were spooled.
+        """
+        # The sequence number tells apart the files of shards spooling at
+        # the same time.
+        name = '%s%d-%d-%d%s' % (
+            constants.SPOOL_FILE_PREFIX, os.getpid(),
+            int(time.time() * 1000000), next(_spool_sequence),
+            constants.SPOOL_FILE_SUFFIX)
+        path = os.path.join(self._spool_dir, name)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(frames_in_list_bytes(frames))
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError) as e:
+            self._fine("Could not spool spans to %s: %s", (path, e))
+            return 0
+        return len(frames)
+
+    def resend_spooled(self, connection=None):
+        """Sends the request bodies spooled in spool_dir by earlier
+        shutdowns, deleting each once the collector accepted it.
+
+        Called by the flush thread when it starts. Returns the number of
+        spans sent.
+        """
+        sent = 0
+        for path, claimed in self._claim_spooled():
+            try:
+                with open(claimed, 'rb') as f:
+                    body = f.read()
+                sent += self._resend_body(body, connection)
+                os.remove(claimed)
+            except Exception as e:
+                self._fine("Could not resend %s: %s", (path, e))
+                self._release_spooled(path, claimed)
+        return sent
+
+    def _claim_spooled(self):
+        """Yields (path, claimed path) for each file in spool_dir, renamed
+        first so that no other recorder resends it too. A claimed file is
+        deleted once sent, or given back with _release_spooled.
+        """
+        if not self._spool_dir:
+            return
+        try:
+            names = sorted(os.listdir(self._spool_dir))
+        except OSError:
+            return
+        for name in names:
+            if not (name.startswith(constants.SPOOL_FILE_PREFIX) and
+                    name.endswith(constants.SPOOL_FILE_SUFFIX)):
+                continue
+            path = os.path.join(self._spool_dir, name)
+            claimed = path + constants.SPOOL_CLAIMED_SUFFIX
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # Claimed by another recorder.
+                continue
+            yield path, claimed
+
+    def _release_spooled(self, path, claimed):
+        """Gives a claimed spool file back, for a later resend."""
+        try:
+            os.rename(claimed, path)
+        except OSError as e:
+            self._fine("Could not release %s: %s", (claimed, e))
+
+    def _resend_body(self, body, connection=None):
+        """POSTs a spooled request body; returns its number of spans."""
+        args = {
+            "url": self._collector_url,
+            "data": body,
+            "headers": {'Content-Type': 'application/x-thrift'}
+        }
+        start = metrics.clock()
+        connection = connection or self._transport
+        if connection:
+            r = connection.post(**args)
+        else:
+            import requests
+            r = requests.post(**args)
+        r.raise_for_status()
+        count = list_length(body)
+        self._observe_post(count, len(body), metrics.clock() - start)
+        return count
 
     def _flush_periodically(self):
         """Periodically send reports to the server.
 
         Runs in a dedicated daemon thread (self._flush_thread).
         """
+        self.resend_spooled()
 
         # Send data until we get disabled
         while not self._disabled_runtime:
             self._flush_worker()
+            if (self._red_handler is not None and
+                    metrics.clock() >= self._next_red_report):
+                self._report_red()
             time.sleep(self._periodic_flush_seconds)
 
+    def _report_red(self):
+        """Hands the RED series which changed since the last report to
+        red_handler.
+        """
+        if self._red_handler is None:
+            return
+        self._next_red_report = metrics.clock() + self._red_report_seconds
+        series = self.red.collect()
+        if not series:
+            return
+        try:
+            self._red_handler(series)
+        except Exception as e:
+            self._fine("Caught exception in red_handler: %s, stack trace: %s",
+                       (e, traceback.format_exc()))
+
     def _flush_worker(self, connection=None):
         """Use the given connection to transmit the current logs and spans as a
         report request."""
 
         # Nothing todo anyway (also makes tests pass by ignoring on last
         # flush())
-        if not self._span_records:
+        if not self._buffered_count():
             return True
 
-        span_records = None
-        with self._mutex:
-            span_records = self._span_records
-            self._span_records = []
+        span_records, priority_count = self._take_records()
+        connection = connection or self._transport
 
+        frames = None
+        sent = 0
         try:
             self._finest("Attempting to send records to collector: %s", (
                 span_records,))
 
-            self._finest("encoded span: %s", (span_records,))
+            # Each span is encoded once, into a frame which is kept if the
+            # flush fails, so retries only join bytes.
+            start = metrics.clock()
+            frames = self._encode_frames(span_records)
+            self._observe_encode(metrics.clock() - start)
 
             # Report to the server.
-            # The collector expects a thrift-encoded list of spans. We
-            # encode a full struct
-            body = thrift_obj_in_bytes(to_thrift_spans(span_records))[3:-1]
-            args = {
-                "url": self._collector_url,
-                "data": body,
-                "headers": {'Content-Type': 'application/x-thrift'}
-            }
-            if connection:
-                r = connection.post(**args)
-            else:
-                r = requests.post(**args)
-
-            r.raise_for_status()
-
-            self._finest("Received response from collector: %s",
-                         (r.status_code,))
+            # The collector expects a thrift-encoded list of spans.
+            for batch in self._batches(frames):
+                body = frames_in_list_bytes(batch)
+                args = {
+                    "url": self._collector_url,
+                    "data": body,
+                    "headers": {'Content-Type': 'application/x-thrift'}
+                }
+                start = metrics.clock()
+                if connection:
+                    r = connection.post(**args)
+                else:
+                    # requests is only imported by the first real flush, to
+                    # keep it out of the import time of zipkin_ot.
+                    import requests
+                    r = requests.post(**args)
+
+                r.raise_for_status()
+                self._observe_post(len(batch), len(body),
+                                   metrics.clock() - start)
+                sent += len(batch)
+
+                self._finest("Received response from collector: %s",
+                             (r.status_code,))
 
             # Return whether we sent any span data
             return len(span_records) > 0
 
         except Exception as e:
             self._fine("Caught exception during report: %s, stack "
-                       "trace: %s", (e, traceback.format_exc(e)))
-            self._restore_spans(span_records)
+                       "trace: %s", (e, traceback.format_exc()))
+            self.metrics.flush_failures.inc()
+            self._restore_frames(span_records, priority_count, frames, sent)
             return False
 
-    def _restore_spans(self, span_records):
-        """Called after a flush error to move records back into the buffer
+    def _encode_frames(self, span_records):
+        """Returns the buffered records as encoded span frames; records put
+        back after a failed flush are frames already.
+        """
+        return [record if isinstance(record, bytes) else span_frame(record)
+                for record in span_records]
+
+    def _batches(self, frames):
+        """Splits frames into request bodies of at most max_batch_bytes."""
+        return frame_batches(frames, self._max_batch_bytes)
+
+    def _observe_encode(self, seconds):
+        """Accounts for the time spent encoding a batch."""
+        self.metrics.encode_seconds.observe(seconds)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.observe(profiling.ENCODE, seconds)
+
+    def _observe_post(self, span_count, nbytes, seconds):
+        """Accounts for a batch successfully POSTed to the collector."""
+        self.metrics.flush_seconds.observe(seconds)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.observe(profiling.POST, seconds)
+        self.metrics.flushes.inc()
+        self.metrics.spans_sent.inc(span_count)
+        self.metrics.bytes_sent.inc(nbytes)
+
+    def _restore_frames(self, span_records, priority_count, frames, sent):
+        """Puts back what a failed flush of span_records did not send: the
+        frames after the first `sent` ones, or, if encoding failed (frames
+        is None), the records themselves.
+        """
+        if frames is None:
+            self._restore_spans(span_records, priority_count)
+        else:
+            self._restore_spans(frames[sent:], max(0, priority_count - sent))
+
+    def _restore_spans(self, span_records, priority_count=0):
+        """Called after a flush error to move records back into the buffer.
+
+        The first priority_count records go back into the priority lane.
+        Restored records are older than the buffered ones, so they are the
+        first to go if the buffer cannot hold everything.
         """
         if self._disabled_runtime:
+            self.metrics.spans_restore_dropped.inc(len(span_records))
             return
 
         with self._mutex:
-            if len(self._span_records) >= self._max_span_records:
-                return
-            combined = span_records + self._span_records
-            self._span_records = combined[-self._max_span_records:]
+            before = self._buffered_count()
+            priority_records = (span_records[:priority_count] +
+                                self._priority_records)
+            capacity = (self._max_span_records +
+                        self._max_priority_span_records)
+            if len(priority_records) > capacity:
+                priority_records = priority_records[-capacity:]
+            borrowed = max(0, len(priority_records) -
+                           self._max_priority_span_records)
+            room = self._max_span_records - borrowed
+            normal_records = span_records[priority_count:] + self._span_records
+            if len(normal_records) > room:
+                normal_records = normal_records[len(normal_records) - room:]
+            self._priority_records = priority_records
+            self._span_records = normal_records
+            lost = before + len(span_records) - self._buffered_count()
+        self.metrics.spans_restored.inc(len(span_records) - lost)
+        self.metrics.spans_restore_dropped.inc(lost)
@@ -0,0 +1,339 @@
+"""
+Streaming decoding of span captures, and replay to a collector.
+
+Spool files (see Recorder's spool_dir) hold a collector request body and
+'thrift' FileTransport files a sequence of length-prefixed ones. iter_spans
+decodes either one span at a time from a buffer, and read_spans from a
+memory map of a file, so captures of any size are read in constant memory:
+
+    for span, frame in read_spans('capture.thrift'):
+        ...
+
+The command line replays captures to a collector, optionally filtered by
+trace id, service or time range, re-batched and at a controlled rate:
+
+    python -m zipkin_ot.replay --collector localhost:9411 --rate 1000 \\
+        --service my-service capture.thrift
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+import time
+
+from . import constants, metrics, util
+from .file_transport import RECORD_LENGTH
+from .thrift import frames_in_list_bytes, load_zipkin_core, span_list_length
+from .trace_store import signed_id
+
+BODY = 'body'
+RECORDS = 'records'
+
+
+class CaptureError(Exception):
+    """A capture is truncated or not in the expected format."""
+
+
+class _BufferReader(object):
+    """The read() of a transport, over a buffer (bytes or mmap)."""
+
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+
+    def read(self, n):
+        end = self.pos + n
+        if end > len(self.buf):
+            raise CaptureError('truncated span at offset %d' % self.pos)
+        data = self.buf[self.pos:end]
+        self.pos = end
+        return data
+
+
+def iter_spans(buf, format=None):
+    """Yields (span, frame) for each span of a capture: the decoded Thrift
+    Span, and its encoding (see zipkin_ot.thrift.span_frame), sliced from
+    the capture.
+
+    :param buf: the capture, as bytes or an mmap.
+    :param str format: BODY for a collector request body, RECORDS for
+        length-prefixed bodies; guessed from the headers by default.
+    """
+    if not len(buf):
+        return
+    if format is None:
+        format = _guess_format(buf)
+    if format == BODY:
+        for item in _iter_body(buf, 0, len(buf)):
+            yield item
+        return
+    offset = 0
+    while offset < len(buf):
+        if offset + RECORD_LENGTH.size > len(buf):
+            raise CaptureError('truncated record at offset %d' % offset)
+        length, = RECORD_LENGTH.unpack_from(buf, offset)
+        offset += RECORD_LENGTH.size
+        if offset + length > len(buf):
+            raise CaptureError('truncated record at offset %d' % offset)
+        for item in _iter_body(buf, offset, offset + length):
+            yield item
+        offset += length
+
+
+def _guess_format(buf):
+    """A body starts with a list header; records with the length of a
+    body which fits in buf, and that body's list header.
+    """
+    if span_list_length(buf) is not None:
+        return BODY
+    if len(buf) >= RECORD_LENGTH.size:
+        length, = RECORD_LENGTH.unpack_from(buf)
+        if (RECORD_LENGTH.size + length <= len(buf) and
+                span_list_length(buf, RECORD_LENGTH.size) is not None):
+            return RECORDS
+    raise CaptureError('not a span capture; pass its format')
+
+
+def read_spans(path, format=None):
+    """iter_spans over a memory map of the file at path."""
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        if not f.tell():
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for item in iter_spans(buf, format):
+            yield item
+    finally:
+        buf.close()
+
+
+def _iter_body(buf, start, end):
+    from thriftpy.protocol.binary import TBinaryProtocol
+    span_type = load_zipkin_core().Span
+
+    if end - start < constants.LIST_HEADER_BYTES:
+        raise CaptureError('truncated body at offset %d' % start)
+    count = span_list_length(buf, start)
+    if count is None:
+        raise CaptureError('not a list of spans at offset %d' % start)
+    reader = _BufferReader(buf, start + constants.LIST_HEADER_BYTES)
+    protocol = TBinaryProtocol(reader)
+    for _ in range(count):
+        frame_start = reader.pos
+        span = span_type()
+        try:
+            span.read(protocol)
+        except struct.error:
+            raise CaptureError('corrupted span at offset %d' % frame_start)
+        if reader.pos > end:
+            raise CaptureError('span overruns its body at offset %d' %
+                               frame_start)
+        yield span, bytes(buf[frame_start:reader.pos])
+
+
+class SpanFilter(object):
+    """Selects spans by trace id, service and time.
+
+    :param trace_ids: trace ids, as ints or hex strings; any by default.
+        128-bit trace ids are matched on their low 64 bits (the span's
+        trace_id).
+    :param services: service names, matched against the hosts of the
+        span's annotations; any by default.
+    :param float start: earliest span start, in seconds since the epoch.
+    :param float end: latest span start, in seconds since the epoch.
+
+    Spans without a timestamp do not match a time range.
+    """
+
+    def __init__(self, trace_ids=None, services=None, start=None, end=None):
+        self.trace_ids = None
+        if trace_ids:
+            self.trace_ids = set(signed_id(t) for t in trace_ids)
+        self.services = set(services) if services else None
+        self.start = (None if start is None
+                      else int(start * constants.SECONDS_TO_MICRO))
+        self.end = (None if end is None
+                    else int(end * constants.SECONDS_TO_MICRO))
+
+    def __call__(self, span):
+        if self.trace_ids is not None and span.trace_id not in self.trace_ids:
+            return False
+        if self.services is not None and not (
+                _services(span) & self.services):
+            return False
+        if self.start is not None or self.end is not None:
+            timestamp = _timestamp(span)
+            if timestamp is None:
+                return False
+            if self.start is not None and timestamp < self.start:
+                return False
+            if self.end is not None and timestamp > self.end:
+                return False
+        return True
+
+
+def _services(span):
+    services = set()
+    for annotation in list(span.annotations or ()) + list(
+            span.binary_annotations or ()):
+        if annotation.host is not None:
+            services.add(annotation.host.service_name)
+    return services
+
+
+def _timestamp(span):
+    if span.timestamp is not None:
+        return span.timestamp
+    timestamps = [a.timestamp for a in span.annotations or ()]
+    return min(timestamps) if timestamps else None
+
+
+def replay(frames, post, max_batch_spans=constants.REPLAY_BATCH_SPANS,
+           max_batch_bytes=constants.DEFAULT_MAX_BATCH_BYTES,
+           spans_per_second=0, sleep=time.sleep):
+    """Sends frames in collector request bodies of at most max_batch_spans
+    spans and max_batch_bytes bytes, at most spans_per_second spans/sec on
+    average (0: unbounded).
+
+    :param post: called with each body.
+
+    Returns (spans, batches) sent.
+    """
+    limit = max_batch_bytes - constants.LIST_HEADER_BYTES
+    clock = metrics.clock
+    next_send = clock()
+    spans = batches = 0
+    batch = []
+    size = 0
+    for frame in frames:
+        if batch and (len(batch) >= max_batch_spans or
+                      size + len(frame) > limit):
+            next_send = _send(post, batch, spans_per_second, next_send,
+                              clock, sleep)
+            spans += len(batch)
+            batches += 1
+            batch = []
+            size = 0
+        batch.append(frame)
+        size += len(frame)
+    if batch:
+        _send(post, batch, spans_per_second, next_send, clock, sleep)
+        spans += len(batch)
+        batches += 1
+    return spans, batches
+
+
+def _send(post, batch, spans_per_second, next_send, clock, sleep):
+    """Posts batch once its turn has come; returns when the next may go."""
+    if spans_per_second:
+        delay = next_send - clock()
+        if delay > 0:
+            sleep(delay)
+    post(frames_in_list_bytes(batch))
+    if spans_per_second:
+        return max(next_send, clock()) + len(batch) / float(spans_per_second)
+    return next_send
+
+
+def _poster(args):
+    if args.output:
+        from .file_transport import FileTransport
+        transport = FileTransport(args.output)
+
+        def write(body):
+            transport.post(data=body)
+        return write, transport.close
+    if args.collector:
+        import requests
+        session = requests.Session()
+        url = util.collector_url_from_hostport(*_host_port(args.collector))
+        headers = {'Content-Type': 'application/x-thrift'}
+
+        def post(body):
+            session.post(url=url, data=body, headers=headers,
+                         timeout=args.timeout).raise_for_status()
+        return post, session.close
+    return lambda body: None, lambda: None
+
+
+def _trace_id(value):
+    """A --trace-id: 64 or 128-bit, in hex."""
+    try:
+        trace_id = int(value, 16)
+    except ValueError:
+        trace_id = -1
+    if not 0 <= trace_id < 1 << 128:
+        raise argparse.ArgumentTypeError('not a hex trace id: %r' % value)
+    return trace_id
+
+
+def _host_port(collector):
+    host, _, port = collector.rpartition(':')
+    return host, int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay span captures (spool files, thrift file '
+                    'transport output) to a Zipkin collector.')
+    parser.add_argument('captures', nargs='+', metavar='capture')
+    parser.add_argument('--collector', metavar='HOST:PORT',
+                        help='collector to send the spans to')
+    parser.add_argument('--output', metavar='DIR',
+                        help='write the spans to thrift files in DIR instead')
+    parser.add_argument('--format', choices=(BODY, RECORDS),
+                        help='capture format; guessed by default')
+    parser.add_argument('--trace-id', action='append', dest='trace_ids',
+                        type=_trace_id,
+                        help='only replay this trace (hex, 64 or 128-bit); '
+                             'repeatable')
+    parser.add_argument('--service', action='append', dest='services',
+                        help='only replay spans of this service; repeatable')
+    parser.add_argument('--since', type=float,
+                        help='only replay spans started at or after this '
+                             'time (seconds since the epoch)')
+    parser.add_argument('--until', type=float,
+                        help='only replay spans started at or before this '
+                             'time (seconds since the epoch)')
+    parser.add_argument('--batch-spans', type=int,
+                        default=constants.REPLAY_BATCH_SPANS)
+    parser.add_argument('--batch-bytes', type=int,
+                        default=constants.DEFAULT_MAX_BATCH_BYTES)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='max spans/sec, 0 for unbounded')
+    parser.add_argument('--timeout', type=float,
+                        default=constants.REPLAY_POST_TIMEOUT_SECS,
+                        help='seconds allowed for each collector request')
+    args = parser.parse_args(argv)
+
+    span_filter = SpanFilter(args.trace_ids, args.services, args.since,
+                             args.until)
+    counts = {'spans_read': 0}
+
+    def frames():
+        for path in args.captures:
+            for span, frame in read_spans(path, args.format):
+                counts['spans_read'] += 1
+                if span_filter(span):
+                    yield frame
+
+    post, close = _poster(args)
+    start = metrics.clock()
+    try:
+        spans, batches = replay(frames(), post, args.batch_spans,
+                                args.batch_bytes, args.rate)
+    finally:
+        close()
+    counts.update(spans_sent=spans, batches_sent=batches,
+                  seconds=metrics.clock() - start)
+    json.dump(counts, sys.stdout, indent=2, sort_keys=True)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
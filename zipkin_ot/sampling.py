@@ -0,0 +1,186 @@
+"""
+Samplers.
+
+AdaptiveSampler adjusts a sampling probability per root operation so that
+the recorder receives about a target number of spans per second, and backs
+off further when the recorder shows backpressure (drops, a filling buffer or
+slow flushes). Like any basictracer Sampler it only decides for root spans;
+children inherit the decision, and propagators carry it downstream as
+x-b3-sampled, so sampled traces stay complete.
+
+    tracer = Tracer(service_name='my-service', spans_per_second=500)
+"""
+from __future__ import absolute_import
+
+import random
+import threading
+
+from basictracer.recorder import Sampler
+
+from . import constants, metrics
+
+
+class AdaptiveSampler(Sampler):
+    """Samples root spans to keep a recorder near a spans/sec budget.
+
+    :param recorder: the Recorder whose metrics drive the sampler.
+    :param float spans_per_second: the target rate of recorded spans.
+    :param float interval: seconds between adjustments.
+    :param float smoothing: weight of the newest interval in the smoothed
+        (exponentially weighted) rates, between 0 and 1.
+    :param float min_probability: lowest probability any operation is
+        sampled with.
+    :param float max_flush_seconds: mean flush latency above which the
+        collector is considered slow.
+    :param int max_operations: operations tracked separately; further ones
+        share a single probability.
+
+    Every interval, the (backpressure-adjusted) budget is turned into a
+    number of traces per second using the smoothed spans per sampled trace,
+    and shared out between operations by their smoothed root rates: quiet
+    operations are sampled fully, and the busy ones share the remainder
+    equally. Working from smoothed rates rather than correcting the last
+    error keeps the probabilities from oscillating.
+    """
+
+    def __init__(self, recorder, spans_per_second,
+                 interval=constants.ADAPTIVE_SAMPLER_INTERVAL_SECS,
+                 smoothing=constants.ADAPTIVE_SAMPLER_SMOOTHING,
+                 min_probability=constants.ADAPTIVE_SAMPLER_MIN_PROBABILITY,
+                 max_flush_seconds=constants.ADAPTIVE_SAMPLER_MAX_FLUSH_SECS,
+                 max_operations=constants.ADAPTIVE_SAMPLER_MAX_OPERATIONS):
+        if spans_per_second <= 0:
+            raise ValueError('spans_per_second must be positive')
+        if not 0 < smoothing <= 1:
+            raise ValueError('smoothing must be in (0, 1]')
+        self.recorder = recorder
+        self.spans_per_second = float(spans_per_second)
+        self.interval = interval
+        self.smoothing = smoothing
+        self.min_probability = min_probability
+        self.max_flush_seconds = max_flush_seconds
+        self.max_operations = max_operations
+
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        # Root spans started per operation since the last adjustment, and
+        # how many were sampled, under _roots_lock.
+        self._roots_lock = threading.Lock()
+        self._roots = {}
+        self._sampled_roots = 0
+        self._root_rates = {}
+        self._probabilities = {}
+        self._spans_per_trace = None
+        self._last = metrics.clock()
+        self._next_update = self._last + interval
+        self._last_counts = self._read_counts()
+
+    def sampled(self, trace_id):
+        return self.sampled_operation(trace_id, None)
+
+    def sampled_operation(self, trace_id, operation_name):
+        """Returns whether to sample a new trace rooted at operation_name."""
+        with self._roots_lock:
+            roots = self._roots
+            if (operation_name not in roots and
+                    len(roots) >= self.max_operations):
+                operation_name = None
+            roots[operation_name] = roots.get(operation_name, 0) + 1
+
+        now = metrics.clock()
+        if now >= self._next_update and self._lock.acquire(False):
+            try:
+                if now >= self._next_update:
+                    self._update(now)
+            finally:
+                self._lock.release()
+
+        probability = self._probabilities.get(operation_name, 1.0)
+        if probability >= 1.0 or self._random.random() < probability:
+            with self._roots_lock:
+                self._sampled_roots += 1
+            return True
+        return False
+
+    def probabilities(self):
+        """Returns the current sampling probability of each operation."""
+        return dict(self._probabilities)
+
+    def _read_counts(self):
+        m = self.recorder.metrics
+        flushes = m.flush_seconds.value()
+        return (m.spans_recorded.value(),
+                m.spans_dropped.value() + m.priority_spans_dropped.value(),
+                flushes['count'], flushes['sum'])
+
+    def _pressure(self, recorded, dropped, flushes, flush_seconds):
+        """Returns the fraction of the budget the recorder can take now."""
+        factor = 1.0
+        if dropped:
+            factor = min(factor, 0.5 * recorded / (recorded + dropped))
+        capacity = getattr(self.recorder, 'capacity', None)
+        if capacity:
+            occupancy = (self.recorder.metrics.buffered_spans.value() /
+                         float(capacity))
+            high = constants.ADAPTIVE_SAMPLER_HIGH_OCCUPANCY
+            if occupancy > high:
+                factor = min(factor, max(0.25, (1 - occupancy) / (1 - high)))
+        if flushes and flush_seconds / flushes > self.max_flush_seconds:
+            factor = min(factor, 0.5)
+        return factor
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def _update(self, now):
+        elapsed = now - self._last
+        self._last = now
+        self._next_update = now + self.interval
+        if elapsed <= 0:
+            return
+
+        counts = self._read_counts()
+        recorded, dropped, flushes, flush_seconds = [
+            new - old for new, old in zip(counts, self._last_counts)]
+        self._last_counts = counts
+        with self._roots_lock:
+            roots, self._roots = self._roots, {}
+            sampled_roots, self._sampled_roots = self._sampled_roots, 0
+        if sampled_roots:
+            self._spans_per_trace = self._smooth(
+                self._spans_per_trace,
+                max(1.0, float(recorded + dropped) / sampled_roots))
+
+        root_rates = {}
+        for operation, rate in self._root_rates.items():
+            # Operations which stopped being used fade out.
+            rate = self._smooth(rate, roots.pop(operation, 0) / elapsed)
+            if rate >= constants.ADAPTIVE_SAMPLER_MIN_ROOT_RATE:
+                root_rates[operation] = rate
+        for operation, count in roots.items():
+            root_rates[operation] = count / elapsed
+        self._root_rates = root_rates
+
+        budget = self.spans_per_second * self._pressure(
+            recorded, dropped, flushes, flush_seconds)
+        quota = self._quota(budget / (self._spans_per_trace or 1.0),
+                            root_rates.values())
+        self._probabilities = dict(
+            (operation, min(1.0, max(self.min_probability, quota / rate)))
+            for operation, rate in root_rates.items())
+
+    @staticmethod
+    def _quota(traces_per_second, rates):
+        """Returns the root rate each operation may be sampled at, for the
+        operations (with the given root rates) to fill traces_per_second.
+        """
+        rates = sorted(rates)
+        remaining = traces_per_second
+        for index, rate in enumerate(rates):
+            share = remaining / (len(rates) - index)
+            if rate > share:
+                return share
+            remaining -= rate
+        return float('inf')
@@ -0,0 +1,108 @@
+"""
+Tracking of the active span.
+
+A ScopeManager remembers which span is active in the current execution
+context, so that Tracer.start_span can parent new spans on it. It is built on
+contextvars where available (Python 3.7+), which follows asyncio tasks, and
+falls back to a thread-local otherwise.
+"""
+from __future__ import absolute_import
+
+import threading
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+class Scope(object):
+    """A span's activation; close() (or leaving the `with` block) restores
+    the previously active scope.
+    """
+
+    __slots__ = ('span', '_manager', '_finish_on_close', '_previous')
+
+    def __init__(self, manager, span, finish_on_close, previous):
+        self.span = span
+        self._manager = manager
+        self._finish_on_close = finish_on_close
+        self._previous = previous
+
+    def close(self):
+        self._manager._deactivate(self)
+        if self._finish_on_close:
+            self.span.finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self._finish_on_close:
+            # Let the span record the error, as `with span:` would.
+            self._manager._deactivate(self)
+            self.span.__exit__(exc_type, exc_val, exc_tb)
+            return
+        self.close()
+
+
+class ThreadLocalScopeManager(object):
+    """Keeps the active scope in a thread-local."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def activate(self, span, finish_on_close=False):
+        """Makes span the active span; returns its Scope."""
+        local = self._local
+        scope = Scope(self, span, finish_on_close,
+                      getattr(local, 'scope', None))
+        local.scope = scope
+        return scope
+
+    @property
+    def active(self):
+        """The active Scope, or None."""
+        return getattr(self._local, 'scope', None)
+
+    def _deactivate(self, scope):
+        local = self._local
+        if getattr(local, 'scope', None) is scope:
+            local.scope = scope._previous
+
+
+class ContextVarsScopeManager(object):
+    """Keeps the active scope in a contextvars.ContextVar, so each asyncio
+    task and thread sees its own active span.
+    """
+
+    def __init__(self):
+        self._var = contextvars.ContextVar(
+            'zipkin_ot_active_scope', default=None)
+
+    def activate(self, span, finish_on_close=False):
+        """Makes span the active span; returns its Scope."""
+        scope = Scope(self, span, finish_on_close, None)
+        scope._previous = self._var.set(scope)
+        return scope
+
+    @property
+    def active(self):
+        """The active Scope, or None."""
+        return self._var.get()
+
+    def _deactivate(self, scope):
+        if self._var.get() is not scope:
+            return
+        try:
+            self._var.reset(scope._previous)
+        except ValueError:
+            # Closed from another context than it was activated in.
+            old = scope._previous.old_value
+            self._var.set(None if old is contextvars.Token.MISSING else old)
+
+
+if contextvars is not None:
+    ScopeManager = ContextVarsScopeManager
+else:
+    ScopeManager = ThreadLocalScopeManager
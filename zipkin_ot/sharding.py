@@ -0,0 +1,378 @@
+"""
+Spreading spans over several collectors.
+
+ShardedRecorder routes every span to one of a list of collectors by
+consistent hashing of its trace_id, so all the spans of a trace reach the
+same collector. Each collector has its own Recorder, with its own buffer and
+flush thread. A collector which fails several flushes in a row is taken out
+of the ring for a while; its spans go to the next collector in the ring.
+
+    tracer = Tracer(service_name='my-service',
+                    collectors=['zipkin-1:9411', 'zipkin-2:9411'])
+"""
+from __future__ import absolute_import
+
+import atexit
+import bisect
+import hashlib
+import os
+import struct
+import threading
+import time
+
+from basictracer.recorder import SpanRecorder
+
+from . import constants, metrics, util
+from .recorder import Recorder, ShutdownReport
+from .thrift import frame_trace_id, frames_in_list_bytes, list_length
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """Scrambles the low 64 bits of an id into a ring position (the
+    splitmix64 finalizer), so that sequential ids spread evenly. Signed and
+    unsigned forms of an id map to the same position.
+    """
+    value &= _MASK64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return value ^ (value >> 31)
+
+
+def parse_collector(collector):
+    """Returns (host, port) for a 'host:port' string or a (host, port)
+    pair.
+    """
+    if isinstance(collector, (tuple, list)):
+        host, port = collector
+        return host, int(port)
+    host, _, port = collector.rpartition(':')
+    if not host:
+        raise ValueError('collector %r is not host:port' % (collector,))
+    return host.strip('[]'), int(port)
+
+
+class HashRing(object):
+    """A consistent hash ring of nodes, each placed at `replicas` points."""
+
+    def __init__(self, nodes, replicas=constants.DEFAULT_SHARD_REPLICAS):
+        if not nodes:
+            raise ValueError('a hash ring needs at least one node')
+        self.nodes = list(nodes)
+        points = []
+        for index, node in enumerate(self.nodes):
+            for replica in range(replicas):
+                digest = hashlib.md5(
+                    ('%s#%d' % (node, replica)).encode('utf-8')).digest()
+                points.append((struct.unpack('>Q', digest[:8])[0], index))
+        points.sort()
+        self._points = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def index_for(self, key):
+        """Returns the index of the node owning the integer key."""
+        position = bisect.bisect(self._points, _mix64(key))
+        if position == len(self._points):
+            position = 0
+        return self._owners[position]
+
+    def successors(self, key):
+        """Yields the indexes of all the nodes, in ring order from the owner
+        of key.
+        """
+        position = bisect.bisect(self._points, _mix64(key))
+        seen = set()
+        count = len(self._points)
+        for offset in range(count):
+            index = self._owners[(position + offset) % count]
+            if index not in seen:
+                seen.add(index)
+                yield index
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class ShardRecorder(Recorder):
+    """The Recorder for a single collector of a ShardedRecorder.
+
+    It keeps track of its consecutive flush failures; after
+    failure_threshold of them it is down for retry_seconds, then gets
+    another chance.
+
+    Spool files hold the spans of every shard: resend_spooled calls
+    `resend`, with which the ShardedRecorder resends them once for all.
+    """
+
+    _shutdown_at_exit = False
+
+    def __init__(self, failure_threshold, retry_seconds, on_down, resend,
+                 **kwargs):
+        super(ShardRecorder, self).__init__(**kwargs)
+        self._failure_threshold = failure_threshold
+        self._retry_seconds = retry_seconds
+        self._on_down = on_down
+        self._resend = resend
+        self.failures = 0
+        self.down_until = 0
+
+    def healthy(self, now=None):
+        down_until = self.down_until
+        return not down_until or (now or time.time()) >= down_until
+
+    def _flush_worker(self, connection=None):
+        if not self._buffered_count():
+            # Nothing was sent, so nothing was learned about the collector.
+            return True
+        flushed = super(ShardRecorder, self)._flush_worker(connection)
+        if flushed:
+            self.failures = 0
+            self.down_until = 0
+        else:
+            self.failures += 1
+            if self.failures >= self._failure_threshold:
+                self.down_until = time.time() + self._retry_seconds
+                self._on_down(self)
+        return flushed
+
+    def resend_spooled(self, connection=None):
+        return self._resend(connection)
+
+    def _close_transport(self):
+        # A transport is shared by the shards; the ShardedRecorder closes it.
+        pass
+
+
+class ShardingMetrics(metrics.RecorderMetrics):
+    """RecorderMetrics summed over the shards of a ShardedRecorder, plus
+    failover counts.
+    """
+
+    def __init__(self, buffer_size=None, shards_down=None):
+        super(ShardingMetrics, self).__init__(buffer_size)
+        self.spans_failed_over = self.counter(
+            'spans_failed_over_total',
+            'Spans moved from a failing collector to the next one.')
+        self.shard_failures = self.counter(
+            'shard_failures_total', 'Times a collector was taken down.')
+        self.shards_down = self.gauge(
+            'shards_down', 'Collectors currently taken down.', shards_down)
+
+
+class ShardedRecorder(SpanRecorder):
+    """Records spans to several collectors, sharded by trace_id.
+
+    :param collectors: list of 'host:port' strings or (host, port) pairs.
+    :param int replicas: points per collector on the hash ring.
+    :param int failure_threshold: consecutive failed flushes after which a
+        collector is taken down and its buffered spans are moved to the next
+        collector in the ring.
+    :param float retry_seconds: how long a collector stays down.
+
+    The other Recorder arguments (but collector_host and collector_port) are
+    passed on to each collector's Recorder; max_span_records is per
+    collector.
+    """
+
+    def __init__(self, collectors,
+                 replicas=constants.DEFAULT_SHARD_REPLICAS,
+                 failure_threshold=constants.SHARD_FAILURE_THRESHOLD,
+                 retry_seconds=constants.SHARD_RETRY_SECS,
+                 **kwargs):
+        addresses = [parse_collector(c) for c in collectors]
+        if not addresses:
+            raise ValueError('at least one collector is required')
+        self.ring = HashRing(
+            ['%s:%d' % address for address in addresses], replicas)
+        self.shards = [
+            ShardRecorder(failure_threshold, retry_seconds, self._fail_over,
+                          self._resend_once, collector_host=host,
+                          collector_port=port, **kwargs)
+            for host, port in addresses]
+        self.metrics = ShardingMetrics(
+            buffer_size=lambda: sum(
+                s._buffered_count() for s in self.shards),
+            shards_down=lambda: sum(
+                1 for s in self.shards if not s.healthy()))
+        for shard in self.shards:
+            shard.metrics = self.metrics
+        first = self.shards[0]
+        # One RED aggregate for the service, handed out by the first shard,
+        # and one trace store.
+        self.red = first.red
+        self.trace_store = first.trace_store
+        for shard in self.shards[1:]:
+            shard.red = self.red
+            shard._red_handler = None
+            shard.trace_store = first.trace_store
+        self.max_logs_per_span = first.max_logs_per_span
+        self.max_log_bytes_per_span = first.max_log_bytes_per_span
+        self.profiler = None
+        self._shut_down = False
+        self._resend_lock = threading.Lock()
+        self._resent = False
+        # The shards are shut down together, in parallel, at exit.
+        atexit.register(self.shutdown)
+
+    @property
+    def capacity(self):
+        """The number of normal spans the shards' buffers hold together."""
+        return sum(shard.capacity for shard in self.shards)
+
+    def shard_for(self, trace_id):
+        """Returns the ShardRecorder which records spans of trace_id: its
+        owner on the ring, or the next healthy one if the owner is down.
+        """
+        shards = self.shards
+        shard = shards[self.ring.index_for(trace_id)]
+        if shard.healthy():
+            return shard
+        now = time.time()
+        for index in self.ring.successors(trace_id):
+            if shards[index].healthy(now):
+                return shards[index]
+        # Everything is down: buffer with the owner until it recovers.
+        return shard
+
+    def record_span(self, span):
+        self.shard_for(span.context.trace_id).record_span(span)
+
+    def record_spans(self, spans, block=False, timeout=None):
+        """Per Recorder.record_spans, handing each chunk of spans to the
+        shards by trace_id.
+        """
+        deadline = None
+        if block and timeout is not None:
+            deadline = metrics.clock() + timeout
+        rejected = 0
+        for chunk in util.chunks(spans, constants.RECORD_SPANS_CHUNK):
+            by_shard = {}
+            for span in chunk:
+                shard = self.shard_for(span.context.trace_id)
+                by_shard.setdefault(shard, []).append(span)
+            for shard, shard_spans in by_shard.items():
+                if deadline is not None:
+                    timeout = max(0, deadline - metrics.clock())
+                rejected += shard.record_spans(shard_spans, block, timeout)
+        return rejected
+
+    def resend_spooled(self, connection=None):
+        """Per Recorder.resend_spooled, sending each spooled span to the
+        shard of its trace_id; the spans a shard fails to send are spooled
+        again. Returns the number of spans sent.
+        """
+        from .replay import BODY, iter_spans
+        first = self.shards[0]
+        sent = 0
+        for path, claimed in first._claim_spooled():
+            try:
+                with open(claimed, 'rb') as f:
+                    body = f.read()
+                by_shard = {}
+                for _, frame in iter_spans(body, BODY):
+                    shard = self.shard_for(frame_trace_id(frame))
+                    by_shard.setdefault(shard, []).append(frame)
+            except Exception as e:
+                first._fine("Could not resend %s: %s", (path, e))
+                first._release_spooled(path, claimed)
+                continue
+            unsent = []
+            for shard, frames in by_shard.items():
+                try:
+                    sent += shard._resend_body(frames_in_list_bytes(frames),
+                                               connection)
+                except Exception as e:
+                    shard._fine("Could not resend %s: %s", (path, e))
+                    unsent.extend(frames)
+            if unsent and len(unsent) == list_length(body):
+                first._release_spooled(path, claimed)
+                continue
+            if unsent:
+                first._spool(unsent)
+            try:
+                os.remove(claimed)
+            except OSError as e:
+                first._fine("Could not remove %s: %s", (claimed, e))
+        return sent
+
+    def _resend_once(self, connection=None):
+        """Resends the spool files from the first shard flush thread to
+        start; the others have nothing left to do.
+        """
+        with self._resend_lock:
+            if self._resent:
+                return 0
+            self._resent = True
+        return self.resend_spooled(connection)
+
+    def _fail_over(self, shard):
+        """Moves the buffered spans of a shard which just went down to the
+        shards their traces now map to.
+        """
+        self.metrics.shard_failures.inc()
+        span_records, priority_count = shard._take_records()
+        targets = {}
+        for index, record in enumerate(span_records):
+            if isinstance(record, bytes):
+                trace_id = frame_trace_id(record)
+            else:
+                trace_id = record.trace_id
+            lanes = targets.setdefault(self.shard_for(trace_id), ([], []))
+            lanes[index >= priority_count].append(record)
+        for target, (priority_records, records) in targets.items():
+            target._restore_spans(
+                priority_records + records, len(priority_records))
+            if target is not shard:
+                self.metrics.spans_failed_over.inc(
+                    len(priority_records) + len(records))
+
+    def enable_profiling(self, sample_rate=0.01):
+        """Starts timing all the shards into one StageProfiler."""
+        profiler = self.shards[0].enable_profiling(sample_rate)
+        for shard in self.shards:
+            shard.profiler = profiler
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        profiler, self.profiler = self.profiler, None
+        for shard in self.shards:
+            shard.profiler = None
+        return profiler
+
+    def flush(self, connection=None):
+        """Flushes every shard; returns whether they all flushed."""
+        results = [shard.flush(connection) for shard in self.shards]
+        return all(results)
+
+    def shutdown(self, flush=True, timeout=None):
+        """Shuts every shard down, in parallel, each within timeout seconds,
+        then closes the transport the shards share.
+
+        Returns the shards' ShutdownReports summed into one.
+        """
+        if self._shut_down:
+            return ShutdownReport(flushed=False)
+        self._shut_down = True
+        reports = [None] * len(self.shards)
+
+        def shut_down(index):
+            reports[index] = self.shards[index].shutdown(flush, timeout)
+
+        threads = [threading.Thread(target=shut_down, args=(index,),
+                                    name=constants.SHUTDOWN_THREAD_NAME)
+                   for index in range(len(self.shards))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Recorder._close_transport(self.shards[0])
+
+        report = ShutdownReport()
+        for shard_report in reports:
+            report.sent += shard_report.sent
+            report.spooled += shard_report.spooled
+            report.dropped += shard_report.dropped
+            report.seconds = max(report.seconds, shard_report.seconds)
+            report.flushed = report.flushed and shard_report.flushed
+        return report
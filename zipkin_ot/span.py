@@ -0,0 +1,107 @@
+"""
+OpenZipkin's BasicSpan, which bounds the logs buffered on each span.
+"""
+from __future__ import absolute_import
+
+from basictracer.span import BasicSpan, LogData
+
+from . import constants, util
+from .clock import MICROS_PER_SECOND, default_clock
+
+
+class ZipkinSpan(BasicSpan):
+    """ZipkinSpan is a BasicSpan which rejects logs past a per-span limit.
+
+    Logs are truncated to their encoded form when they are logged, and once
+    either max_logs or max_log_bytes is reached further logs are counted in
+    `dropped_logs` instead of being buffered. Baggage items which would
+    exceed baggage_limits (a zipkin_ot.baggage.BaggageLimits) are dropped.
+
+    Besides the float start_time and duration of a BasicSpan, it keeps
+    start_us and, once finished, duration_us: integer microseconds read
+    from a zipkin_ot.clock.Clock.
+    """
+
+    def __init__(
+            self,
+            tracer,
+            operation_name=None,
+            context=None,
+            parent_id=None,
+            tags=None,
+            start_time=None,
+            max_logs=constants.DEFAULT_MAX_LOGS_PER_SPAN,
+            max_log_bytes=constants.DEFAULT_MAX_LOG_BYTES_PER_SPAN,
+            baggage_limits=None,
+            start_us=None,
+            clock=default_clock):
+        super(ZipkinSpan, self).__init__(
+            tracer,
+            operation_name=operation_name,
+            context=context,
+            parent_id=parent_id,
+            tags=tags,
+            start_time=start_time)
+        self.max_logs = max_logs
+        self.max_log_bytes = max_log_bytes
+        self.log_bytes = 0
+        self.dropped_logs = 0
+        self.baggage_limits = baggage_limits
+        self._clock = clock
+        if start_us is None:
+            start_us = (clock.now_us() if start_time is None
+                        else int(start_time * MICROS_PER_SECOND))
+        if start_time is None:
+            self.start_time = float(start_us) / MICROS_PER_SECOND
+        self.start_us = start_us
+        self.duration_us = -1
+
+    def log_kv(self, key_values, timestamp=None):
+        # 'include' logs are instructions to the recorder, not data.
+        if key_values.get('event') == 'include':
+            return super(ZipkinSpan, self).log_kv(key_values, timestamp)
+
+        event, payload, size = truncate_log(key_values)
+        with self._lock:
+            if (len(self.logs) >= self.max_logs or
+                    self.log_bytes + size > self.max_log_bytes):
+                self.dropped_logs += 1
+                return self
+            self.log_bytes += size
+            key_values = dict(key_values, event=event, payload=payload)
+            self.logs.append(LogData(key_values, timestamp))
+        return self
+
+    def finish(self, finish_time=None):
+        if finish_time is None:
+            finish_us = self._clock.now_us()
+        else:
+            finish_us = int(finish_time * MICROS_PER_SECOND)
+        with self._lock:
+            self.duration_us = finish_us - self.start_us
+            self.duration = float(self.duration_us) / MICROS_PER_SECOND
+            self._tracer.record(self)
+
+    def set_baggage_item(self, key, value):
+        # Items beyond baggage_limits are dropped.
+        with self._lock:
+            self._context = self._context.with_baggage_item(
+                key, value, self.baggage_limits)
+        return self
+
+
+def truncate_log(key_values):
+    """Returns the (event, payload, encoded size) of a log, with the event and
+    payload coerced to str and cut down to constants.MAX_LOG_LEN UTF-8 bytes,
+    on a character boundary.
+    """
+    event = key_values.get('event') or ''
+    size = 0
+    if event:
+        event, size = util.truncate_utf8(event, constants.MAX_LOG_LEN)
+    payload = key_values.get('payload')
+    if payload is not None:
+        payload, payload_size = util.truncate_utf8(payload,
+                                                   constants.MAX_LOG_LEN)
+        size += payload_size
+    return event, payload, size
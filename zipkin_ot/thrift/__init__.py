@@ -2,19 +2,57 @@
 import os
 import socket
 import struct
+import threading
 
-import thriftpy
-from thriftpy.protocol.binary import TBinaryProtocol
-from thriftpy.transport import TMemoryBuffer
-
+from zipkin_ot import local_address
 from zipkin_ot.util import unsigned_hex_to_signed_int
 
 
 thrift_filepath = os.path.join(os.path.dirname(__file__), 'zipkinCore.thrift')
-zipkin_core = thriftpy.load(thrift_filepath, module_name="zipkinCore_thrift")
+
+_load_lock = threading.Lock()
+
+
+def load_zipkin_core():
+    """Returns the zipkinCore Thrift module, parsing the IDL on first use.
+
+    thriftpy and the IDL are only loaded when the first Thrift object is
+    built, which keeps `import zipkin_ot` cheap. Once loaded, the module
+    replaces the lazy `zipkin_core` and `dummy_endpoint` placeholders below.
+    """
+    global zipkin_core, dummy_endpoint
+    module = zipkin_core
+    if isinstance(module, _LazyZipkinCore):
+        with _load_lock:
+            module = zipkin_core
+            if isinstance(module, _LazyZipkinCore):
+                import thriftpy
+                module = thriftpy.load(
+                    thrift_filepath, module_name="zipkinCore_thrift")
+                dummy_endpoint = module.Endpoint()
+                zipkin_core = module
+    return module
+
+
+class _LazyZipkinCore(object):
+    """Stands in for the zipkinCore module until it is first used."""
+
+    def __getattr__(self, name):
+        return getattr(load_zipkin_core(), name)
+
+
+zipkin_core = _LazyZipkinCore()
+
+
+class _LazyEndpoint(object):
+    """Stands in for `dummy_endpoint` until zipkinCore is first used."""
+
+    def __getattr__(self, name):
+        load_zipkin_core()
+        return getattr(dummy_endpoint, name)
 
 
-dummy_endpoint = zipkin_core.Endpoint()
+dummy_endpoint = _LazyEndpoint()
 
 
 def create_annotation(timestamp, value, host):
@@ -49,21 +87,31 @@ def create_binary_annotation(key, value, annotation_type, host):
     )
 
 
-def create_endpoint(port=0, service_name='unknown', host=None):
+def create_endpoint(port=0, service_name='unknown', host=None, ipv6=None):
     """Create a zipkin Endpoint object.
 
     An Endpoint object holds information about the network context of a span.
 
     :param port: int value of the port. Defaults to 0
     :param service_name: service name as a str. Defaults to 'unknown'
-    :param host: string containing ipv4 value of the host, if not provided,
-    host is determined automatically
+    :param host: string containing the ipv4 or ipv6 address of the host, if
+    not provided, host is determined automatically without blocking (see
+    zipkin_ot.local_address)
+    :param ipv6: string containing the ipv6 address of the host, when host is
+    an ipv4 address
     :returns: zipkin Endpoint object
     """
     if host is None:
-        host = socket.gethostbyname(socket.gethostname())
-    # Convert ip address to network byte order
-    ipv4 = struct.unpack('!i', socket.inet_aton(host))[0]
+        host, local_ipv6 = local_address.local_addresses()
+        if ipv6 is None:
+            ipv6 = local_ipv6
+    if host is not None and ':' in host:
+        host, ipv6 = None, host
+
+    ipv4 = 0
+    if host is not None:
+        # Convert ip address to network byte order
+        ipv4 = struct.unpack('!i', socket.inet_aton(host))[0]
     # Zipkin passes unsigned values in signed types because Thrift has no
     # unsigned types, so we have to convert the value.
     port = struct.unpack('h', struct.pack('H', port))[0]
@@ -71,6 +119,7 @@ def create_endpoint(port=0, service_name='unknown', host=None):
         ipv4=ipv4,
         port=port,
         service_name=service_name,
+        ipv6=socket.inet_pton(socket.AF_INET6, ipv6) if ipv6 else None,
     )
 
 
@@ -86,6 +135,7 @@ def copy_endpoint_with_new_service_name(endpoint, service_name):
         ipv4=endpoint.ipv4,
         port=endpoint.port,
         service_name=service_name,
+        ipv6=endpoint.ipv6,
     )
 
 
@@ -105,6 +155,16 @@ def annotation_list_builder(annotations, host):
     ]
 
 
+def micros_annotation_list_builder(annotations, host):
+    """As annotation_list_builder, for timestamps in integer microseconds,
+    which are used as is.
+    """
+    return [
+        create_annotation(timestamp, key, host)
+        for key, timestamp in annotations.items()
+    ]
+
+
 def binary_annotation_list_builder(binary_annotations, host):
     """
     Reformat binary annotations dict to return list of zipkin_core objects. The
@@ -134,7 +194,14 @@ def create_span(
 ):
     """Takes a bunch of span attributes and returns a thriftpy representation
     of the span.
+
+    A 128-bit trace_id keeps its low 64 bits in trace_id and the rest in
+    trace_id_high.
     """
+    trace_id_high = None
+    if len(trace_id) > 16:
+        trace_id_high = unsigned_hex_to_signed_int(trace_id[:-16])
+        trace_id = trace_id[-16:]
     span_dict = {
         "trace_id": unsigned_hex_to_signed_int(trace_id),
         "name": span_name,
@@ -144,6 +211,8 @@ def create_span(
     }
     if parent_span_id:
         span_dict["parent_id"] = unsigned_hex_to_signed_int(parent_span_id)
+    if trace_id_high:
+        span_dict["trace_id_high"] = trace_id_high
     return zipkin_core.Span(**span_dict)
 
 def to_thrift_spans(spans):
@@ -156,12 +225,132 @@ def thrift_obj_in_bytes(thrift_obj):  # pragma: no cover
     :param thrift_obj: thrift object to encode
     :returns: thrift object in TBinaryProtocol format bytes.
     """
+    from thriftpy.protocol.binary import TBinaryProtocol
+    from thriftpy.transport import TMemoryBuffer
+
     trans = TMemoryBuffer()
     thrift_obj.write(TBinaryProtocol(trans))
     return bytes(trans.getvalue())
 
+def span_list_in_bytes(spans):
+    """Encodes spans as a bare TBinaryProtocol list, the body the collector
+    expects.
+    """
+    return thrift_obj_in_bytes(to_thrift_spans(spans))[3:-1]
+
+
+# A bare TBinaryProtocol list starts with the element type (STRUCT) and the
+# element count.
+_LIST_HEADER = struct.Struct('!bi')
+_STRUCT_TYPE = 12
+# A span frame starts with the header (type, id) of its trace_id field.
+_TRACE_ID = struct.Struct('!3xq')
+
+
+def span_frame(span):
+    """Encodes a single span as an immutable TBinaryProtocol frame.
+
+    Frames are the unit the Recorder buffers spans in once they have been
+    encoded; see frames_in_list_bytes.
+    """
+    return thrift_obj_in_bytes(span)
+
+
+def frames_in_list_bytes(frames):
+    """Assembles encoded span frames into a collector request body, the same
+    bytes span_list_in_bytes would produce for the spans.
+    """
+    return b''.join([_LIST_HEADER.pack(_STRUCT_TYPE, len(frames))] + frames)
+
+
+def list_length(body):
+    """Returns the number of spans in a collector request body."""
+    return _LIST_HEADER.unpack_from(body)[1]
+
+
+def span_list_length(buf, offset=0):
+    """Returns the number of spans of the collector request body starting
+    at offset in buf, or None if no list of spans (structs) starts there.
+    """
+    if len(buf) - offset < _LIST_HEADER.size:
+        return None
+    element_type, count = _LIST_HEADER.unpack_from(buf, offset)
+    if element_type != _STRUCT_TYPE or count < 0:
+        return None
+    return count
+
+
+def frame_trace_id(frame):
+    """Returns the (signed) trace_id of the span encoded in frame: the low
+    64 bits of a 128-bit trace id.
+    """
+    return _TRACE_ID.unpack_from(frame)[0]
+
+
+def span_to_json(span):
+    """Returns a Thrift span as a dict in the collector's v1 JSON format,
+    ready for json.dumps.
+    """
+    trace_id = _json_id(span.trace_id)
+    if getattr(span, 'trace_id_high', None):
+        trace_id = _json_id(span.trace_id_high) + trace_id
+    result = {
+        'traceId': trace_id,
+        'id': _json_id(span.id),
+        'name': _json_str(span.name),
+        'annotations': [
+            {'timestamp': a.timestamp, 'value': _json_str(a.value),
+             'endpoint': _json_endpoint(a.host)}
+            for a in span.annotations or ()],
+        'binaryAnnotations': [
+            {'key': _json_str(b.key), 'value': _json_str(b.value),
+             'endpoint': _json_endpoint(b.host)}
+            for b in span.binary_annotations or ()],
+    }
+    if span.parent_id is not None:
+        result['parentId'] = _json_id(span.parent_id)
+    if span.timestamp is not None:
+        result['timestamp'] = span.timestamp
+    if span.duration is not None:
+        result['duration'] = span.duration
+    if span.debug:
+        result['debug'] = True
+    return result
+
+
+def _json_id(signed_id):
+    return '%016x' % (signed_id & 0xffffffffffffffff)
+
+
+def _json_str(value):
+    if isinstance(value, bytes) and str is not bytes:
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _json_endpoint(endpoint):
+    if endpoint is None:
+        return None
+    result = {'serviceName': _json_str(endpoint.service_name),
+              'ipv4': socket.inet_ntoa(struct.pack('!i', endpoint.ipv4 or 0)),
+              'port': endpoint.port & 0xffff}
+    if endpoint.ipv6:
+        result['ipv6'] = socket.inet_ntop(socket.AF_INET6, endpoint.ipv6)
+    return result
+
+
 def spans_from_bytes(buf):
+    from thriftpy.protocol.binary import TBinaryProtocol
+    from thriftpy.transport import TMemoryBuffer
+
     trans = TMemoryBuffer(buf)
     thrift_object = zipkin_core.Spans()
     thrift_object.read(TBinaryProtocol(trans))
     return thrift_object
+
+
+def spans_from_list_bytes(buf):
+    """Decodes a collector request body, i.e. a bare TBinaryProtocol list of
+    spans as sent by the Recorder, into a list of spans.
+    """
+    return spans_from_bytes(b'\x0f\x00\x01' + buf + b'\x00').spans
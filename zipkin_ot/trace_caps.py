@@ -0,0 +1,45 @@
+"""
+Per-trace span caps, against runaway traces.
+
+A loop which starts a span per item can put 100k spans into one trace and
+push every other trace out of the buffer. With max_spans_per_trace set, the
+Recorder counts the spans recorded per trace and drops those past the cap;
+the span which reaches it is tagged with constants.TRACE_TRUNCATED_KEY.
+"""
+from __future__ import absolute_import
+
+
+class TraceSpanCounter(object):
+    """Approximate counts of spans per trace, in bounded memory.
+
+    :param int max_spans: spans recorded per trace.
+    :param int max_traces: traces counted at most; the counts of the least
+        recently started ones are forgotten first.
+
+    Counts are kept in two generations of max_traces / 2 traces: once the
+    current one is full it replaces the previous one, whose counts are
+    dropped, and traces seen again carry their count over. Updates are not
+    locked; a lost one lets a trace through with a span more.
+    """
+
+    def __init__(self, max_spans, max_traces):
+        self.max_spans = max_spans
+        self._generation_size = max(1, max_traces // 2)
+        self._current = {}
+        self._previous = {}
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def add(self, trace_id):
+        """Counts a span of trace_id; returns the trace's span count."""
+        current = self._current
+        count = current.get(trace_id)
+        if count is None:
+            count = self._previous.get(trace_id, 0)
+            if len(current) >= self._generation_size:
+                self._previous = current
+                current = self._current = {}
+        count += 1
+        current[trace_id] = count
+        return count
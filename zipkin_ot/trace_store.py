@@ -0,0 +1,158 @@
+"""
+An in-memory store of recently finished traces, for local debugging.
+
+With trace_store_bytes set, the Recorder encodes each recorded span once
+into a frame (see zipkin_ot.thrift.span_frame), buffers that frame for the
+collector and also adds it to recorder.trace_store, where the spans of a
+trace can be looked up at once:
+
+    tracer = Tracer(service_name='my-service', trace_store_bytes=16 << 20)
+    ...
+    print(tracer.recorder.trace_store.json(trace_id))
+
+The store has its own lock, so lookups never wait on the span buffer.
+"""
+from __future__ import absolute_import
+
+import collections
+import json
+import threading
+import time
+
+from . import constants
+from .thrift import (frame_trace_id, frames_in_list_bytes, span_to_json,
+                     spans_from_list_bytes)
+
+
+class TraceStore(object):
+    """The spans of the most recently updated traces, by trace_id.
+
+    :param int max_bytes: hard cap on the memory used, counted as the size
+        of the frames plus constants.TRACE_STORE_SPAN_OVERHEAD_BYTES per
+        span. The least recently updated traces are evicted to stay below
+        it.
+    :param float max_age_seconds: traces not updated for this long are
+        evicted.
+
+    Trace ids may be given as ints (as in SpanContext) or hex strings.
+    """
+
+    def __init__(self, max_bytes,
+                 max_age_seconds=constants.TRACE_STORE_MAX_AGE_SECS,
+                 clock=time.time):
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be positive')
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # trace_id -> [frames, bytes, updated], least recently updated
+        # first.
+        self._traces = collections.OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._traces)
+
+    def memory(self):
+        """Returns the bytes currently charged against max_bytes."""
+        return self._bytes
+
+    def add(self, frame):
+        """Adds the span encoded in frame to its trace."""
+        cost = len(frame) + constants.TRACE_STORE_SPAN_OVERHEAD_BYTES
+        if cost > self.max_bytes:
+            return
+        trace_id = frame_trace_id(frame)
+        now = self._clock()
+        with self._lock:
+            traces = self._traces
+            entry = traces.pop(trace_id, None)
+            if entry is None:
+                entry = [[], 0, now]
+            entry[0].append(frame)
+            entry[1] += cost
+            entry[2] = now
+            traces[trace_id] = entry
+            self._bytes += cost
+            self._expire_locked(now)
+            while self._bytes > self.max_bytes:
+                oldest_id, oldest = next(iter(traces.items()))
+                if oldest_id != trace_id:
+                    del traces[oldest_id]
+                    self._bytes -= oldest[1]
+                    continue
+                # Only the trace being added to is left: drop its oldest
+                # spans.
+                dropped = oldest[0].pop(0)
+                dropped_cost = (len(dropped) +
+                                constants.TRACE_STORE_SPAN_OVERHEAD_BYTES)
+                oldest[1] -= dropped_cost
+                self._bytes -= dropped_cost
+
+    def _expire_locked(self, now):
+        traces = self._traces
+        cutoff = now - self.max_age_seconds
+        while traces:
+            trace_id, entry = next(iter(traces.items()))
+            if entry[2] >= cutoff:
+                break
+            del traces[trace_id]
+            self._bytes -= entry[1]
+
+    def trace_ids(self):
+        """Returns the ids (as ints) of the stored traces, most recently
+        updated first.
+        """
+        with self._lock:
+            self._expire_locked(self._clock())
+            return [trace_id & 0xffffffffffffffff
+                    for trace_id in reversed(self._traces)]
+
+    def frames(self, trace_id):
+        """Returns the span frames of a trace, oldest first; an empty list
+        if it is not stored.
+        """
+        key = signed_id(trace_id)
+        with self._lock:
+            entry = self._traces.get(key)
+            if entry is None:
+                return []
+            if entry[2] < self._clock() - self.max_age_seconds:
+                self._expire_locked(self._clock())
+                return []
+            return list(entry[0])
+
+    def thrift(self, trace_id):
+        """Returns the spans of a trace as a collector request body (a bare
+        TBinaryProtocol list), or None if it is not stored.
+        """
+        frames = self.frames(trace_id)
+        return frames_in_list_bytes(frames) if frames else None
+
+    def spans(self, trace_id):
+        """Returns the spans of a trace as Thrift Span objects."""
+        body = self.thrift(trace_id)
+        return spans_from_list_bytes(body) if body is not None else []
+
+    def json(self, trace_id):
+        """Returns the spans of a trace in the collector's v1 JSON format,
+        or None if it is not stored.
+        """
+        spans = self.spans(trace_id)
+        if not spans:
+            return None
+        return json.dumps([span_to_json(span) for span in spans])
+
+
+def signed_id(trace_id):
+    """Returns a trace id (an int, or a hex string) as the signed i64 of
+    Thrift spans; a 128-bit id as its low 64 bits.
+    """
+    if not isinstance(trace_id, int):
+        try:
+            trace_id = int(trace_id, 16)
+        except TypeError:
+            trace_id = int(trace_id)
+    trace_id &= 0xffffffffffffffff
+    return trace_id - (1 << 64) if trace_id >= 1 << 63 else trace_id
@@ -8,11 +8,19 @@ See the API definition for comments.
 """
 from __future__ import absolute_import
 
+import opentracing
 from basictracer import BasicTracer
-from .zipkin_propagator import ZipkinPropagator, NoopPropagator
+from basictracer.util import generate_id
+from .zipkin_propagator import ZipkinPropagator, ZipkinBinaryPropagator
 from opentracing import Format
 
+from . import constants
+from .baggage import BaggageLimits, as_baggage
+from .clock import default_clock
+from .context import SpanContext
 from .recorder import Recorder
+from .scope_manager import ScopeManager
+from .span import ZipkinSpan
 
 
 def Tracer(**kwargs):
@@ -25,6 +33,10 @@ def Tracer(**kwargs):
     :param str collector_host: OpenZipkin collector hostname
     :param int collector_port: OpenZipkin collector port
     :param int max_span_records: Maximum number of spans records to buffer
+    :param int max_priority_span_records: capacity reserved, on top of
+        max_span_records, for spans tagged as errors or with the debug flag.
+        These are flushed first, and evict normal spans when the buffer is
+        full.
     :param int periodic_flush_seconds: seconds between periodic background
         flushes, or 0 to disable background flushes entirely.
     :param int verbosity: verbosity for (debug) logging, all via logging.info()
@@ -36,21 +48,215 @@ def Tracer(**kwargs):
         library) for the lifetime of this process; intended for debugging
         purposes only. (Included to work around SNI non-conformance issues
         present in some versions of python)
+    :param int max_logs_per_span: maximum number of logs kept on a span;
+        further logs are dropped and counted in a summary annotation.
+    :param int max_log_bytes_per_span: maximum encoded size of the logs kept
+        on a span.
+    :param int max_batch_bytes: maximum size of a request to the collector;
+        larger flushes are split into several requests.
+    :param float shutdown_timeout: seconds recorder.shutdown() (also run at
+        exit) may spend sending the buffered spans.
+    :param str spool_dir: directory where spans which could not be sent at
+        shutdown are kept, to be sent by the next recorder using it. Without
+        it, they are dropped.
+    :param bool red_metrics: if True, every finished span, sampled or not,
+        is counted into per-(operation, error) latency histograms, read
+        from recorder.red (see zipkin_ot.aggregation).
+    :param red_handler: callable given, every red_report_seconds and at
+        shutdown, the RED series which changed since its last call (as
+        returned by REDAggregator.collect()); implies red_metrics.
+    :param float red_report_seconds: seconds between red_handler calls,
+        which are made from the periodic flush.
+    :param int trace_store_bytes: if set, the spans of recent traces are
+        also kept in memory, up to this many bytes, for lookups by trace id
+        from recorder.trace_store (see zipkin_ot.trace_store).
+    :param float trace_store_seconds: age after which a trace which got no
+        new spans is dropped from the trace store.
+    :param transport: if given, spans are handed to transport.post(url=,
+        data=, headers=) instead of being POSTed to the collector; e.g. a
+        zipkin_ot.file_transport.FileTransport. Closed at shutdown if it
+        has a close().
+    :param int max_spans_per_trace: if set, spans of a trace past this many
+        are dropped (and counted in spans_capped_total); the span reaching
+        the cap is tagged zipkin_ot.trace_truncated.
+    :param int trace_cap_traces: traces whose spans are counted for
+        max_spans_per_trace at most (see zipkin_ot.trace_caps).
+    :param scope_manager: tracks the active span (see
+        zipkin_ot.scope_manager); defaults to a contextvars based one where
+        available, thread-local otherwise.
+    :param collectors: list of 'host:port' collectors to spread traces over
+        by consistent hashing, instead of collector_host and collector_port
+        (see zipkin_ot.sharding).
+    :param bool encoder_process: if True, spans are encoded and reported
+        from a helper process (see zipkin_ot.process_encoder).
+    :param sampler: a basictracer Sampler deciding which traces are
+        recorded; all of them by default.
+    :param float spans_per_second: if given, traces are sampled by a
+        zipkin_ot.sampling.AdaptiveSampler aiming at this many recorded
+        spans per second.
+    :param int max_baggage_items: maximum number of baggage items a span
+        carries, sets, injects or extracts; further items are dropped.
+    :param int max_baggage_bytes: maximum encoded size of the baggage keys
+        and values of a span, enforced like max_baggage_items.
     """
-    return _OpenZipkinTracer(Recorder(**kwargs))
+    scope_manager = kwargs.pop('scope_manager', None)
+    sampler = kwargs.pop('sampler', None)
+    spans_per_second = kwargs.pop('spans_per_second', None)
+    baggage_limits = _pop_baggage_limits(kwargs)
+    if 'collectors' in kwargs:
+        from .sharding import ShardedRecorder
+        recorder = ShardedRecorder(**kwargs)
+    elif kwargs.pop('encoder_process', False):
+        from .process_encoder import ProcessEncodingRecorder
+        recorder = ProcessEncodingRecorder(**kwargs)
+    else:
+        recorder = Recorder(**kwargs)
+    if spans_per_second is not None:
+        from .sampling import AdaptiveSampler
+        sampler = AdaptiveSampler(recorder, spans_per_second)
+    return _OpenZipkinTracer(recorder, scope_manager, sampler, baggage_limits)
+
+
+def _pop_baggage_limits(kwargs):
+    return BaggageLimits(
+        kwargs.pop('max_baggage_items', constants.DEFAULT_MAX_BAGGAGE_ITEMS),
+        kwargs.pop('max_baggage_bytes', constants.DEFAULT_MAX_BAGGAGE_BYTES))
 
 
 class _OpenZipkinTracer(BasicTracer):
-    def __init__(self, recorder):
+    def __init__(self, recorder, scope_manager=None, sampler=None,
+                 baggage_limits=None):
         """Initialize the OpenZipkin Tracer, deferring to BasicTracer."""
-        super(_OpenZipkinTracer, self).__init__(recorder)
-        self.register_propagator(Format.TEXT_MAP, ZipkinPropagator())
-        self.register_propagator(Format.HTTP_HEADERS, ZipkinPropagator())
-        self.register_propagator(Format.BINARY, NoopPropagator())
+        super(_OpenZipkinTracer, self).__init__(recorder, sampler)
+        # Samplers which decide per operation (see zipkin_ot.sampling).
+        self._sample_operation = getattr(
+            self.sampler, 'sampled_operation', None)
+        self.scope_manager = (
+            ScopeManager() if scope_manager is None else scope_manager)
+        self.baggage_limits = baggage_limits or BaggageLimits(
+            constants.DEFAULT_MAX_BAGGAGE_ITEMS,
+            constants.DEFAULT_MAX_BAGGAGE_BYTES)
+        self.register_propagator(
+            Format.TEXT_MAP, ZipkinPropagator(self.baggage_limits))
+        self.register_propagator(
+            Format.HTTP_HEADERS, ZipkinPropagator(self.baggage_limits))
+        self.register_propagator(
+            Format.BINARY, ZipkinBinaryPropagator(self.baggage_limits))
+        # Spans are timed in integer microseconds (see zipkin_ot.clock).
+        self.clock = default_clock
+        self._max_logs_per_span = getattr(
+            recorder, 'max_logs_per_span',
+            constants.DEFAULT_MAX_LOGS_PER_SPAN)
+        self._max_log_bytes_per_span = getattr(
+            recorder, 'max_log_bytes_per_span',
+            constants.DEFAULT_MAX_LOG_BYTES_PER_SPAN)
+
+    def start_span(
+            self,
+            operation_name=None,
+            child_of=None,
+            references=None,
+            tags=None,
+            start_time=None,
+            ignore_active_span=False):
+        """Per BasicTracer.start_span, but starts a ZipkinSpan.
+
+        Without child_of or references, the span is a child of the active
+        span, unless ignore_active_span is set.
+        """
+        start_us = self.clock.now_us() if start_time is None else None
+
+        parent_ctx = None
+        if child_of is not None:
+            parent_ctx = (
+                child_of if isinstance(child_of, opentracing.SpanContext)
+                else child_of.context)
+        elif references is not None and len(references) > 0:
+            # TODO only the first reference is currently used
+            parent_ctx = references[0].referenced_context
+        elif not ignore_active_span:
+            scope = self.scope_manager.active
+            if scope is not None:
+                parent_ctx = scope.span.context
+
+        ctx = SpanContext(span_id=generate_id())
+        if parent_ctx is not None:
+            # Baggage is immutable: the child shares its parent's.
+            ctx._baggage = as_baggage(parent_ctx.baggage)
+            ctx.trace_id = parent_ctx.trace_id
+            ctx.sampled = parent_ctx.sampled
+            ctx.parent_id = parent_ctx.span_id
+            ctx.debug = getattr(parent_ctx, 'debug', False)
+        else:
+            ctx.trace_id = generate_id()
+            ctx.sampled = self._sampled(ctx.trace_id, operation_name)
+
+        return self._start_span(operation_name, ctx, tags, start_time,
+                                start_us)
+
+    def _sampled(self, trace_id, operation_name):
+        """Returns whether to sample a new trace rooted at operation_name."""
+        if self._sample_operation is not None:
+            return self._sample_operation(trace_id, operation_name)
+        return self.sampler.sampled(trace_id)
+
+    def _start_span(self, operation_name, ctx, tags=None, start_time=None,
+                    start_us=None):
+        """Starts a ZipkinSpan with the given SpanContext."""
+        return ZipkinSpan(
+            self,
+            operation_name=operation_name,
+            context=ctx,
+            parent_id=ctx.parent_id,
+            tags=tags,
+            start_time=start_time,
+            max_logs=self._max_logs_per_span,
+            max_log_bytes=self._max_log_bytes_per_span,
+            baggage_limits=self.baggage_limits,
+            start_us=start_us,
+            clock=self.clock)
+
+    def start_active_span(
+            self,
+            operation_name=None,
+            child_of=None,
+            references=None,
+            tags=None,
+            start_time=None,
+            ignore_active_span=False,
+            finish_on_close=True):
+        """Starts a span as start_span() does and activates it.
+
+        Returns the Scope; closing it (e.g. leaving its `with` block) restores
+        the previously active span and, if finish_on_close, finishes the span.
+        """
+        span = self.start_span(
+            operation_name=operation_name,
+            child_of=child_of,
+            references=references,
+            tags=tags,
+            start_time=start_time,
+            ignore_active_span=ignore_active_span)
+        return self.scope_manager.activate(span, finish_on_close)
+
+    @property
+    def active_span(self):
+        """The active span, or None."""
+        scope = self.scope_manager.active
+        return None if scope is None else scope.span
+
+    @property
+    def metrics(self):
+        """The recorder's self-telemetry (see zipkin_ot.metrics.Metrics)."""
+        return self.recorder.metrics
 
     def flush(self):
-        """Force a flush of buffered Span data to the OpenZipkin collector."""
-        self.recorder.flush()
+        """Force a flush of buffered Span data to the OpenZipkin collector.
+
+        Returns what the recorder's flush() returns: whether data was flushed,
+        or an awaitable for an asyncio recorder.
+        """
+        return self.recorder.flush()
 
     def __enter__(self):
         return self
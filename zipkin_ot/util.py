@@ -2,11 +2,17 @@
 """
 import random
 import time
-import constants
 import codecs
 import os
 import struct
 
+from . import constants
+
+try:
+    unicode
+except NameError:  # Python 3
+    unicode = str
+
 
 guid_rng = random.Random()   # Uses urandom seed
 
@@ -47,3 +53,49 @@ def unsigned_hex_to_signed_int(hex_string):
     :returns: signed int representation
     """
     return struct.unpack('q', struct.pack('Q', int(hex_string, 16)))[0]
+
+
+def chunks(iterable, size):
+    """Yields lists of up to size consecutive items of iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_utf8(value):
+    """Returns value as UTF-8 encoded bytes."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8', 'replace')
+    if isinstance(value, bytes):
+        return value
+    return encode_utf8(coerce_str(value))
+
+
+def decode_utf8(data):
+    """Returns UTF-8 encoded bytes as a native str (bytes on Python 2)."""
+    if str is bytes:
+        return data
+    return data.decode('utf-8', 'replace')
+
+
+def truncate_utf8(value, max_bytes):
+    """Returns value as a native str of at most max_bytes UTF-8 encoded
+    bytes, cut on a character boundary, and its encoded length.
+    """
+    data = encode_utf8(value)
+    if len(data) > max_bytes:
+        end = max_bytes
+        # Back off over the continuation bytes (10xxxxxx) of a character the
+        # cut would split; at most three, whatever the data.
+        tail = bytearray(data[max(0, end - 3):end + 1])
+        index = len(tail) - 1
+        while index > 0 and tail[index] & 0xc0 == 0x80:
+            index -= 1
+            end -= 1
+        data = data[:end]
+    return decode_utf8(data), len(data)
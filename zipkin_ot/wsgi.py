@@ -0,0 +1,221 @@
+"""
+WSGI middleware tracing each request in a server span.
+
+    application = ZipkinMiddleware(application, tracer)
+
+The caller's B3 context is read straight from the request's environ (no
+header dict is built for the propagator), and the span, tagged with the
+request method, path and response status, is active while the application
+runs and the server iterates the response, and finished once the server
+closes the response. A caller which sends no x-b3-sampled header leaves the
+sampling decision to this service; the request still joins its trace.
+
+Unsampled requests only get a bare opentracing.Span, active the same way, so
+that the spans the application starts inherit sampled=False; no ZipkinSpan
+or tags are allocated for them. It carries the caller's context if there is
+one; new traces which were not sampled all share one preallocated span.
+Pass trace_unsampled=True to give them a full (unrecorded) server span
+instead. It is the default when the recorder keeps RED metrics (see
+zipkin_ot.aggregation), which count unsampled spans too.
+"""
+from __future__ import absolute_import
+
+from basictracer.span import LogData
+from basictracer.util import generate_id
+from opentracing import Span
+from opentracing.ext import tags as ext_tags
+
+from . import constants
+from .context import SpanContext
+from .zipkin_propagator import (field_name_sampled, field_name_span_id,
+                                field_name_trace_id, prefix_baggage)
+
+
+def _environ_key(header):
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+_TRACE_ID_KEY = _environ_key(field_name_trace_id)
+_SPAN_ID_KEY = _environ_key(field_name_span_id)
+_SAMPLED_KEY = _environ_key(field_name_sampled)
+_BAGGAGE_PREFIX = _environ_key(prefix_baggage)
+
+_SPAN_KIND = ext_tags.SPAN_KIND
+_SERVER = ext_tags.SPAN_KIND_RPC_SERVER
+_HTTP_METHOD = ext_tags.HTTP_METHOD
+_HTTP_STATUS_CODE = ext_tags.HTTP_STATUS_CODE
+_HTTP_PATH = constants.HTTP_PATH
+_ERROR = constants.ERROR_TAG
+
+# Server spans only carry the sr and ss annotations.
+_INCLUDE_SERVER = {'event': 'include', 'payload': ('server',)}
+
+
+def request_method(environ):
+    """The default operation name: the request method."""
+    return environ.get('REQUEST_METHOD', 'GET')
+
+
+class ZipkinMiddleware(object):
+    """Wraps a WSGI application to trace its requests.
+
+    :param app: the WSGI application.
+    :param tracer: the zipkin_ot tracer starting the spans.
+    :param operation_name: callable returning the operation name of a
+        request from its environ; request_method by default.
+    :param bool trace_unsampled: whether unsampled requests get a server
+        span too; by default, only if the recorder keeps RED metrics.
+
+    Baggage arrives in ot-baggage-* headers, whose environ keys do not
+    tell dashes from underscores; keys are read back with dashes.
+    """
+
+    def __init__(self, app, tracer, operation_name=request_method,
+                 trace_unsampled=None):
+        self.app = app
+        self.tracer = tracer
+        self.operation_name = operation_name
+        if trace_unsampled is None:
+            trace_unsampled = getattr(tracer.recorder, 'red',
+                                      None) is not None
+        self.trace_unsampled = trace_unsampled
+        # Active while unsampled new traces run: their children only need
+        # to inherit sampled=False, not distinct ids.
+        self._unsampled_span = Span(tracer, SpanContext(
+            trace_id=generate_id(), span_id=generate_id(), sampled=False))
+
+    def __call__(self, environ, start_response):
+        tracer = self.tracer
+        start_us = tracer.clock.now_us()
+
+        operation_name = self.operation_name(environ)
+        ctx = self._extract(environ)
+        if ctx is None:
+            trace_id = generate_id()
+            if not (self.trace_unsampled or
+                    tracer._sampled(trace_id, operation_name)):
+                return self._pass_through(self._unsampled_span, environ,
+                                          start_response)
+            ctx = SpanContext(trace_id=trace_id, span_id=generate_id(),
+                              sampled=True)
+        elif ctx.sampled is None:
+            # The caller deferred the sampling decision to us.
+            ctx.sampled = tracer._sampled(ctx.trace_id, operation_name)
+        if not ctx.sampled and not self.trace_unsampled:
+            return self._pass_through(Span(tracer, ctx), environ,
+                                      start_response)
+
+        span = tracer._start_span(
+            operation_name, ctx,
+            tags={
+                _SPAN_KIND: _SERVER,
+                _HTTP_METHOD: environ.get('REQUEST_METHOD'),
+                _HTTP_PATH: (environ.get('SCRIPT_NAME', '') +
+                             environ.get('PATH_INFO', '')),
+            },
+            start_us=start_us)
+        span.logs.append(LogData(_INCLUDE_SERVER, span.start_time))
+
+        def traced_start_response(status, headers, exc_info=None):
+            span.set_tag(_HTTP_STATUS_CODE, int(status[:3]))
+            if status[:1] == '5':
+                span.set_tag(_ERROR, True)
+            return start_response(status, headers, exc_info)
+
+        scope = tracer.scope_manager.activate(span, False)
+        try:
+            response = self.app(environ, traced_start_response)
+        except Exception:
+            span.set_tag(_ERROR, True)
+            scope.close()
+            span.finish()
+            raise
+        return _TracedResponse(response, scope, span)
+
+    def _pass_through(self, span, environ, start_response):
+        """Runs the application under a bare span, so that the spans it
+        starts, while the response is produced too, inherit sampled=False.
+        """
+        scope = self.tracer.scope_manager.activate(span, False)
+        try:
+            response = self.app(environ, start_response)
+        except Exception:
+            scope.close()
+            raise
+        return _ScopedResponse(response, scope)
+
+    def _extract(self, environ):
+        """Returns the context of a server span joining the caller's trace,
+        or None if the request carries no (valid) B3 context. Its sampled is
+        None if the caller left the decision to this service.
+        """
+        trace_id = environ.get(_TRACE_ID_KEY)
+        parent_id = environ.get(_SPAN_ID_KEY)
+        if trace_id is None or parent_id is None:
+            return None
+        sampled = environ.get(_SAMPLED_KEY)
+        if sampled is not None:
+            if sampled not in ('0', '1'):
+                return None
+            sampled = sampled == '1'
+        try:
+            trace_id = int(trace_id, 16)
+            parent_id = int(parent_id, 16)
+        except ValueError:
+            return None
+        return SpanContext(
+            trace_id=trace_id,
+            span_id=generate_id(),
+            parent_id=parent_id,
+            sampled=sampled,
+            baggage=self.tracer.baggage_limits.bound(
+                _baggage_items(environ)))
+
+
+def _baggage_items(environ):
+    prefix_length = len(_BAGGAGE_PREFIX)
+    for key in environ:
+        if key.startswith(_BAGGAGE_PREFIX):
+            yield (key[prefix_length:].lower().replace('_', '-'),
+                   environ[key])
+
+
+class _ScopedResponse(object):
+    """The application's response, keeping its span active until closed."""
+
+    def __init__(self, response, scope):
+        self.response = response
+        self.scope = scope
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        try:
+            close = getattr(self.response, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.scope.close()
+
+
+class _TracedResponse(_ScopedResponse):
+    """The application's response, finishing the span when closed."""
+
+    def __init__(self, response, scope, span):
+        super(_TracedResponse, self).__init__(response, scope)
+        self.span = span
+
+    def __iter__(self):
+        try:
+            for chunk in self.response:
+                yield chunk
+        except Exception:
+            self.span.set_tag(_ERROR, True)
+            raise
+
+    def close(self):
+        try:
+            super(_TracedResponse, self).close()
+        finally:
+            self.span.finish()
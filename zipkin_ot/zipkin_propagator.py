@@ -1,33 +1,78 @@
 from __future__ import absolute_import
 
+import struct
+
+from opentracing import InvalidCarrierException
 from opentracing import SpanContextCorruptedException
 from basictracer.context import SpanContext
 from basictracer.propagator import Propagator
 
+from . import constants, context, util
+from .baggage import BaggageLimits
+
 prefix_tracer_state = 'x-b3-'
+prefix_baggage = 'ot-baggage-'
 field_name_trace_id = prefix_tracer_state + 'traceid'
 field_name_span_id = prefix_tracer_state + 'spanid'
 field_name_sampled = prefix_tracer_state + 'sampled'
 
 field_count = 3
 
+# Binary format, all integers big-endian:
+#
+#   version:u8 flags:u8 trace_id:u64[x2] span_id:u64 parent_id:u64
+#   baggage_count:u16 (key_len:u16 key value_len:u16 value)*
+#
+# trace_id takes 128 bits when FLAG_TRACE_ID_128 is set. A parent_id of 0
+# means the span has no parent.
+binary_version = 1
+binary_flag_sampled = 0x01
+binary_flag_debug = 0x02
+binary_flag_trace_id_128 = 0x04
+
+_binary_header = struct.Struct('>BB')
+_binary_ids_64 = struct.Struct('>QQQ')
+_binary_ids_128 = struct.Struct('>QQQQ')
+_binary_length = struct.Struct('>H')
+_uint64_mask = (1 << 64) - 1
+
+
+def _default_limits():
+    return BaggageLimits(constants.DEFAULT_MAX_BAGGAGE_ITEMS,
+                         constants.DEFAULT_MAX_BAGGAGE_BYTES)
+
 
 class ZipkinPropagator(Propagator):
-    """A BasicTracer Propagator for Format.TEXT_MAP and Format.HTTP_HEADERS."""
+    """A BasicTracer Propagator for Format.TEXT_MAP and Format.HTTP_HEADERS.
+
+    Baggage items travel as ot-baggage-<key> fields; at most what
+    baggage_limits (a zipkin_ot.baggage.BaggageLimits) admits is injected
+    or extracted.
+    """
+
+    def __init__(self, baggage_limits=None):
+        self.baggage_limits = baggage_limits or _default_limits()
 
     def inject(self, span_context, carrier):
         carrier[field_name_trace_id] = '{0:x}'.format(span_context.trace_id)
         carrier[field_name_span_id] = '{0:x}'.format(span_context.span_id)
         carrier[field_name_sampled] = "1" if span_context.sampled else "0"
+        baggage = span_context.baggage
+        if baggage:
+            baggage = self.baggage_limits.apply(baggage)
+            for k in baggage:
+                carrier[prefix_baggage + k] = baggage[k]
 
     def extract(self, carrier):
         count = 0
         span_id, trace_id, sampled = (0, 0, False)
-        baggage = {}
+        baggage = []
         for k in carrier:
             v = carrier[k]
             k = k.lower()
-            if k == field_name_span_id:
+            if k.startswith(prefix_baggage):
+                baggage.append((k[len(prefix_baggage):], v))
+            elif k == field_name_span_id:
                 span_id = int(v, 16)
                 count += 1
             elif k == field_name_trace_id:
@@ -48,10 +93,103 @@ class ZipkinPropagator(Propagator):
         return SpanContext(
             span_id=span_id,
             trace_id=trace_id,
-            baggage=baggage,
+            baggage=self.baggage_limits.bound(baggage),
             sampled=sampled)
 
 
+class ZipkinBinaryPropagator(Propagator):
+    """A BasicTracer Propagator for Format.BINARY.
+
+    Packs the context into a fixed layout appended to a `bytearray` carrier;
+    extract() decodes in place with `struct.unpack_from`. Baggage is bounded
+    by baggage_limits, as with ZipkinPropagator.
+    """
+
+    def __init__(self, baggage_limits=None):
+        self.baggage_limits = baggage_limits or _default_limits()
+
+    def inject(self, span_context, carrier):
+        if type(carrier) is not bytearray:
+            raise InvalidCarrierException()
+
+        flags = 0
+        if span_context.sampled:
+            flags |= binary_flag_sampled
+        if getattr(span_context, 'debug', False):
+            flags |= binary_flag_debug
+        trace_id = span_context.trace_id
+        parent_id = getattr(span_context, 'parent_id', None) or 0
+
+        if trace_id > _uint64_mask:
+            flags |= binary_flag_trace_id_128
+            carrier.extend(_binary_header.pack(binary_version, flags))
+            carrier.extend(_binary_ids_128.pack(
+                trace_id >> 64, trace_id & _uint64_mask,
+                span_context.span_id, parent_id))
+        else:
+            carrier.extend(_binary_header.pack(binary_version, flags))
+            carrier.extend(_binary_ids_64.pack(
+                trace_id, span_context.span_id, parent_id))
+
+        baggage = self.baggage_limits.apply(span_context.baggage or {})
+        carrier.extend(_binary_length.pack(len(baggage)))
+        for k in baggage:
+            key = util.encode_utf8(k)
+            value = util.encode_utf8(baggage[k])
+            carrier.extend(_binary_length.pack(len(key)))
+            carrier.extend(key)
+            carrier.extend(_binary_length.pack(len(value)))
+            carrier.extend(value)
+
+    def extract(self, carrier):
+        if type(carrier) is not bytearray:
+            raise InvalidCarrierException()
+
+        try:
+            version, flags = _binary_header.unpack_from(carrier, 0)
+            if version != binary_version:
+                raise SpanContextCorruptedException()
+            offset = _binary_header.size
+            if flags & binary_flag_trace_id_128:
+                trace_id_high, trace_id, span_id, parent_id = \
+                    _binary_ids_128.unpack_from(carrier, offset)
+                trace_id |= trace_id_high << 64
+                offset += _binary_ids_128.size
+            else:
+                trace_id, span_id, parent_id = \
+                    _binary_ids_64.unpack_from(carrier, offset)
+                offset += _binary_ids_64.size
+
+            baggage = []
+            count, = _binary_length.unpack_from(carrier, offset)
+            offset += _binary_length.size
+            if count:
+                view = memoryview(carrier)
+                for _ in range(count):
+                    key, offset = _unpack_string(carrier, view, offset)
+                    value, offset = _unpack_string(carrier, view, offset)
+                    baggage.append((key, value))
+        except struct.error:
+            raise SpanContextCorruptedException()
+
+        return context.SpanContext(
+            span_id=span_id,
+            trace_id=trace_id,
+            baggage=self.baggage_limits.bound(baggage),
+            sampled=bool(flags & binary_flag_sampled),
+            parent_id=parent_id or None,
+            debug=bool(flags & binary_flag_debug))
+
+
+def _unpack_string(carrier, view, offset):
+    length, = _binary_length.unpack_from(carrier, offset)
+    offset += _binary_length.size
+    end = offset + length
+    if end > len(carrier):
+        raise SpanContextCorruptedException()
+    return util.decode_utf8(view[offset:end].tobytes()), end
+
+
 class NoopPropagator(Propagator):
     """A Propagator for Format.BINARY that does nothing."""
 